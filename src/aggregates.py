@@ -0,0 +1,97 @@
+# aggregates.py
+# Small precomputed aggregates behind every chart. Both the Streamlit
+# dashboard and the static report build their figures from these, so the
+# two always show the same numbers.
+#
+# Every helper takes optional survey weights: a float series sharing the
+# index of the data (see respondent_weights). Weighted counts come from one
+# np.bincount over factorized codes, so they cost the same as unweighted ones.
+import numpy as np
+import pandas as pd
+
+
+def present_values(series):
+    """
+    Returns only the non-missing values of a series, keeping their index.
+    For sparse columns (mostly-empty skip-logic questions) this reads the
+    stored values directly instead of materialising the whole column.
+    """
+    if isinstance(series.dtype, pd.SparseDtype):
+        array = series.array
+        if pd.isna(array.fill_value):
+            values = pd.Series(array.sp_values, index=series.index[array.sp_index.indices],
+                               name=series.name)
+            return values[values.notna()]
+        series = series.sparse.to_dense()
+    return series.dropna()
+
+
+def densify(df):
+    """Converts sparse columns back to regular ones (for display and export)."""
+    sparse_cols = [c for c in df.columns if isinstance(df[c].dtype, pd.SparseDtype)]
+    if not sparse_cols:
+        return df
+    dense = df.copy()
+    for col in sparse_cols:
+        dense[col] = dense[col].sparse.to_dense()
+    return dense
+
+
+def respondent_weights(series):
+    """
+    Per-row weights from a weight column, as a float series with the same index.
+    Missing, negative or non-finite weights count as 0.
+    """
+    if isinstance(series.dtype, pd.SparseDtype):
+        series = series.sparse.to_dense()
+    values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    values = np.where(np.isfinite(values) & (values > 0), values, 0.0)
+    return pd.Series(values, index=series.index, name=series.name)
+
+
+def weights_for(weights, index):
+    """Weights of the rows in `index` as an array (0 for rows without a weight)."""
+    return weights.reindex(index).to_numpy(dtype=np.float64, na_value=0.0)
+
+
+def value_counts_frame(series, weights=None):
+    """Returns a 'Category'/'Count' dataframe sorted from most to least common."""
+    if weights is None:
+        counts = series.value_counts().reset_index()
+        counts.columns = ['Category', 'Count']
+        return counts.sort_values(by="Count", ascending=False)
+
+    present = present_values(series)
+    codes, uniques = pd.factorize(present)
+    totals = np.bincount(codes, weights=weights_for(weights, present.index), minlength=len(uniques))
+    counts = pd.DataFrame({"Category": uniques, "Count": totals})
+    return counts.sort_values(by="Count", ascending=False)
+
+
+def text_for_wordcloud(series):
+    """Joins the non-null text responses of a column into one string."""
+    return ' '.join(present_values(series).astype(str))
+
+
+def time_counts_frame(dt_series, freq="D", weights=None):
+    """Returns a 'Date'/'Count' dataframe of responses per time bucket."""
+    if weights is not None:
+        buckets = dt_series.dropna().dt.floor(freq)
+        codes, labels = pd.factorize(buckets, sort=True)
+        totals = np.bincount(codes, weights=weights_for(weights, buckets.index), minlength=len(labels))
+        return pd.DataFrame({"Date": labels, "Count": totals})
+
+    time_counts = (
+        dt_series.dropna()
+        .dt.floor(freq)
+        .value_counts()
+        .sort_index()
+        .reset_index()
+    )
+    time_counts.columns = ["Date", "Count"]
+    return time_counts
+
+
+def columns_of_type(category_df, *types):
+    """Names of the columns whose inferred type is one of `types`, in table order."""
+    return category_df.loc[category_df["Inferred Type"].isin(types), "Column Name"].tolist()
@@ -0,0 +1,395 @@
+# api_server.py
+# Local HTTP API for the cleaner, so other systems (ETL jobs, scripts) can
+# use type inference and cleaning without the Streamlit UI.
+#
+#   POST   /jobs?filename=survey.csv   upload a file (raw request body) -> 202 + job id
+#   GET    /jobs                       all known jobs
+#   GET    /jobs/<id>                  job status
+#   GET    /jobs/<id>/categories       inferred question types
+#   GET    /jobs/<id>/aggregates       per-column counts / numeric summaries
+#   GET    /jobs/<id>/cleaned          cleaned data (?format=csv|json, ?redact=mask|hash|none)
+#   DELETE /jobs/<id>                  cancel a queued job / drop a result
+#   GET    /health                     pool and queue status
+#
+# Jobs run in a bounded process pool. When every worker is busy and the
+# queue is full, uploads are refused with 503 + Retry-After, so callers
+# control throughput instead of piling work onto the server.
+#
+# Run with: uv run python src/api_server.py --port 8502 --workers 2
+import argparse
+import io
+import json
+import math
+import multiprocessing
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import data_clean as data_cleaner
+from jobs import Job
+from multiselect import column_delimiter, option_frequencies
+from redact import REDACTION_MODES, Redactor, header_kind
+
+# Cleaning processes running at the same time
+API_WORKERS = 2
+# Uploads allowed to wait for a worker; beyond this the API answers 503
+API_MAX_QUEUED = 8
+# Largest accepted upload
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+# Finished jobs are forgotten after this long
+RESULT_TTL_SECONDS = 3600
+# Suggested wait before retrying a refused upload
+RETRY_AFTER_SECONDS = 5
+# Categories listed per column in /aggregates
+MAX_COUNTS_PER_COLUMN = 50
+
+
+# --- Work done in the worker processes ---
+
+def column_aggregates(cleaned_df, category_df, numeric_summaries=None, delimiters=None):
+    """JSON-ready per-column aggregates, chosen by inferred question type."""
+    numeric_summaries = numeric_summaries or {}
+    delimiters = delimiters or {}
+    result = {}
+    for col, q_type in zip(category_df["Column Name"], category_df["Inferred Type"]):
+        if col not in cleaned_df.columns:
+            continue
+        series = cleaned_df[col]
+        present = aggregates.present_values(series)
+        entry = {"type": q_type, "responses": len(present), "missing": len(series) - len(present)}
+
+        if header_kind(col) is not None and q_type in ("Binary", "Categorical", "Likert Scale", "Multi-Select"):
+            # Per-value counts of a personal-data column would list the values themselves
+            entry["personal_data"] = header_kind(col)
+        elif q_type in ("Binary", "Categorical", "Likert Scale"):
+            counts = aggregates.value_counts_frame(series).head(MAX_COUNTS_PER_COLUMN)
+            entry["counts"] = dict(zip(counts["Category"].astype(str), counts["Count"]))
+        elif q_type == "Multi-Select":
+            delimiter = delimiters.get(col) or column_delimiter(series)
+            entry["options"] = option_frequencies(series, delimiter).to_dict(orient="records")
+        elif q_type == "Numeric" and col in numeric_summaries:
+            summary = numeric_summaries[col].overall
+            entry.update(mean=summary.mean, min=summary.min, max=summary.max,
+                         median=summary.median, p90=summary.p90, iqr=summary.iqr,
+                         histogram=summary.histogram_frame()[["Bin Start", "Bin End", "Count"]]
+                         .to_dict(orient="records"))
+        elif q_type == "Datetime":
+            per_day = aggregates.time_counts_frame(pd.to_datetime(series, errors="coerce"))
+            entry["per_day"] = dict(zip(per_day["Date"].dt.strftime("%Y-%m-%d"), per_day["Count"]))
+        elif q_type == "ID/Unique":
+            entry["distinct"] = data_cleaner.count_distinct(present)
+        result[str(col)] = entry
+    return result
+
+
+def clean_file(file_bytes, filename):
+    """Worker entry point: reads, cleans and aggregates one uploaded file."""
+    artifacts = {}
+    df = data_cleaner.read_survey_file(io.BytesIO(file_bytes), filename, artifacts=artifacts)
+    cleaned_df, category_df = data_cleaner.process_and_analyze_data(df, artifacts=artifacts)
+    return {
+        "cleaned_df": cleaned_df,
+        "category_df": category_df,
+        "aggregates": column_aggregates(cleaned_df, category_df, artifacts.get("numeric_summaries"),
+                                        artifacts.get("delimiters")),
+        "weight_column": artifacts.get("weight_column"),
+        "redactors": artifacts.get("redactors", {}),
+    }
+
+
+# --- Job bookkeeping in the server process ---
+
+class ApiJob:
+    """One upload; its state is read from the pool future."""
+
+    def __init__(self, job_id, filename, size, future):
+        self.id = job_id
+        self.filename = filename
+        self.size = size
+        self.future = future
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    @property
+    def state(self):
+        if self.future.cancelled():
+            return Job.CANCELLED
+        if self.future.done():
+            return Job.FAILED if self.future.exception() is not None else Job.DONE
+        return Job.RUNNING if self.future.running() else Job.QUEUED
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    def status(self):
+        state = self.state
+        status = {"id": self.id, "filename": self.filename, "bytes": self.size, "state": state,
+                  "submitted_at": self.submitted_at, "finished_at": self.finished_at}
+        if state == Job.FAILED:
+            status["error"] = str(self.future.exception())
+        return status
+
+
+class Backpressure(Exception):
+    """Raised when the pool is busy and the queue is full."""
+
+
+class JobStore:
+    """Bounded process pool plus the jobs submitted to it."""
+
+    def __init__(self, workers=API_WORKERS, max_queued=API_MAX_QUEUED, ttl=RESULT_TTL_SECONDS):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        # "spawn": forking a process that already runs server threads is unsafe
+        self._pool = ProcessPoolExecutor(max_workers=workers,
+                                         mp_context=multiprocessing.get_context("spawn"))
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, file_bytes, filename):
+        with self._lock:
+            self._forget_expired()
+            active = sum(1 for job in self._jobs.values() if not job.done)
+            if active >= self.workers + self.max_queued:
+                raise Backpressure()
+            future = self._pool.submit(clean_file, file_bytes, filename)
+            job = ApiJob(uuid.uuid4().hex, filename, len(file_bytes), future)
+            self._jobs[job.id] = job
+        future.add_done_callback(lambda _: setattr(job, "finished_at", time.time()))
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def remove(self, job_id):
+        """Cancels a queued job and forgets it. Running jobs finish but are dropped."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job.future.cancel()
+        return job
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def queue_position(self, job):
+        with self._lock:
+            return sum(1 for other in self._jobs.values()
+                       if other.state == Job.QUEUED and other.submitted_at < job.submitted_at)
+
+    def stats(self):
+        states = [job.state for job in self.jobs()]
+        return {"workers": self.workers, "max_queued": self.max_queued,
+                "running": states.count(Job.RUNNING), "queued": states.count(Job.QUEUED),
+                "finished": sum(1 for s in states if s in (Job.DONE, Job.FAILED, Job.CANCELLED))}
+
+    def _forget_expired(self):
+        now = time.time()
+        for job_id in [j.id for j in self._jobs.values()
+                       if j.finished_at and now - j.finished_at > self.ttl]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- HTTP layer ---
+
+def _plain(value):
+    """Converts numpy/pandas values to JSON types (NaN -> null)."""
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return None if pd.isna(value) else value.isoformat()
+    if value is pd.NaT or value is pd.NA:
+        return None
+    return value
+
+
+_JOB_PATH = re.compile(r"^/jobs/([0-9a-f]{32})(?:/(categories|aggregates|cleaned))?/?$")
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "SurveyCleanerAPI/1.0"
+
+    @property
+    def store(self):
+        return self.server.store
+
+    # --- Responses ---
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status, payload, headers=None):
+        body = json.dumps(_plain(payload)).encode("utf-8")
+        self._send(status, body, "application/json", headers)
+
+    def _error(self, status, message, headers=None):
+        self._json(status, {"error": message}, headers)
+
+    def _job_or_404(self, job_id):
+        job = self.store.get(job_id)
+        if job is None:
+            self._error(404, f"Unknown job {job_id}")
+        return job
+
+    def _result_or_error(self, job):
+        """The job's result, or None after answering 409/422 if it has none."""
+        state = job.state
+        if state == Job.DONE:
+            return job.future.result()
+        if state == Job.FAILED:
+            self._error(422, f"Cleaning failed: {job.future.exception()}")
+        else:
+            self._json(409, {"error": f"Job is {state}", "state": state},
+                       {"Retry-After": str(RETRY_AFTER_SECONDS)})
+        return None
+
+    # --- Routes ---
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") == "/health":
+            return self._json(200, self.store.stats())
+        if url.path.rstrip("/") == "/jobs":
+            return self._json(200, {"jobs": [job.status() for job in self.store.jobs()]})
+
+        match = _JOB_PATH.match(url.path)
+        if not match:
+            return self._error(404, "Not found")
+        job = self._job_or_404(match.group(1))
+        if job is None:
+            return
+        resource = match.group(2)
+        if resource is None:
+            status = job.status()
+            if status["state"] == Job.QUEUED:
+                status["queue_position"] = self.store.queue_position(job)
+            return self._json(200, status)
+
+        result = self._result_or_error(job)
+        if result is None:
+            return
+        if resource == "categories":
+            return self._json(200, {"columns": result["category_df"].to_dict(orient="records"),
+                                    "weight_column": result["weight_column"]})
+        if resource == "aggregates":
+            return self._json(200, {"columns": result["aggregates"]})
+
+        query = parse_qs(url.query)
+        output_format = query.get("format", ["csv"])[0]
+        # Personal data is masked unless the caller asks otherwise
+        redaction = query.get("redact", ["mask"])[0]
+        if redaction not in REDACTION_MODES + ("none",):
+            return self._error(400, f"redact must be one of {', '.join(REDACTION_MODES + ('none',))}")
+        cleaned = aggregates.densify(result["cleaned_df"])
+        if redaction != "none":
+            redactor = result["redactors"].get(redaction)
+            if redactor is None:
+                redactor = result["redactors"][redaction] = Redactor(redaction).scan(cleaned)
+            cleaned = redactor.redact_frame(cleaned)
+        if output_format == "json":
+            body = cleaned.to_json(orient="records", date_format="iso").encode("utf-8")
+            return self._send(200, body, "application/json")
+        if output_format != "csv":
+            return self._error(400, "format must be 'csv' or 'json'")
+        return self._send(200, cleaned.to_csv(index=False).encode("utf-8"), "text/csv; charset=utf-8",
+                          {"Content-Disposition": 'attachment; filename="cleaned_survey_data.csv"'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            return self._error(404, "Not found")
+        filename = parse_qs(url.query).get("filename", [self.headers.get("X-Filename", "upload.csv")])[0]
+        if not filename.lower().endswith((".csv", ".xlsx")):
+            return self._error(400, "filename must end in .csv or .xlsx")
+
+        length = self.headers.get("Content-Length")
+        if length is None:
+            return self._error(411, "Content-Length is required")
+        try:
+            length = int(length)
+        except ValueError:
+            return self._error(400, "Content-Length must be an integer")
+        if length < 0:
+            return self._error(400, "Content-Length must not be negative")
+        if length > MAX_UPLOAD_BYTES:
+            return self._error(413, f"Uploads are limited to {MAX_UPLOAD_BYTES:,} bytes")
+        if length == 0:
+            return self._error(400, "Empty upload")
+        file_bytes = self.rfile.read(length)
+
+        try:
+            job = self.store.submit(file_bytes, filename)
+        except Backpressure:
+            return self._error(503, "All workers are busy and the queue is full; retry later",
+                               {"Retry-After": str(RETRY_AFTER_SECONDS)})
+        return self._json(202, job.status(), {"Location": f"/jobs/{job.id}"})
+
+    def do_DELETE(self):
+        match = _JOB_PATH.match(urlparse(self.path).path)
+        if not match or match.group(2):
+            return self._error(404, "Not found")
+        job = self.store.remove(match.group(1))
+        if job is None:
+            return self._error(404, f"Unknown job {match.group(1)}")
+        return self._json(200, {"id": job.id, "state": job.state})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=8502, workers=API_WORKERS, max_queued=API_MAX_QUEUED, verbose=True):
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.store = JobStore(workers, max_queued)
+    server.verbose = verbose
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP API for survey cleaning")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="cleaning processes")
+    parser.add_argument("--max-queued", type=int, default=API_MAX_QUEUED,
+                        help="uploads allowed to wait for a worker before answering 503")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.workers, args.max_queued)
+    print(f"Survey cleaner API on http://{args.host}:{args.port} "
+          f"({args.workers} workers, {args.max_queued} queued)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.store.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+# archive.py
+# Persistent archive of cleaned uploads as a partitioned Parquet dataset.
+#
+# Every archived upload (a "wave") is appended under
+#   <archive>/survey=<survey>/month=<YYYY-MM>/<wave id>.parquet
+# with one file per month it covers. The month comes from the wave's first
+# Datetime column (the upload time for waves without one), kept in every row
+# as `_date`; `_wave` holds the wave id. The category table, wave name and
+# weight column travel in each file's Parquet metadata, so an archived wave
+# opens without being cleaned again.
+#
+# Reads push their filters down: partitions outside the requested surveys and
+# months are skipped by directory name, row groups by the `_date` statistics,
+# and only the requested columns are decoded. Opening "the last 90 days of
+# every wave" therefore touches a few recent files, not years of history.
+import io
+import json
+import os
+import re
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from lazy_imports import lazy_import
+
+# Overrides the archive directory
+ARCHIVE_DIR_ENV = "SURVEY_ARCHIVE_DIR"
+ARCHIVE_FORMAT_VERSION = 1
+# Default window of the dashboard's archive view
+RECENT_DAYS = 90
+# Partition of rows without a date (never matched by a date range)
+UNDATED_MONTH = "undated"
+# Row columns added to every archived wave
+WAVE_COLUMN = "_wave"
+DATE_COLUMN = "_date"
+
+_META_KEY = b"survey_cleaner_archive"
+
+
+def _pyarrow():
+    lazy_import("pyarrow.parquet", requested_by="survey archive")
+    lazy_import("pyarrow.dataset", requested_by="survey archive")
+    return lazy_import("pyarrow", requested_by="survey archive")
+
+
+def default_archive_dir():
+    base = os.environ.get(ARCHIVE_DIR_ENV)
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".survey_cleaner", "archive")
+    os.makedirs(base, exist_ok=True)
+    return base
+
+
+def survey_slug(name):
+    """Directory-safe survey key ("Customer Pulse 2024" -> "customer-pulse-2024")."""
+    return re.sub(r"[^a-z0-9]+", "-", str(name).lower()).strip("-") or "survey"
+
+
+def _month_range(start, end):
+    """'YYYY-MM' bounds of a date range (None for an open end)."""
+    return (None if start is None else pd.Timestamp(start).strftime("%Y-%m"),
+            None if end is None else pd.Timestamp(end).strftime("%Y-%m"))
+
+
+def _archive_array(series, q_type):
+    """One cleaned column as an Arrow array with a type that unifies across waves."""
+    pa = _pyarrow()
+    if isinstance(series.dtype, pd.SparseDtype):
+        series = series.sparse.to_dense()
+    if q_type == "Datetime" or pd.api.types.is_datetime64_any_dtype(series):
+        dates = pd.to_datetime(series, errors="coerce")
+        if getattr(dates.dt, "tz", None) is not None:
+            dates = dates.dt.tz_convert(None)
+        return pa.array(dates.astype("datetime64[ns]"), from_pandas=True)
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return pa.array(series.astype(np.float64), from_pandas=True)
+    try:
+        return pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type object columns (numbers and text) are stored as text
+        return pa.array(series.astype(str).where(series.notna(), None), from_pandas=True)
+
+
+def _unify_schemas(schemas):
+    """
+    One schema over every file read. A column stored with different types in
+    different waves is read as float64 (all numeric) or text (anything else).
+    """
+    pa = _pyarrow()
+    fields = {}
+    for schema in schemas:
+        for field in schema:
+            known = fields.get(field.name)
+            if known is None or pa.types.is_null(known):
+                fields[field.name] = field.type
+            elif known != field.type and not pa.types.is_null(field.type):
+                numeric = all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in (known, field.type))
+                fields[field.name] = pa.float64() if numeric else pa.string()
+    return pa.schema([pa.field(name, t) for name, t in fields.items()])
+
+
+class SurveyArchive:
+    """Appends cleaned waves to the Parquet archive and reads them back."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or default_archive_dir()
+        self._footers = {}      # path -> (mtime, schema, metadata)
+
+    def _survey_dir(self, survey):
+        return os.path.join(self.directory, f"survey={survey_slug(survey)}")
+
+    # --- Writing ---
+
+    def append(self, cleaned_df, category_df, survey, wave_name=None, wave_id=None, weight_column=None):
+        """
+        Archives one cleaned upload as a new wave of `survey` and returns its
+        wave id. A wave id already in the archive (the same upload archived
+        twice, when `wave_id` is a content hash) is not written again.
+        """
+        pa = _pyarrow()
+        pq = lazy_import("pyarrow.parquet")
+        wave_id = wave_id or f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        survey_dir = self._survey_dir(survey)
+        if any(f["wave_id"] == wave_id for f in self._wave_files(survey_dir)):
+            return wave_id
+
+        types = dict(zip(category_df["Column Name"], category_df["Inferred Type"]))
+        date_cols = [c for c, t in types.items() if t == "Datetime" and c in cleaned_df.columns]
+        archived_at = pd.Timestamp.now().floor("s")
+        if date_cols:
+            dates = cleaned_df[date_cols[0]]
+            if isinstance(dates.dtype, pd.SparseDtype):
+                dates = dates.sparse.to_dense()
+            dates = pd.to_datetime(dates, errors="coerce")
+            if getattr(dates.dt, "tz", None) is not None:
+                dates = dates.dt.tz_convert(None)
+        else:
+            dates = pd.Series(archived_at, index=cleaned_df.index)
+        dates = dates.astype("datetime64[ns]").reset_index(drop=True)
+
+        meta = {
+            "version": ARCHIVE_FORMAT_VERSION,
+            "survey": str(survey),
+            "wave_id": wave_id,
+            "wave_name": str(wave_name or wave_id),
+            "archived_at": archived_at.isoformat(),
+            "date_column": str(date_cols[0]) if date_cols else None,
+            "weight_column": weight_column,
+            "n_rows": len(cleaned_df),
+            "category_df": category_df.to_json(orient="split"),
+        }
+        arrays = [_archive_array(cleaned_df[col].reset_index(drop=True), types.get(col)) for col in cleaned_df.columns]
+        names = [str(col) for col in cleaned_df.columns]
+        table = pa.Table.from_arrays(
+            arrays + [pa.array(dates, from_pandas=True), pa.array(np.full(len(dates), wave_id, dtype=object))],
+            names=names + [DATE_COLUMN, WAVE_COLUMN],
+            metadata={_META_KEY: json.dumps(meta).encode()},
+        )
+
+        # One file per month, rows in date order so row-group statistics prune well
+        months = dates.dt.strftime("%Y-%m").fillna(UNDATED_MONTH).to_numpy(dtype=object)
+        order = np.argsort(dates.to_numpy(), kind="stable")
+        for month in pd.unique(months):
+            rows = order[months[order] == month]
+            month_dir = os.path.join(survey_dir, f"month={month}")
+            os.makedirs(month_dir, exist_ok=True)
+            path = os.path.join(month_dir, f"{wave_id}.parquet")
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            pq.write_table(table.take(pa.array(rows)), tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+        return wave_id
+
+    # --- Catalog ---
+
+    def _footer(self, path):
+        """(schema, metadata) of one file, cached until the file changes."""
+        pq = lazy_import("pyarrow.parquet")
+        mtime = os.path.getmtime(path)
+        cached = self._footers.get(path)
+        if cached is None or cached[0] != mtime:
+            schema = pq.read_schema(path)
+            cached = (mtime, schema, json.loads(schema.metadata[_META_KEY]))
+            self._footers[path] = cached
+        return cached[1], cached[2]
+
+    def _wave_files(self, survey_dir, months=(None, None)):
+        """Metadata (plus 'path' and 'month') of the files under a survey, pruned by month."""
+        first, last = months
+        bounded = first is not None or last is not None
+        files = []
+        if not os.path.isdir(survey_dir):
+            return files
+        for month_name in sorted(os.listdir(survey_dir)):
+            if not month_name.startswith("month="):
+                continue
+            month = month_name[len("month="):]
+            if bounded and (month == UNDATED_MONTH or (first and month < first) or (last and month > last)):
+                continue
+            month_dir = os.path.join(survey_dir, month_name)
+            for name in sorted(os.listdir(month_dir)):
+                if name.endswith(".parquet"):
+                    path = os.path.join(month_dir, name)
+                    files.append(dict(self._footer(path)[1], path=path, month=month))
+        return files
+
+    def surveys(self):
+        """Survey names in the archive."""
+        names = []
+        for entry in sorted(os.listdir(self.directory)):
+            if entry.startswith("survey="):
+                files = self._wave_files(os.path.join(self.directory, entry))
+                if files:
+                    names.append(files[0]["survey"])
+        return names
+
+    def waves(self, surveys=None):
+        """'Survey'/'Wave'/'Wave Id'/'Responses'/'Months'/'Archived At' frame, one row per wave."""
+        rows = {}
+        for survey in surveys or self.surveys():
+            for f in self._wave_files(self._survey_dir(survey)):
+                row = rows.setdefault(f["wave_id"], {
+                    "Survey": f["survey"], "Wave": f["wave_name"], "Wave Id": f["wave_id"],
+                    "Responses": f["n_rows"], "Months": [], "Archived At": f["archived_at"]})
+                row["Months"].append(f["month"])
+        frame = pd.DataFrame(list(rows.values()),
+                             columns=["Survey", "Wave", "Wave Id", "Responses", "Months", "Archived At"])
+        frame["Months"] = frame["Months"].map(lambda m: ", ".join(m) if len(m) <= 3 else f"{m[0]} … {m[-1]}")
+        return frame.sort_values(["Survey", "Archived At"], ignore_index=True)
+
+    def version(self):
+        """Changes whenever a file is added or replaced (a cache key for reads)."""
+        latest, count = 0.0, 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".parquet"):
+                    latest = max(latest, os.path.getmtime(os.path.join(root, name)))
+                    count += 1
+        return count, latest
+
+    # --- Reading ---
+
+    def read(self, surveys=None, start=None, end=None, columns=None):
+        """
+        Archived rows of the given surveys (all by default) whose date lies in
+        [start, end], as (frame, metadata of every file read). Only the
+        partitions overlapping the range and the requested `columns` (plus
+        `_date` and `_wave`) are read.
+        """
+        pa = _pyarrow()
+        ds = lazy_import("pyarrow.dataset")
+        months = _month_range(start, end)
+        files = [f for survey in surveys or self.surveys()
+                 for f in self._wave_files(self._survey_dir(survey), months)]
+        if not files:
+            return pd.DataFrame(columns=list(columns or []) + [DATE_COLUMN, WAVE_COLUMN]), []
+
+        schema = _unify_schemas(self._footer(f["path"])[0] for f in files)
+        dataset = ds.dataset([f["path"] for f in files], schema=schema, format="parquet")
+        if columns is None:
+            projection = schema.names
+        else:
+            projection = [c for c in dict.fromkeys(map(str, columns)) if c in schema.names
+                          and c not in (DATE_COLUMN, WAVE_COLUMN)] + [DATE_COLUMN, WAVE_COLUMN]
+        row_filter = None
+        if start is not None:
+            row_filter = ds.field(DATE_COLUMN) >= pa.scalar(pd.Timestamp(start).to_datetime64(), pa.timestamp("ns"))
+        if end is not None:
+            # An end date includes that whole day
+            stop = pd.Timestamp(end)
+            stop = stop + pd.Timedelta(days=1) if stop == stop.normalize() else stop + pd.Timedelta(1, "ns")
+            before = ds.field(DATE_COLUMN) < pa.scalar(stop.to_datetime64(), pa.timestamp("ns"))
+            row_filter = before if row_filter is None else row_filter & before
+        table = dataset.to_table(columns=projection, filter=row_filter)
+
+        df = table.to_pandas()
+        for col in df.columns[df.dtypes == object]:
+            # Arrow nulls come back as None; cleaned frames use NaN for missing values
+            df[col] = df[col].where(df[col].notna(), np.nan)
+        return df, files
+
+    def open_recent(self, days=RECENT_DAYS, surveys=None, columns=None, now=None):
+        """
+        The last `days` of the archive as a dataset the dashboard can open:
+        (cleaned_df, category_df, weight_column), with 'Survey' and 'Wave'
+        columns identifying where each row came from and a 'Response Date'
+        column holding the archive date of every row.
+        """
+        end = pd.Timestamp(now) if now is not None else pd.Timestamp.now()
+        start = None if days is None else (end - pd.Timedelta(days=days)).normalize()
+        return self.open(surveys, start, end, columns)
+
+    def open(self, surveys=None, start=None, end=None, columns=None):
+        """Like open_recent() for an explicit date range."""
+        df, files = self.read(surveys, start, end, columns)
+        names = {f["wave_id"]: f for f in files}
+        labels = _free_names(df.columns, ["Response Date", "Survey", "Wave"])
+        df[labels[1]] = df[WAVE_COLUMN].map(lambda w: names[w]["survey"])
+        df[labels[2]] = df[WAVE_COLUMN].map(lambda w: names[w]["wave_name"])
+        dates = df.pop(DATE_COLUMN)
+        df = df.drop(columns=[WAVE_COLUMN])
+        df.insert(0, labels[0], dates)
+
+        # Category table: each column typed as in the latest wave holding it
+        types = {}
+        for f in sorted(files, key=lambda f: f["archived_at"]):
+            wave_types = pd.read_json(io.StringIO(f["category_df"]), orient="split")
+            types.update(zip(wave_types["Column Name"], wave_types["Inferred Type"]))
+        types.update({labels[0]: "Datetime", labels[1]: "Categorical", labels[2]: "Categorical"})
+        columns = [labels[0]] + [c for c in df.columns if c != labels[0]]
+        df = df[columns]
+        for col in columns[1:]:
+            # Columns some wave stored as text (e.g. dates in a CSV export) get their type back
+            if types.get(col) == "Datetime" and not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = pd.to_datetime(df[col], errors="coerce")
+            elif types.get(col) == "Numeric" and not pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col], errors="coerce")
+        category_df = pd.DataFrame([(c, types.get(c, "Free Text")) for c in columns],
+                                   columns=["Column Name", "Inferred Type"])
+        weights = {f["weight_column"] for f in files if f.get("weight_column")}
+        weight_column = weights.pop() if len(weights) == 1 and next(iter(weights)) in df.columns else None
+        return df, category_df, weight_column
+
+
+def _free_names(existing, wanted):
+    """`wanted` column names, prefixed with 'Archive ' where they clash with survey columns."""
+    existing = set(map(str, existing))
+    return [name if name not in existing else f"Archive {name}" for name in wanted]
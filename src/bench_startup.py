@@ -0,0 +1,118 @@
+# bench_startup.py
+# Startup benchmark: measures how long the dashboard's core modules take to
+# import in a fresh interpreter and checks that heavy chart backends are not
+# pulled in at import time.
+#
+# Usage: uv run python src/bench_startup.py [--runs 5] [--budget-ms 1500]
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DASHBOARD = os.path.join(SRC_DIR, "dash_gen.py")
+
+
+def dashboard_modules(path=DASHBOARD):
+    """Project modules that dash_gen.py imports at top level, in import order."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            top = name.split(".")[0]
+            if top not in modules and os.path.exists(os.path.join(SRC_DIR, f"{top}.py")):
+                modules.append(top)
+    return modules
+
+
+# Modules imported before the upload widget is shown (minus streamlit itself),
+# read from the dashboard so the list cannot go stale
+CORE_MODULES = dashboard_modules()
+
+# Backends that must only load on first use of a chart
+LAZY_BACKENDS = ["plotly", "wordcloud", "matplotlib"]
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {modules}
+elapsed = time.perf_counter() - start
+leaked = [m for m in {lazy!r} if m in sys.modules]
+print(elapsed, ",".join(leaked))
+"""
+
+
+def run_once(modules=CORE_MODULES):
+    """Imports the modules in a fresh interpreter; returns (seconds, leaked backends)."""
+    code = _PROBE.format(modules=", ".join(modules), lazy=LAZY_BACKENDS)
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=SRC_DIR, capture_output=True, text=True, check=True
+    ).stdout.split()
+    leaked = out[1].split(",") if len(out) > 1 else []
+    return float(out[0]), leaked
+
+
+def import_time_report(modules=CORE_MODULES, top=15):
+    """Runs `python -X importtime` and returns the slowest (module, cumulative ms) pairs."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=SRC_DIR, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Only top-level imports (nested ones are indented by two extra spaces)
+        if not name[1:].startswith(" "):
+            rows.append((name.strip(), int(cumulative_us) / 1000))
+    rows.sort(key=lambda r: r[1], reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500.0,
+                        help="fail if the median import time exceeds this")
+    args = parser.parse_args()
+
+    timings = []
+    leaked = set()
+    for _ in range(args.runs):
+        seconds, run_leaked = run_once()
+        timings.append(seconds * 1000)
+        leaked.update(run_leaked)
+
+    print("Slowest top-level imports (cumulative ms):")
+    for name, ms in import_time_report():
+        print(f"  {ms:9.1f}  {name}")
+
+    median_ms = statistics.median(timings)
+    print(f"\nCore import time over {args.runs} runs: median {median_ms:.1f} ms, "
+          f"min {min(timings):.1f} ms, max {max(timings):.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if leaked:
+        print(f"FAIL: heavy backends imported at startup: {', '.join(sorted(leaked))}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print("FAIL: startup import time is over budget")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
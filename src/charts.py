@@ -0,0 +1,256 @@
+# charts.py
+# Figure builders for the dashboard. Nothing here imports plotly or wordcloud
+# at module level; each backend is loaded the first time a chart needs it.
+import pandas as pd
+
+from lazy_imports import lazy_import
+
+# Plotly's default qualitative palette, copied so picking colors does not
+# require importing plotly.
+COLOR_PALETTE = [
+    "#636EFA", "#EF553B", "#00CC96", "#AB63FA", "#FFA15A",
+    "#19D3F3", "#FF6692", "#B6E880", "#FF97FF", "#FECB52",
+]
+
+
+def _px(chart_type):
+    return lazy_import("plotly.express", requested_by=chart_type)
+
+
+def pie_chart(counts):
+    """Pie chart from a dataframe with 'Category' and 'Count' columns."""
+    px = _px("pie chart")
+    return px.pie(counts,
+                  values='Count',
+                  names='Category',
+                  title='Response Distribution')
+
+
+def bar_chart(counts, color):
+    """Bar chart from a dataframe with 'Category' and 'Count' columns."""
+    px = _px("bar chart")
+    fig = px.bar(counts,
+                 x='Category',      # Categories on the x-axis
+                 y='Count',         # Count on the y-axis
+                 title='Response Distribution',
+                 color_discrete_sequence=[color], # Use the passed-in color
+                 text_auto=True        # Show counts on bars
+                )
+    # Set text position on the traces (px.bar does not accept textposition directly)
+    fig.update_traces(textposition="outside", cliponaxis=False)
+    return fig
+
+
+def option_bar_chart(freq, color):
+    """Horizontal bar chart from multiselect.option_frequencies()."""
+    px = _px("multi-select chart")
+    fig = px.bar(freq,
+                 x='Percent',
+                 y='Option',
+                 orientation='h',
+                 title='Share of Respondents Selecting Each Option',
+                 color_discrete_sequence=[color],
+                 hover_data={'Count': True, 'Percent': ':.1f'},
+                 text=freq['Percent'].map(lambda p: f"{p:.0f}%")
+                )
+    fig.update_traces(textposition="outside", cliponaxis=False)
+    fig.update_layout(yaxis={'categoryorder': 'total ascending'}, xaxis_title="% of respondents", yaxis_title=None)
+    return fig
+
+
+def histogram_chart(hist, color):
+    """Bar-style histogram from NumericSummary.histogram_frame()."""
+    px = _px("histogram")
+    fig = px.bar(hist,
+                 x='Bin Center',
+                 y='Count',
+                 title='Response Distribution',
+                 color_discrete_sequence=[color] # Set the bar color
+                )
+    fig.update_traces(width=(hist['Bin End'] - hist['Bin Start']) * 0.9,
+                      customdata=hist[['Bin Start', 'Bin End']],
+                      hovertemplate="%{customdata[0]:.4g} – %{customdata[1]:.4g}<br>Count: %{y:,.0f}<extra></extra>")
+    fig.update_layout(xaxis_title=None)
+    return fig
+
+
+def time_series_chart(time_counts, dt_col, granularity="Daily"):
+    """
+    Line chart from a dataframe with 'Date' and 'Count' columns. Rows flagged
+    in an optional 'Anomaly' column (timeseries.response_series) get markers.
+    """
+    px = _px("time series")
+    fig = px.line(
+        time_counts,
+        x="Date",
+        y="Count",
+        title=f"Responses Over Time — {dt_col} ({granularity.lower()})",
+        markers=len(time_counts) <= 100
+    )
+    if "Anomaly" in time_counts.columns:
+        for kind, color, symbol in (("Spike", "#EF553B", "triangle-up"), ("Drop", "#FFA15A", "triangle-down")):
+            flagged = time_counts[time_counts["Anomaly"] == kind]
+            if flagged.empty:
+                continue
+            fig.add_scatter(x=flagged["Date"], y=flagged["Count"], mode="markers", name=kind,
+                            marker=dict(color=color, size=11, symbol=symbol),
+                            customdata=flagged[["Expected"]],
+                            hovertemplate="%{x}<br>Count: %{y:,.0f}<br>Expected: %{customdata[0]:,.0f}"
+                                          f"<extra>{kind}</extra>")
+    fig.update_layout(xaxis_title="Date", yaxis_title="Count")
+    return fig
+
+
+def word_cloud(text):
+    """
+    Returns a generated WordCloud for the given text.
+    Raises ValueError if no words are left after filtering.
+    """
+    wordcloud = lazy_import("wordcloud", requested_by="word cloud")
+    return wordcloud.WordCloud(width=800,
+                               height=400,
+                               background_color='white',
+                               stopwords=None, # You can add a set of custom stopwords
+                               min_font_size=10
+                              ).generate(text)
+
+
+def segmented_bar_chart(cube_df, color_sequence=COLOR_PALETTE):
+    """Grouped bar chart from segments.cube_frame(): share of each category per segment."""
+    px = _px("segmented bar chart")
+    fig = px.bar(cube_df,
+                 x='Category',
+                 y='Percent',
+                 color='Segment',
+                 barmode='group',
+                 title='Response Distribution by Segment',
+                 color_discrete_sequence=color_sequence,
+                 hover_data={'Count': ':,.0f', 'Percent': ':.1f'}
+                )
+    fig.update_layout(yaxis_title="% of segment", xaxis_title=None, legend_title=None)
+    return fig
+
+
+# Red (negative) -> grey (neutral) -> blue (positive)
+_DIVERGING = ["#b2182b", "#ef8a62", "#fddbc7", "#d9d9d9", "#d1e5f0", "#67a9cf", "#2166ac"]
+
+
+def likert_diverging_chart(dist, row_label="Responses"):
+    """
+    Diverging stacked bar from likert.distribution_frame(): negative answers
+    extend left of zero, positive ones right, neutral is split across zero.
+    """
+    px = _px("likert chart")
+    rows = []
+    for _, r in dist.iterrows():
+        if r["Side"] == "neutral":
+            rows.append((r["Label"], -r["Percent"] / 2, r["Percent"], r["Count"]))
+            rows.append((r["Label"], r["Percent"] / 2, r["Percent"], r["Count"]))
+        else:
+            sign = -1 if r["Side"] == "negative" else 1
+            rows.append((r["Label"], sign * r["Percent"], r["Percent"], r["Count"]))
+    plot_df = pd.DataFrame(rows, columns=["Label", "Share", "Percent", "Count"])
+    plot_df["Row"] = row_label
+
+    n = len(dist)
+    palette = [_DIVERGING[round(i * (len(_DIVERGING) - 1) / max(n - 1, 1))] for i in range(n)]
+    fig = px.bar(plot_df,
+                 x="Share",
+                 y="Row",
+                 color="Label",
+                 orientation="h",
+                 barmode="relative",
+                 title="Response Distribution",
+                 category_orders={"Label": list(dist["Label"])},
+                 color_discrete_sequence=palette,
+                 hover_data={"Share": False, "Row": False, "Percent": ":.1f", "Count": ":,.0f"}
+                )
+    fig.update_layout(xaxis_title="% of responses (negative ← → positive)", yaxis_title=None,
+                      yaxis_showticklabels=False, legend_title=None, height=260)
+    fig.update_xaxes(tickformat=".0f")
+    return fig
+
+
+def trend_line_chart(trend, y, title):
+    """Line chart of one metric over time from a dataframe with a 'Date' column."""
+    px = _px("trend chart")
+    fig = px.line(trend, x="Date", y=y, title=title, markers=True)
+    fig.update_layout(xaxis_title="Date")
+    return fig
+
+
+def heatmap_chart(matrix_df, title, zmin=-1, zmax=1, color_scale="RdBu"):
+    """Heatmap of a square matrix dataframe (correlations, Cramér's V, crosstabs)."""
+    px = _px("heatmap")
+    fig = px.imshow(matrix_df,
+                    zmin=zmin,
+                    zmax=zmax,
+                    color_continuous_scale=color_scale,
+                    aspect="auto",
+                    title=title,
+                    text_auto=".2f" if matrix_df.shape[0] <= 15 else False
+                   )
+    fig.update_layout(xaxis_title=None, yaxis_title=None)
+    return fig
+
+
+def wave_comparison_chart(frame, q_type, title):
+    """
+    Chart of one column across survey waves (frames from waves.compare_column):
+    grouped bars of category shares, or the mean per wave for scores/numbers.
+    """
+    px = _px("wave comparison")
+    if q_type in ("Likert Scale", "Numeric"):
+        y = "Mean Score" if q_type == "Likert Scale" else "Mean"
+        fig = px.line(frame, x="Wave", y=y, markers=True, title=title)
+        significant = frame[frame["Significant"]]
+        if not significant.empty:
+            fig.add_scatter(x=significant["Wave"], y=significant[y], mode="markers", name="Significant change",
+                            marker=dict(color="#EF553B", size=13, symbol="star"))
+        fig.update_layout(xaxis_title=None, yaxis_title=y)
+        return fig
+
+    wave_cols = [c for c in frame.columns if c not in ("Category", "Δ pts", "p-value", "Significant")]
+    shares = frame.melt(id_vars="Category", value_vars=wave_cols, var_name="Wave", value_name="Percent")
+    fig = px.bar(shares, x="Category", y="Percent", color="Wave", barmode="group", title=title,
+                 color_discrete_sequence=COLOR_PALETTE)
+    fig.update_layout(xaxis_title=None, yaxis_title="% of responses")
+    return fig
+
+
+SENTIMENT_COLORS = {"Negative": "#EF553B", "Neutral": "#B6B6B6", "Positive": "#00CC96"}
+
+
+def sentiment_bar_chart(dist):
+    """Bars of sentiment.ColumnSentiment.distribution() (Negative / Neutral / Positive)."""
+    px = _px("sentiment")
+    fig = px.bar(dist, x="Sentiment", y="Count", color="Sentiment", title="Sentiment",
+                 color_discrete_map=SENTIMENT_COLORS, custom_data=["Share"])
+    fig.update_traces(hovertemplate="%{x}: %{y:,.0f} (%{customdata[0]:.1f}%)<extra></extra>")
+    fig.update_layout(xaxis_title=None, yaxis_title="Responses", showlegend=False)
+    return fig
+
+
+def topic_bar_chart(sizes):
+    """Horizontal bars of topics.ColumnTopics.sizes(), largest topic on top."""
+    px = _px("topics")
+    fig = px.bar(sizes, x="Responses", y="Topic", orientation="h", title="Topics",
+                 color_discrete_sequence=[COLOR_PALETTE[0]], custom_data=["Share", "Top Terms"],
+                 text=sizes["Share"].map(lambda p: f"{p:.0f}%"))
+    fig.update_traces(textposition="outside", cliponaxis=False,
+                      hovertemplate="%{customdata[1]}<br>%{x:,.0f} responses (%{customdata[0]:.1f}%)<extra></extra>")
+    fig.update_layout(yaxis={"categoryorder": "array", "categoryarray": sizes["Topic"].tolist()[::-1]},
+                      xaxis_title="Responses", yaxis_title=None)
+    return fig
+
+
+def sentiment_trend_chart(trend, granularity="Daily"):
+    """Share of positive and negative responses per bucket (ColumnSentiment.over_time())."""
+    px = _px("sentiment trend")
+    shares = trend.melt(id_vars="Date", value_vars=["% Positive", "% Negative"],
+                        var_name="Sentiment", value_name="Percent")
+    shares["Sentiment"] = shares["Sentiment"].str[2:]
+    fig = px.line(shares, x="Date", y="Percent", color="Sentiment", color_discrete_map=SENTIMENT_COLORS,
+                  title=f"Sentiment Over Time ({granularity.lower()})", markers=len(trend) <= 100)
+    fig.update_layout(xaxis_title="Date", yaxis_title="% of responses")
+    return fig
@@ -2,164 +2,448 @@
 import streamlit as st
 import pandas as pd
 import io
+import os
+import time
 
 # --- IMPORT YOUR CLEANING FUNCTIONS ---
 import data_clean as data_cleaner
-# --- NEW IMPORTS for visualizations ---
-import plotly.express as px
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
+from jobs import Job, JobRunner, MAX_CONCURRENT_JOBS, archive_job, cleaning_job, discard_job
+from shared_store import MappedFrame, SharedDatasetStore, dataset_id_for
+from memory_governor import MemoryBudgetExceeded, MemoryGovernor
+from archive import RECENT_DAYS, SurveyArchive, survey_slug
+from numeric_summary import summarize_column
+# --- Visualization layer (plotly/wordcloud are loaded on first use) ---
+import charts
+import aggregates
+from multiselect import column_delimiter, option_frequencies
+from segments import CubeCache, cube_frame, get_codes, suggest_segments
+import likert
+import numpy as np
+from relationships import (RelationshipCache, cramers_v_matrix, crosstab_counts,
+                           matrix_frame, pairwise_correlation, top_pairs)
+from lazy_imports import import_report
+from redact import Redactor, header_kind
+from sentiment import key_phrases, score_column
+from topics import DEFAULT_TOPICS, MAX_TOPICS, cluster_column
+from timeseries import GRANULARITIES, TimeBuckets, resample_counts, response_series
+from waves import (SIGNIFICANCE_LEVEL, align_columns, build_wave, compare_column, comparison_summary,
+                   dump_wave, load_wave)
+import text_index
 
 # --- 1. Plot function for ID/Unique (Metric Card) ---
-def plot_id(series):
-    """Displays a large metric card for unique counts."""
-    # 
-    count = series.nunique()
-    st.metric(f"Total Unique Values", count)
+def plot_id(count, bound=None):
+    """Displays a large metric card for unique counts (see data_clean.unique_count)."""
+    # Small columns are counted exactly; large ones use a HyperLogLog sketch
+    if bound is None:
+        st.metric(f"Total Unique Values", count)
+    else:
+        st.metric(f"Total Unique Values (approx.)", f"{count:,}")
+        st.caption(f"± {bound:,} (HyperLogLog estimate, ~95% bound)")
     st.info("This column is likely a unique identifier. The most relevant metric is the count of unique entries.")
 
 # --- 2. Plot function for Binary (Pie Chart) ---
-def plot_binary(series):
+def plot_binary(counts):
     """Displays a Plotly pie chart for binary data."""
     # 
-    # Get value counts
-    counts = series.value_counts().reset_index()
-    counts.columns = ['Category', 'Count']
+    # `counts` is a 'Category'/'Count' frame (in memory or from the SQL store)
     
     # Create Plotly pie chart
-    fig = px.pie(counts, 
-                 values='Count', 
-                 names='Category', 
-                 title='Response Distribution')
+    fig = charts.pie_chart(counts)
     st.plotly_chart(fig, use_container_width=True)
 
 # --- 3. Plot function for Categorical (Bar Chart) [CHANGE 1] ---
-def plot_categorical(series, color): # Added 'color' parameter
+def plot_categorical(counts, color): # Added 'color' parameter
     """Displays a Plotly bar chart for categorical data."""
     # 
-    # Get value counts
-    counts = series.value_counts().reset_index()
-    counts.columns = ['Category', 'Count']
-    
-    # Optional: Sort values for a cleaner chart (e.g., highest to lowest)
-    counts = counts.sort_values(by="Count", ascending=False)
+    # `counts` is sorted highest to lowest for a cleaner chart
     
     # Create Plotly bar chart instead of st.bar_chart
-    fig = px.bar(counts, 
-                 x='Category',      # Categories on the x-axis
-                 y='Count',         # Count on the y-axis
-                 title='Response Distribution',
-                 color_discrete_sequence=[color], # Use the passed-in color
-                 text_auto=True        # Show counts on bars
-                )
-    # Set text position on the traces (px.bar does not accept textposition directly)
-    fig.update_traces(textposition="outside", cliponaxis=False)
+    fig = charts.bar_chart(counts, color)
     st.plotly_chart(fig, use_container_width=True)
 
-# --- 4. Plot function for Numeric (Histogram) ---
-def plot_numeric(series, color):
-    """Displays a Plotly histogram for numeric data."""
-    # 
-    # Drop NaNs for histogram calculation
-    data_to_plot = series.dropna()
-    
-    if data_to_plot.empty:
+# --- 3b. Plot function for Multi-Select (Option Frequency Bars) ---
+def plot_multiselect(series, delimiter, color, weights=None):
+    """Displays how often each option of a 'select all that apply' question was picked."""
+    freq = option_frequencies(series, delimiter, weights=weights)
+    if freq.empty:
+        st.info("This column contains no selections to plot.")
+        return
+    fig = charts.option_bar_chart(freq, color)
+    st.plotly_chart(fig, use_container_width=True)
+
+# --- 3c. Plot function for Segment Comparison (Grouped Bars) ---
+def plot_segmented(counts, segment_codes, target_codes):
+    """Displays one categorical column split by the selected segment."""
+    cube_df = cube_frame(counts, segment_codes, target_codes)
+    if cube_df["Count"].sum() == 0:
+        st.info("No responses with both a segment and an answer in this range.")
+        return
+    fig = charts.segmented_bar_chart(cube_df)
+    st.plotly_chart(fig, use_container_width=True)
+
+# --- 3d. Plot function for Likert (Score Cards + Diverging Bar) ---
+def plot_likert(encoding, row_mask=None, dates=None, weights=None):
+    """Displays Likert score cards, a diverging bar chart and, if dated, a trend."""
+    counts = likert.score_counts(encoding, row_mask, weights)
+    if counts.sum() == 0:
+        st.info("This column contains no responses on the detected scale.")
+        return
+
+    metrics = likert.likert_metrics(counts, encoding)
+    card1, card2, card3 = st.columns(3)
+    card1.metric("Mean Score", f"{metrics['Mean Score']:.2f} / {encoding.values.max():g}")
+    box_label = "Top-2 Box" if encoding.n_points >= 5 and not encoding.is_nps else "Top Box"
+    card2.metric(box_label, f"{metrics['Top-2 Box %']:.0f}%")
+    card3.metric("Net Score", f"{metrics['Net Score']:+.0f}")
+
+    fig = charts.likert_diverging_chart(likert.distribution_frame(counts, encoding))
+    st.plotly_chart(fig, use_container_width=True)
+
+    if dates is not None:
+        with st.expander("📈 Score trend"):
+            trend = likert.likert_trend(encoding, dates, row_mask, weights=weights)
+            if trend.empty:
+                st.info("No dated responses in this range.")
+            else:
+                st.plotly_chart(charts.trend_line_chart(trend, "Mean Score", "Mean Score Over Time"),
+                                use_container_width=True)
+
+# --- 4. Plot function for Numeric (Summary Cards + Histogram) ---
+def plot_numeric(summary, color):
+    """Displays median/P90/IQR cards and a histogram from a NumericSummary."""
+    # The summary is built from sketches, so nothing here re-scans the column
+    if summary.count == 0:
         st.info("This column contains no numeric data to plot.")
         return
-        
-    # Use Plotly Express for histogram
-    fig = px.histogram(data_to_plot, 
-                       nbins=20,  # You can adjust the number of bins
-                       title='Response Distribution',
-                       color_discrete_sequence=[color] # Set the bar color
-                      )
-    fig.update_layout(bargap=0.1) # Add a small gap between bars
+
+    card1, card2, card3 = st.columns(3)
+    card1.metric("Median", f"{summary.median:,.2f}")
+    card2.metric("P90", f"{summary.p90:,.2f}")
+    card3.metric("IQR", f"{summary.iqr:,.2f}")
+
+    fig = charts.histogram_chart(summary.histogram_frame(), color)
     st.plotly_chart(fig, use_container_width=True)
 
 # --- 5. Plot function for Free Text (Word Cloud) ---
-def plot_text(series):
-    """Displays a word cloud for free text data."""
+def plot_text(series, redactor=None):
+    """Displays a word cloud for free text data (redacted with `redactor`, if given)."""
     # 
     st.info("Word Cloud generated from the most frequent words. Common 'stop words' are removed.")
     
-    # 1. Get the series, drop actual np.nan values, and convert all to string
-    cleaned_series = series.dropna().astype(str)
+    if redactor is not None:
+        series = redactor.redact_series(series, series.name)
+    # Combine all non-null text (null-like strings such as 'nan' are dropped)
+    text = aggregates.text_for_wordcloud(series)
     
-    # 2. Define a set of null-like strings to exclude
-    #    We check against a lower-case version
-    cleaned_series_lower = cleaned_series.str.lower()
-    null_strings = {'nan', 'none', 'null', ''} # Add others if needed
-    
-    # 3. Create a mask for values that are NOT in null_strings
-    mask = ~cleaned_series_lower.isin(null_strings)
-    
-    # 4. Apply the mask to the original (non-lowercased) series
-    filtered_series = cleaned_series[mask]
-
-    # 5. Check if the filtered series is empty
-    if filtered_series.empty:
+    if not text:
         st.info("This column contains no text data to visualize (after filtering nulls).")
         return
         
-    # 6. Combine all text
-    text = ' '.join(filtered_series)
-    
-    if not text: # Fallback check
-        st.info("This column contains no text data to visualize.")
-        return
-        
     # Generate word cloud
     try:
-        wordcloud = WordCloud(width=800, 
-                              height=400, 
-                              background_color='white',
-                              stopwords=None, # You can add a set of custom stopwords
-                              min_font_size=10
-                             ).generate(text)
-        
-        # Display using matplotlib
-        fig, ax = plt.subplots()
-        ax.imshow(wordcloud, interpolation='bilinear')
-        ax.axis('off') # Hide axes
-        st.pyplot(fig)
+        wordcloud = charts.word_cloud(text)
+
+        # Display the rendered image directly (no matplotlib figure needed)
+        st.image(wordcloud.to_array(), use_container_width=True)
     except ValueError as e:
         # Handle cases where text might be empty after processing
         st.warning(f"Could not generate word cloud. (Perhaps all words were filtered out?)")
 
+# --- 5b. Sentiment and key phrases for Free Text ---
+def plot_sentiment(column_sentiment, phrases, row_mask=None, weights=None, trend=None, granularity="Daily"):
+    """Displays lexicon sentiment (cards, distribution, trend) and the key phrases of a text column."""
+    dist = column_sentiment.distribution(row_mask, weights)
+    if dist["Count"].sum() == 0:
+        st.info("No responses to score in this selection.")
+        return
+    shares = dict(zip(dist["Sentiment"], dist["Share"]))
+    card1, card2, card3 = st.columns(3)
+    card1.metric("Positive", f"{shares['Positive']:.0f}%")
+    card2.metric("Negative", f"{shares['Negative']:.0f}%")
+    card3.metric("Mean Sentiment", f"{column_sentiment.mean(row_mask, weights):+.2f}")
+    st.plotly_chart(charts.sentiment_bar_chart(dist), use_container_width=True)
+    if trend is not None and len(trend) > 1:
+        st.plotly_chart(charts.sentiment_trend_chart(trend, granularity), use_container_width=True)
+    if not phrases.empty:
+        st.caption("Key phrases (mean sentiment of the responses using them):")
+        st.dataframe(phrases.round({"Mean Sentiment": 2}), use_container_width=True, hide_index=True)
+
+
+# --- 5c. Topic clusters for Free Text ---
+def plot_topics(series, column_topics, row_mask=None, weights=None, redactor=None):
+    """Displays topic sizes and the most typical response of each topic under the current filter."""
+    sizes = column_topics.sizes(row_mask, weights)
+    if sizes["Responses"].sum() == 0:
+        st.info("No responses with topic words in this selection.")
+        return
+    st.plotly_chart(charts.topic_bar_chart(sizes), use_container_width=True)
+    examples = []
+    for topic in range(column_topics.n_topics):
+        shown = column_topics.examples(series, topic, row_mask, n=1)
+        if redactor is not None:
+            shown = redactor.redact_series(shown, series.name)
+        examples.append(shown.iloc[0] if len(shown) else "")
+    st.dataframe(sizes.assign(**{"Most Typical Response": examples}).round({"Responses": 0, "Share": 1}),
+                 use_container_width=True, hide_index=True)
+
+
+# --- Wave comparison (several uploads of a recurring survey) ---
+@st.cache_data(show_spinner=False, max_entries=32)
+def wave_from_upload(file_bytes, filename):
+    """Aggregates of one wave: a saved wave file, or a raw export cleaned here."""
+    if filename.lower().endswith(".json"):
+        return load_wave(file_bytes)
+    df = data_cleaner.read_survey_file(io.BytesIO(file_bytes), filename)
+    cleaned, categories = data_cleaner.process_and_analyze_data(df)
+    return build_wave(cleaned, categories, os.path.splitext(filename)[0])
+
+def render_wave_comparison():
+    """Compares two or more waves using only their per-column aggregates."""
+    st.info("Upload two or more waves of the same survey, oldest first: raw exports (CSV/Excel) or "
+            "wave files downloaded from the single-survey view. Questions are matched by header.")
+    files = st.file_uploader("Upload survey waves", type=["csv", "xlsx", "json"], accept_multiple_files=True)
+    if not files or len(files) < 2:
+        st.caption("At least two waves are needed for a comparison.")
+        return
+
+    waves = []
+    with st.spinner("Reading waves..."):
+        for file in files:
+            try:
+                wave = wave_from_upload(file.getvalue(), file.name)
+            except ValueError as e:
+                st.error(f"{file.name}: {e}")
+                continue
+            # Wave names label the comparison columns, so they must be unique
+            name, n = wave["name"], 2
+            while name in [w["name"] for w in waves]:
+                name, n = f"{wave['name']} ({n})", n + 1
+            waves.append(dict(wave, name=name))
+    if len(waves) < 2:
+        return
+
+    st.subheader("🗂️ Waves")
+    st.dataframe(pd.DataFrame({"Wave": [w["name"] for w in waves],
+                               "Responses": [w["n_rows"] for w in waves],
+                               "Questions": [len(w["columns"]) for w in waves]}),
+                 use_container_width=True, hide_index=True)
+
+    summary = comparison_summary(waves)
+    if summary.empty:
+        st.warning("The waves have no comparable questions in common.")
+        return
+    st.subheader("🧪 Changes Across Waves")
+    st.caption(f"Changes are flagged as significant at p < {SIGNIFICANCE_LEVEL}, computed from the stored "
+               "counts and summaries of each wave.")
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+
+    aligned = align_columns(waves).set_index("Column")
+    col_name = st.selectbox("Compare one question across waves:", summary["Column"].tolist())
+    q_type = aligned.loc[col_name, "Type"]
+    frame, _ = compare_column(waves, aligned.loc[col_name, "Key"], q_type)
+    st.plotly_chart(charts.wave_comparison_chart(frame, q_type, col_name), use_container_width=True)
+    st.dataframe(frame, use_container_width=True, hide_index=True)
+
 
 # --- Original Dashboard Code (Starts Here) ---
 
 st.set_page_config(page_title="Survey Data Cleaner", layout="wide")
 st.title("🧹 Smart Survey Data Cleaner")
 
-uploaded_file = st.file_uploader("Upload a survey file (CSV or Excel)", type=["csv", "xlsx"])
+@st.cache_resource
+def get_job_runner():
+    """One job runner per server process, shared by every session."""
+    return JobRunner(max_workers=MAX_CONCURRENT_JOBS)
 
-if uploaded_file:
-    try:
-        if uploaded_file.name.endswith(".csv"):
-            df = pd.read_csv(uploaded_file)
-        else:
-            df = pd.read_excel(uploaded_file)
-        st.subheader("✅ Raw Data Preview")
-        st.dataframe(df.head(), use_container_width=True)
-    except Exception as e:
-        st.error(f"Error reading file: {e}")
+@st.cache_resource
+def get_shared_store():
+    """Cleaned datasets shared by every session (and process) viewing the same file."""
+    return SharedDatasetStore()
+
+@st.cache_resource
+def get_survey_archive():
+    """The Parquet archive of cleaned waves (SURVEY_ARCHIVE_DIR)."""
+    return SurveyArchive()
+
+@st.cache_resource
+def get_memory_governor():
+    """Memory accounting, upload admission and idle-session spilling for the whole server."""
+    return MemoryGovernor(shared_store=get_shared_store())
+
+mode = st.radio("Mode:", ["Analyze one survey", "Compare survey waves", "Open archive"], horizontal=True)
+if mode == "Compare survey waves":
+    render_wave_comparison()
+    st.stop()
+
+ARCHIVE_PERIODS = {"Last 30 days": 30, f"Last {RECENT_DAYS} days": RECENT_DAYS, "Last 365 days": 365,
+                   "All": None, "Custom range": "custom"}
+
+def archive_source():
+    """Picks archived surveys and a period; returns the job that opens them, or None."""
+    archive = get_survey_archive()
+    surveys = archive.surveys()
+    if not surveys:
+        st.info("The archive is empty. Archive a cleaned upload from the single-survey view first.")
+        return None
+    with st.expander(f"🗄️ Archived waves ({archive.directory})"):
+        st.dataframe(archive.waves(), use_container_width=True, hide_index=True)
+    chosen = st.multiselect("Surveys:", surveys, default=surveys)
+    period = st.radio("Period:", list(ARCHIVE_PERIODS), index=1, horizontal=True)
+    if not chosen:
+        return None
+    now = pd.Timestamp.now()
+    days = ARCHIVE_PERIODS[period]
+    start, end = None, None
+    if days == "custom":
+        picked = st.date_input("Date range:", value=((now - pd.Timedelta(days=RECENT_DAYS)).date(), now.date()))
+        if len(picked) != 2:
+            return None
+        start, end = pd.Timestamp(picked[0]), pd.Timestamp(picked[1])
+    elif days is not None:
+        start = (now - pd.Timedelta(days=days)).normalize()
+    # The archive version makes newly archived waves show up on the next rerun
+    key = ("archive", tuple(chosen), start, end, archive.version())
+    return (key, f"Archive: {', '.join(chosen)}", archive_job, (archive, list(chosen), start, end),
+            {"governor": get_memory_governor()})
+
+uploaded_file = None
+if mode == "Open archive":
+    source = archive_source()
+else:
+    uploaded_file = st.file_uploader("Upload a survey file (CSV or Excel)", type=["csv", "xlsx"])
+    source = None
+    if uploaded_file:
+        upload_key = (uploaded_file.name, uploaded_file.size, getattr(uploaded_file, "file_id", None))
+        source = (upload_key, uploaded_file.name, cleaning_job, (uploaded_file.getvalue(), uploaded_file.name),
+                  {"shared_store": get_shared_store(), "governor": get_memory_governor()})
+
+if source is None:
+    # Upload removed: stop any cleaning still running for this session
+    previous_job = st.session_state.pop("clean_job", None)
+    if previous_job is not None:
+        discard_job(previous_job, get_memory_governor())
+
+if source is not None:
+    # --- Run reading + cleaning (or opening the archive) as a background job (once per source) ---
+    runner = get_job_runner()
+    source_key, source_name, source_func, source_args, source_kwargs = source
+    job = st.session_state.get("clean_job")
+    if job is None or job.key != source_key:
+        # A new upload replaces (and cancels) the previous run
+        if job is not None:
+            discard_job(job, get_memory_governor())
+        job = runner.submit(source_func, *source_args, name=source_name, key=source_key, **source_kwargs)
+        st.session_state["clean_job"] = job
+
+    if not job.done:
+        st.subheader("⚙️ Cleaning in Progress...")
+        status = st.empty()
+        progress_bar = st.progress(0.0)
+        while not job.done:
+            state, stage, fraction, message = job.snapshot()
+            if state == Job.QUEUED:
+                status.info(f"Waiting for a free worker ({runner.queue_position(job)} job(s) ahead, "
+                            f"{runner.running_count()} running).")
+            else:
+                status.caption(f"{stage} — {message}" if message else stage)
+            progress_bar.progress(fraction)
+            time.sleep(0.2)
+        st.rerun()
+
+    if job.state == Job.FAILED and isinstance(job.error, MemoryBudgetExceeded):
+        st.error(str(job.error))
+        st.stop()
+    if job.state == Job.FAILED:
+        st.error(f"Error reading or cleaning file: {job.error}")
+        st.exception(job.error)
+        st.stop()
+    if job.state == Job.CANCELLED:
+        st.warning("Cleaning was cancelled. Upload the file again to restart.")
+        st.stop()
+    # Reloads this session's frames if they were spilled while it sat idle
+    get_memory_governor().touch(job)
+    if job.result["cleaned_df"].empty:
+        st.warning("There are no responses to show (for the archive: none in the chosen surveys and period).")
         st.stop()
 
-    st.subheader("⚙️ Cleaning in Progress...")
+    df = job.result["df"]
+
+    # --- Personal data is redacted in every preview and download (on by default) ---
+    redaction_choice = st.radio(
+        "🔒 Personal data (emails, phone numbers, names, ...) in previews and downloads:",
+        ["Mask", "Hash", "Show unredacted"],
+        horizontal=True
+    )
+    redactor = None
+    if redaction_choice != "Show unredacted":
+        # The mask redactor is built at clean time; others on first use
+        redactors = job.result["artifacts"].setdefault("redactors", {})
+        redaction_mode = redaction_choice.lower()
+        if redaction_mode not in redactors:
+            redactors[redaction_mode] = Redactor(redaction_mode).scan(job.result["cleaned_df"])
+        redactor = redactors[redaction_mode]
+
+    def redacted(frame, raw=False):
+        """The frame as it may be shown or exported (raw rows are scanned afresh)."""
+        return frame if redactor is None else redactor.redact_frame(frame, cached=not raw)
+
+    st.subheader("✅ Raw Data Preview")
+    st.dataframe(redacted(df.head(), raw=True), use_container_width=True)
+    # Encoding, delimiter, header and metadata rows sniffed before parsing (ingest.py)
+    read_plan = job.result["artifacts"].get("read_plan")
+    if read_plan is not None and read_plan.notes():
+        with st.expander(f"📥 How the file was read ({read_plan.export or read_plan.kind.upper()})"):
+            st.markdown("\n".join(f"- {note}" for note in read_plan.notes()))
+
+    st.subheader("⚙️ Cleaning Results")
     
     try:
-        # Call the one main function from data_cleaner.py
-        cleaned_df, category_df = data_cleaner.process_and_analyze_data(df.copy())
+        # Results of data_cleaner.process_and_analyze_data from the job
+        cleaned_df = job.result["cleaned_df"]
+        category_df = job.result["category_df"]
+        numeric_summaries = job.result["artifacts"].setdefault("numeric_summaries", {})
+        # Per-upload caches: category codes and segment cubes survive reruns
+        code_cache = job.result["artifacts"].setdefault("category_codes", {})
+        cube_cache = job.result["artifacts"].setdefault("segment_cubes", CubeCache())
+        likert_cache = job.result["artifacts"].setdefault("likert_codes", {})
+        relationship_cache = job.result["artifacts"].setdefault("relationships", RelationshipCache())
+        delimiters = job.result["artifacts"].setdefault("delimiters", {})
+
+        def delimiter_for(col_name):
+            """Multi-select delimiter of the whole column (also for manual overrides)."""
+            if col_name not in delimiters:
+                delimiters[col_name] = column_delimiter(cleaned_df[col_name])
+            return delimiters[col_name]
+
+        def likert_encoding_for(col_name):
+            """Ordinal codes of a Likert column, encoded once per upload."""
+            if col_name not in likert_cache:
+                likert_cache[col_name] = likert.encode_likert(cleaned_df[col_name])
+            return likert_cache[col_name]
 
         st.dataframe(category_df, use_container_width=True)
-    
+
+        if redactor is not None:
+            redaction_report = redactor.report()
+            if not redaction_report.empty:
+                with st.expander(f"🔒 Personal data redacted ({redaction_report['Values Redacted'].sum():,} "
+                                 f"distinct values in {len(redaction_report)} columns)"):
+                    st.caption("Values are redacted in the previews, search results, word clouds and the CSV download; "
+                               "charts and counts still use the original data.")
+                    st.dataframe(redaction_report, use_container_width=True, hide_index=True)
+
+        normalization_map = job.result["artifacts"].get("normalization_map")
+        if normalization_map is not None and not normalization_map.empty:
+            with st.expander(f"🧩 Value normalization ({len(normalization_map)} spellings merged)"):
+                st.caption("Spelling variants of the same answer were merged into its most common spelling.")
+                st.dataframe(normalization_map, use_container_width=True, hide_index=True)
+
         # --- Display Analysis Table ---
         st.subheader("🧭 Manual Override of Question Categories")
 
         st.info("You can adjust any inferred type below. Changes will update the visualizations automatically.")
 
-        type_options = ["ID/Unique", "Binary", "Likert Scale", "Categorical", "Numeric", "Free Text", "Datetime"]
+        type_options = ["ID/Unique", "Binary", "Likert Scale", "Categorical", "Multi-Select", "Numeric", "Free Text", "Datetime"]
 
         # Create a copy to store user overrides
         override_df = category_df.copy()
@@ -184,11 +468,14 @@ if uploaded_file:
             st.success("Overrides applied successfully!")
         # --- Display Cleaned Data Preview ---
         st.subheader("✨ Cleaned Data Preview")
-        st.dataframe(cleaned_df.head(), use_container_width=True)
+        st.dataframe(redacted(aggregates.densify(cleaned_df.head())), use_container_width=True)
 
         # --- Download Button ---
+        # Rows kept on disk (large surveys) are exported chunk by chunk
         buffer = io.BytesIO()
-        cleaned_df.to_csv(buffer, index=False)
+        chunks = cleaned_df.iter_chunks() if isinstance(cleaned_df, MappedFrame) else [cleaned_df]
+        for i, chunk in enumerate(chunks):
+            redacted(aggregates.densify(chunk)).to_csv(buffer, index=False, header=i == 0)
         buffer.seek(0)
         st.download_button(
             label="📥 Download Cleaned Data (CSV)",
@@ -197,6 +484,42 @@ if uploaded_file:
             mime="text/csv"
         )
 
+        # --- Save this upload as one wave of a recurring survey (aggregates only) ---
+        wave_stem = os.path.splitext(uploaded_file.name)[0] if uploaded_file else "archive"
+        wave_types = tuple(category_df["Inferred Type"])
+        saved_wave = job.result["artifacts"].get("wave_file")
+        if saved_wave is None or saved_wave[0] != wave_types:
+            saved_wave = (wave_types, dump_wave(build_wave(cleaned_df, category_df, wave_stem, delimiters)))
+            job.result["artifacts"]["wave_file"] = saved_wave
+        st.download_button(
+            label="📦 Download Wave Aggregates (for wave comparison)",
+            data=saved_wave[1],
+            file_name=f"{wave_stem}_wave.json",
+            mime="application/json"
+        )
+
+        # --- Archive mode: append every cleaned upload to the Parquet archive ---
+        if uploaded_file:
+            archive_col1, archive_col2 = st.columns([2, 3])
+            with archive_col1:
+                archive_uploads = st.checkbox("🗄️ Archive cleaned uploads", key="archive_uploads",
+                                              help="Appends each cleaned upload to the Parquet archive, "
+                                                   "partitioned by survey and month, for the 'Open archive' mode.")
+            with archive_col2:
+                archive_survey = st.text_input("Survey name in the archive:", value=wave_stem, key="archive_survey")
+            if archive_uploads and archive_survey.strip():
+                archived = job.result["artifacts"].get("archived_wave")
+                if archived is None or archived[0] != survey_slug(archive_survey):
+                    with st.spinner("Archiving..."):
+                        # Keyed by the file's content, so archiving the same export twice is a no-op
+                        wave_id = get_survey_archive().append(
+                            cleaned_df, category_df, archive_survey.strip(), wave_name=wave_stem,
+                            wave_id=dataset_id_for(uploaded_file.getvalue(), uploaded_file.name),
+                            weight_column=job.result["artifacts"].get("weight_column"))
+                    archived = (survey_slug(archive_survey), wave_id)
+                    job.result["artifacts"]["archived_wave"] = archived
+                st.caption(f"Archived as wave `{archived[1][:12]}` of survey `{archived[0]}`.")
+
         # --- NEW: DETAILED VISUALIZATIONS (Tabs with Column Grids) ---
         st.subheader("📈 Detailed Visualizations by Column Type")
 
@@ -207,15 +530,19 @@ if uploaded_file:
         num_cols = category_df[category_df["Inferred Type"] == "Numeric"]
         text_cols = category_df[category_df["Inferred Type"] == "Free Text"]
         likert_cols = category_df[category_df["Inferred Type"] == "Likert Scale"]
+        multi_cols = category_df[category_df["Inferred Type"] == "Multi-Select"]
 
         # Define a color palette to cycle through
-        color_palette = px.colors.qualitative.Plotly 
+        color_palette = charts.COLOR_PALETTE
 
         # --- GLOBAL DATE RANGE FILTER (applies to all charts) ---
         datetime_cols_all = category_df[category_df["Inferred Type"] == "Datetime"]
 
         # Default to full dataset
-        filtered_df = cleaned_df.copy()
+        global_dt_col = None
+        dt_series_global = None
+        date_range = None  # (start_date, end_date) when the date filter is active
+        row_mask = None    # boolean mask over cleaned_df rows for the same filter
 
         if not datetime_cols_all.empty:
             st.subheader("📅 Global Date Range Filter")
@@ -275,28 +602,166 @@ if uploaded_file:
                             dt_series_global.dt.date <= end_date
                         )
 
-                        filtered_df = cleaned_df[mask].copy()
-                else:
-                    # User chose to bypass filter
-                    filtered_df = cleaned_df.copy()
+                        date_range = (start_date, end_date)
+                        row_mask = mask.to_numpy()
+
+        # --- FREE-TEXT SEARCH (can also filter every chart to the matching responses) ---
+        search_key = None  # (query, columns) while the search also filters the charts
+        if not text_cols.empty:
+            st.subheader("🔍 Search Free-Text Responses")
+            # Built at clean time; rebuilt here for columns overridden to Free Text
+            text_indexes = job.result["artifacts"].setdefault("text_indexes", {})
+            searchable = text_cols["Column Name"].tolist()
+            query_col, columns_col = st.columns([3, 2])
+            with query_col:
+                query_text = st.text_input(
+                    "Search responses:",
+                    placeholder='e.g.  bus late   satisf*   "very clean"   -hotel'
+                )
+            with columns_col:
+                search_cols = st.multiselect("In columns:", searchable, default=searchable)
+
+            search_query = text_index.Query(query_text)
+            if not search_query.empty and search_cols:
+                for col in search_cols:
+                    if col not in text_indexes:
+                        text_indexes[col] = text_index.TextIndex(cleaned_df[col])
+                search_start = time.perf_counter()
+                col_matches = text_index.search_columns(text_indexes, cleaned_df, search_query, search_cols)
+                matches = text_index.union_rows(col_matches.values())
+                search_ms = (time.perf_counter() - search_start) * 1000
+                if row_mask is not None:
+                    # Only responses inside the date filter are listed and counted
+                    col_matches = {c: m[row_mask[m]] for c, m in col_matches.items()}
+                    matches = matches[row_mask[matches]]
+                st.caption(f"{len(matches):,} matching responses"
+                           f"{' in the selected date range' if row_mask is not None else ''} "
+                           f"({search_ms:.1f} ms).")
+
+                if st.checkbox("Filter all charts to the matching responses"):
+                    search_mask = text_index.row_mask(matches, len(cleaned_df))
+                    row_mask = search_mask if row_mask is None else row_mask & search_mask
+                    search_key = (query_text, tuple(search_cols))
+
+                with st.expander(f"Matching responses (up to {text_index.MAX_SHOWN_MATCHES} per column)"):
+                    for col, positions in col_matches.items():
+                        if len(positions) == 0:
+                            continue
+                        st.markdown(f"**{col}** — {len(positions):,} responses")
+                        shown = cleaned_df[col].iloc[positions[:text_index.MAX_SHOWN_MATCHES]]
+                        if redactor is not None:
+                            shown = redactor.redact_series(shown, col)
+                        st.markdown("\n".join(f"- {text_index.highlight(value, search_query)}" for value in shown),
+                                    unsafe_allow_html=True)
 
+        # Cache key of the active row filter (date range plus search)
+        filter_key = date_range if search_key is None else (date_range, search_key)
 
-        # Use filtered_df for all subsequent plots
+        def column_in_range(col_name):
+            """One column restricted to the date/search filter (the frame itself is never copied)."""
+            series = cleaned_df[col_name]
+            return series if row_mask is None else series[row_mask]
+
+        # Large surveys are also served from the SQLite query store (if cleaning built one
+        # for the same reference date column); aggregates then run as SQL.
+        # The store only filters by date, so a search filter falls back to memory
+        sql_store = job.result["artifacts"].get("sql_store")
+        if sql_store is not None and (sql_store.date_col != global_dt_col or search_key is not None):
+            sql_store = None
+
+        # --- SURVEY WEIGHTS (apply to every count, share and summary) ---
+        weight_col = None
+        weights = None        # float series indexed like cleaned_df
+        weight_array = None   # the same weights as a positional array
+        weight_candidates = num_cols["Column Name"].tolist()
+        if weight_candidates:
+            st.subheader("⚖️ Survey Weights")
+            suggested_weight = job.result["artifacts"].get("weight_column")
+            weight_options = ["(unweighted)"] + weight_candidates
+            weight_choice = st.selectbox(
+                "Weight responses by:",
+                weight_options,
+                index=weight_options.index(suggested_weight) if suggested_weight in weight_options else 0
+            )
+            if weight_choice != "(unweighted)":
+                weight_col = weight_choice
+                weights = aggregates.respondent_weights(cleaned_df[weight_col])
+                weight_array = weights.to_numpy()
+                st.caption(f"Counts and percentages are weighted by **{weight_col}** "
+                           f"(effective base {weight_array.sum():,.0f}).")
+
+        def counts_for(col_name):
+            """Category counts under the current date filter and weights."""
+            if sql_store is not None and col_name in sql_store.labels:
+                return sql_store.value_counts(col_name, date_range, weight_col)
+            return aggregates.value_counts_frame(column_in_range(col_name), weights)
+
+        # Weighted summaries are built on first use and kept per weight column
+        weighted_summaries = job.result["artifacts"].setdefault("weighted_numeric_summaries", {})
+
+        def numeric_summary_for(col_name):
+            """Returns the (date-filtered) summary, building it if cleaning did not."""
+            if search_key is not None:
+                # Search results are not bucketed by day: summarize the matching rows directly
+                return summarize_column(column_in_range(col_name),
+                                        weights=None if weight_array is None else weight_array[row_mask]).overall
+            summaries = numeric_summaries if weight_col is None else weighted_summaries.setdefault(weight_col, {})
+            col_summary = summaries.get(col_name)
+            if col_summary is None or col_summary.date_col != global_dt_col:
+                col_summary = summarize_column(cleaned_df[col_name], dates=dt_series_global,
+                                               date_col=global_dt_col, weights=weight_array)
+                summaries[col_name] = col_summary
+            return col_summary.for_range(date_range)
+
+        # --- SEGMENT COMPARISON (splits categorical charts by one column) ---
+        segment_options = suggest_segments(
+            category_df,
+            [pattern for pattern, q_type in data_cleaner.QUESTION_KEYWORDS.items() if q_type == "Categorical"]
+        )
+        if redactor is not None:
+            # Segment labels of a personal-data column would show the values themselves
+            segment_options = [c for c in segment_options if header_kind(c) is None]
+        segment_col = None
+        segment_cube = {}
+        if segment_options:
+            st.subheader("🔀 Segment Comparison")
+            segment_choice = st.selectbox(
+                "Split categorical, binary and Likert charts by:",
+                ["(no segmentation)"] + segment_options
+            )
+            if segment_choice != "(no segmentation)":
+                segment_col = segment_choice
+                split_cols = category_df.loc[
+                    category_df["Inferred Type"].isin(["Binary", "Categorical", "Likert Scale"])
+                    & (category_df["Column Name"] != segment_col),
+                    "Column Name"
+                ].tolist()
+                if sql_store is not None and all(c in sql_store.labels for c in [segment_col] + split_cols):
+                    # GROUP BY on the indexed code columns of the query store
+                    segment_cube = sql_store.segment_cube(segment_col, split_cols, date_range, weight_col)
+                else:
+                    # One cached cube per (segment, date filter, weights); all charts read from it
+                    segment_cube = cube_cache.get(code_cache, cleaned_df, segment_col, split_cols,
+                                                  row_mask=row_mask, mask_key=filter_key,
+                                                  weights=weight_array, weights_key=weight_col)
+
+        # Use column_in_range() / counts_for() for all subsequent plots
         # 2. Create the main tabs
         #    We can combine Binary and Categorical since they are similar
-        tab_cat, tab_num, tab_text, tab_id, tab_time = st.tabs([
-        f"📊 Categorical and Likert ({len(binary_cols) + len(cat_cols) + len(likert_cols)})", 
+        tab_cat, tab_num, tab_text, tab_id, tab_time, tab_rel = st.tabs([
+        f"📊 Categorical and Likert ({len(binary_cols) + len(cat_cols) + len(likert_cols) + len(multi_cols)})", 
         f"🔢 Numeric ({len(num_cols)})", 
         f"✍️ Free Text ({len(text_cols)})",
         f"🆔 ID Fields ({len(id_cols)})",
-        f"⏳ Datetime Columns and Time Series ({len(datetime_cols_all)})"
+        f"⏳ Datetime Columns and Time Series ({len(datetime_cols_all)})",
+        "🔗 Relationships"
 ])
         # --- Populate the "Categorical & Binary" Tab [CHANGE 2] ---
         with tab_cat:
             st.header("Categorical, Binary, and Likert Data")
             
             # Combine the two lists
-            all_cat_cols = pd.concat([binary_cols, cat_cols, likert_cols], ignore_index=True)
+            all_cat_cols = pd.concat([binary_cols, cat_cols, likert_cols, multi_cols], ignore_index=True)
             
             if all_cat_cols.empty:
                 st.info("No categorical, likert, or binary columns found.")
@@ -318,12 +783,27 @@ if uploaded_file:
                         # Using a container with a border makes it look like a "card"
                         with st.container(border=True):
                             st.subheader(f"{col_name}")
-                            if col_type == "Binary":
+                            if redactor is not None and header_kind(col_name) is not None:
+                                # Its category labels would be the personal data itself
+                                st.info(f"Not charted: this column holds personal data "
+                                        f"({header_kind(col_name).lower()}).")
+                            elif col_name in segment_cube:
+                                plot_segmented(segment_cube[col_name],
+                                               get_codes(code_cache, cleaned_df, segment_col),
+                                               get_codes(code_cache, cleaned_df, col_name))
+                            elif col_type == "Binary":
                                 # Binary pie charts don't need a single color
-                                plot_binary(filtered_df[col_name])
+                                plot_binary(counts_for(col_name))
+                            elif col_type == "Likert Scale":
+                                plot_likert(likert_encoding_for(col_name), row_mask, dt_series_global,
+                                            weight_array)
+                            elif col_type == "Multi-Select":
+                                # One bar per option, not per combination
+                                plot_multiselect(column_in_range(col_name), delimiter_for(col_name),
+                                                 color_to_use, weights)
                             else:
                                 # Categorical bar charts get the single color
-                                plot_categorical(filtered_df[col_name], color_to_use)
+                                plot_categorical(counts_for(col_name), color_to_use)
                     
                     col_index += 1
 
@@ -348,12 +828,12 @@ if uploaded_file:
                         with st.container(border=True):
                             st.subheader(f"{col_name}")
                             # Pass the selected color to the plot function
-                            plot_numeric(filtered_df[col_name], color_to_use)
+                            plot_numeric(numeric_summary_for(col_name), color_to_use)
                     col_index += 1
 
         # --- Populate the "Free Text" Tab ---
         with tab_text:
-            st.header("Free Text Data (Word Clouds)")
+            st.header("Free Text Data (Word Clouds, Sentiment and Key Phrases)")
             
             if text_cols.empty:
                 st.info("No free text columns found.")
@@ -362,12 +842,53 @@ if uploaded_file:
                 grid_cols = st.columns(2)
                 col_index = 0
                 
+                # Scored at clean time; here for columns overridden to Free Text
+                sentiments = job.result["artifacts"].setdefault("sentiment", {})
+                phrase_cache = job.result["artifacts"].setdefault("key_phrases", {})
+                if len(phrase_cache) > 64:
+                    phrase_cache.clear()
+                sentiment_trend_buckets = None
+                if global_dt_col is not None:
+                    time_buckets = job.result["artifacts"].setdefault("time_buckets", {})
+                    if global_dt_col not in time_buckets:
+                        time_buckets[global_dt_col] = TimeBuckets(cleaned_df[global_dt_col])
+                    if not time_buckets[global_dt_col].empty:
+                        sentiment_trend_buckets = time_buckets[global_dt_col]
+
                 for index, row in text_cols.iterrows():
                     col_name = row["Column Name"]
+                    if col_name not in sentiments:
+                        sentiments[col_name] = score_column(
+                            cleaned_df[col_name], job.result["artifacts"].get("text_indexes", {}).get(col_name))
+                    column_sentiment = sentiments[col_name]
+                    if (col_name, filter_key) not in phrase_cache:
+                        phrase_cache[(col_name, filter_key)] = key_phrases(cleaned_df[col_name], column_sentiment,
+                                                                           row_mask)
+                    trend, trend_granularity = None, None
+                    if sentiment_trend_buckets is not None:
+                        trend_granularity = sentiment_trend_buckets.default_granularity()
+                        trend = column_sentiment.over_time(sentiment_trend_buckets, GRANULARITIES[trend_granularity],
+                                                           row_mask, weight_array)
                     with grid_cols[col_index % 2]:
                         with st.container(border=True):
                             st.subheader(f"{col_name}")
-                            plot_text(filtered_df[col_name])
+                            plot_text(column_in_range(col_name), redactor)
+                            plot_sentiment(column_sentiment, phrase_cache[(col_name, filter_key)],
+                                           row_mask, weight_array, trend, trend_granularity)
+                            # Clustered on demand (once per column and topic count), shown under the filter
+                            if st.checkbox("🧩 Find topics", key=f"topics_{col_name}"):
+                                n_topics = st.slider("Topics:", 2, MAX_TOPICS, DEFAULT_TOPICS,
+                                                     key=f"n_topics_{col_name}")
+                                topic_cache = job.result["artifacts"].setdefault("topics", {})
+                                if (col_name, n_topics) not in topic_cache:
+                                    topic_progress = st.progress(0.0)
+                                    topic_cache[(col_name, n_topics)] = cluster_column(
+                                        cleaned_df[col_name], n_topics,
+                                        progress=lambda fraction, stage: topic_progress.progress(
+                                            min(fraction, 1.0), text=stage))
+                                    topic_progress.empty()
+                                plot_topics(cleaned_df[col_name], topic_cache[(col_name, n_topics)],
+                                            row_mask, weight_array, redactor)
                     col_index += 1
 
         # --- Populate the "ID" Tab ---
@@ -388,7 +909,14 @@ if uploaded_file:
                         # great on its own, but the border adds consistency.
                         with st.container(border=True): 
                             st.subheader(f"{col_name}")
-                            plot_id(filtered_df[col_name])
+                            if row_mask is None:
+                                # Unfiltered counts are kept, so reruns do not rebuild the sketch
+                                unique_counts = job.result["artifacts"].setdefault("unique_counts", {})
+                                if col_name not in unique_counts:
+                                    unique_counts[col_name] = data_cleaner.unique_count(cleaned_df[col_name])
+                                plot_id(*unique_counts[col_name])
+                            else:
+                                plot_id(*data_cleaner.unique_count(column_in_range(col_name)))
                     col_index += 1
         
          # --- TIME SERIES TAB ---
@@ -405,37 +933,151 @@ if uploaded_file:
                     datetime_cols["Column Name"].tolist()
                 )
 
-                dt_series = pd.to_datetime(filtered_df[dt_col], errors="coerce")
-
-                min_dt = dt_series.min()
-                max_dt = dt_series.max()
+                # Hour of every row, bucketed at clean time (or here, for overridden columns)
+                time_buckets = job.result["artifacts"].setdefault("time_buckets", {})
+                if dt_col not in time_buckets:
+                    time_buckets[dt_col] = TimeBuckets(cleaned_df[dt_col])
+                buckets = time_buckets[dt_col]
 
-                if pd.isna(min_dt) or pd.isna(max_dt):
+                if buckets.empty:
                     st.warning("This datetime column contains no valid datetime data.")
                 else:
-                    # Aggregate by day — change to "H" for hourly
-                    time_counts = (
-                        dt_series.dropna()
-                        .dt.floor("D")
-                        .value_counts()
-                        .sort_index()
-                        .reset_index()
+                    granularity_options = buckets.granularities
+                    granularity = st.radio(
+                        "Granularity:",
+                        granularity_options,
+                        index=granularity_options.index(buckets.default_granularity()),
+                        horizontal=True,
+                        key=f"granularity_{dt_col}"
                     )
-                    time_counts.columns = ["Date", "Count"]
+                    freq = GRANULARITIES[granularity]
+
+                    if sql_store is not None and sql_store.is_date_column(dt_col) and freq != "h":
+                        # Responses per day straight from the indexed day column, re-bucketed
+                        time_counts = resample_counts(sql_store.time_counts(dt_col, date_range, weight_col), freq)
+                    else:
+                        time_counts = buckets.counts(freq, row_mask, weight_array)
 
                     if time_counts.empty:
                         st.info("No responses in this date range.")
                     else:
-                        fig = px.line(
-                            time_counts,
-                            x="Date",
-                            y="Count",
-                            title=f"Responses Over Time — {dt_col}",
-                            markers=True
-                        )
-                        fig.update_layout(xaxis_title="Date", yaxis_title="Count")
+                        # Bounded payload: LTTB points plus the flagged spikes and drops
+                        series = response_series(time_counts, freq)
+                        st.plotly_chart(charts.time_series_chart(series, dt_col, granularity),
+                                        use_container_width=True)
+                        flagged = series[series["Anomaly"] != ""]
+                        drawn = f", drawn with {len(series):,} points" if len(series) < len(time_counts) else ""
+                        st.caption(f"{len(time_counts):,} {granularity.lower()} buckets{drawn}. "
+                                   f"{len(flagged):,} spikes or drops in response volume flagged.")
+                        if not flagged.empty:
+                            with st.expander("📍 Flagged spikes and drops"):
+                                st.dataframe(flagged[["Date", "Count", "Expected", "Anomaly"]].round(1),
+                                             use_container_width=True, hide_index=True)
+
+        # --- RELATIONSHIPS TAB ---
+        with tab_rel:
+            st.header("🔗 Relationships Between Questions")
+
+            corr_cols = num_cols["Column Name"].tolist() + likert_cols["Column Name"].tolist()
+            assoc_cols = binary_cols["Column Name"].tolist() + cat_cols["Column Name"].tolist()
+
+            def numeric_column_values(col_name):
+                """Numeric values, or Likert scores, with NaN for missing."""
+                if col_name in likert_cols["Column Name"].values:
+                    encoding = likert_encoding_for(col_name)
+                    return np.where(encoding.codes >= 0, encoding.values[np.maximum(encoding.codes, 0)], np.nan)
+                return pd.to_numeric(cleaned_df[col_name], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+            def compute_correlations():
+                X = np.column_stack([numeric_column_values(c) for c in corr_cols])
+                w = weight_array
+                if row_mask is not None:
+                    X = X[row_mask]
+                    w = None if w is None else w[row_mask]
+                return pairwise_correlation(X, w)
+
+            def compute_associations():
+                codes = [get_codes(code_cache, cleaned_df, c) for c in assoc_cols]
+                return cramers_v_matrix([c.codes for c in codes], [c.n_categories for c in codes], row_mask,
+                                        weight_array)
+
+            # Every tab renders on each rerun, so the matrices are only built on request
+            # (and then cached per filter)
+            show_relationships = st.checkbox("Compute relationship matrices", key="relationships_on")
+            if not show_relationships:
+                st.caption("Correlations and associations between all question pairs are computed "
+                           "for the current filters once this is ticked.")
+            elif len(corr_cols) < 2 and len(assoc_cols) < 2:
+                st.info("At least two numeric/Likert or two categorical columns are needed.")
+
+            pairs = []
+            if show_relationships and len(corr_cols) >= 2:
+                corr, corr_n = relationship_cache.get(("corr", filter_key, weight_col, tuple(corr_cols)),
+                                                       compute_correlations)
+                st.plotly_chart(charts.heatmap_chart(matrix_frame(corr, corr_cols),
+                                                     "Correlation (Numeric and Likert Scores)"),
+                                use_container_width=True)
+                pairs.append(top_pairs(corr, corr_cols, corr_n, "Strength").assign(Measure="Correlation"))
+
+            if show_relationships and len(assoc_cols) >= 2:
+                assoc, assoc_n = relationship_cache.get(("cramers_v", filter_key, weight_col, tuple(assoc_cols)),
+                                                         compute_associations)
+                st.plotly_chart(charts.heatmap_chart(matrix_frame(assoc, assoc_cols),
+                                                     "Association (Cramér's V, Categorical)",
+                                                     zmin=0, color_scale="Blues"),
+                                use_container_width=True)
+                pairs.append(top_pairs(assoc, assoc_cols, assoc_n, "Strength").assign(Measure="Cramér's V"))
+
+            if pairs:
+                pairs_df = pd.concat(pairs, ignore_index=True)
+                pairs_df = pairs_df.reindex(pairs_df["Strength"].abs().sort_values(ascending=False).index)
+                st.subheader("Strongest relationships")
+                st.dataframe(pairs_df, use_container_width=True, hide_index=True)
+
+                # --- Drill-down into one pair ---
+                pair_labels = [f"{r['Column A']} × {r['Column B']} ({r['Measure']} {r['Strength']:.2f})"
+                               for _, r in pairs_df.iterrows()]
+                if pair_labels:
+                    picked = st.selectbox("Drill down into a pair:", range(len(pair_labels)),
+                                          format_func=lambda i: pair_labels[i])
+                    pair = pairs_df.iloc[picked]
+                    a, b = pair["Column A"], pair["Column B"]
+                    if pair["Measure"] == "Correlation":
+                        xa, xb = numeric_column_values(a), numeric_column_values(b)
+                        both = ~np.isnan(xa) & ~np.isnan(xb)
+                        if row_mask is not None:
+                            both &= row_mask
+                        counts, a_edges, b_edges = np.histogram2d(
+                            xa[both], xb[both], bins=20,
+                            weights=None if weight_array is None else weight_array[both])
+                        grid = pd.DataFrame(counts.T, index=np.round((b_edges[:-1] + b_edges[1:]) / 2, 2),
+                                            columns=np.round((a_edges[:-1] + a_edges[1:]) / 2, 2))
+                        grid = grid.iloc[::-1]
+                        fig = charts.heatmap_chart(grid, f"{b} vs {a} (response counts)",
+                                                   zmin=0, zmax=None, color_scale="Blues")
+                        fig.update_layout(xaxis_title=a, yaxis_title=b)
+                    else:
+                        codes_a = get_codes(code_cache, cleaned_df, a)
+                        codes_b = get_codes(code_cache, cleaned_df, b)
+                        grid = pd.DataFrame(crosstab_counts(codes_a, codes_b, row_mask, weight_array),
+                                            index=codes_a.labels.astype(str), columns=codes_b.labels.astype(str))
+                        fig = charts.heatmap_chart(grid, f"{a} × {b} (response counts)",
+                                                   zmin=0, zmax=None, color_scale="Blues")
+                        fig.update_layout(xaxis_title=b, yaxis_title=a)
+                    st.plotly_chart(fig, use_container_width=True)
 
-                        st.plotly_chart(fig, use_container_width=True)
+        # --- Cold-start diagnostics: which chart backends were loaded, and how long they took ---
+        with st.expander("⏱️ Visualization backend load times"):
+            st.dataframe(import_report(), use_container_width=True)
+        with st.expander("🔎 Type inference detectors (timing and hit rate)"):
+            st.dataframe(data_cleaner.detector_report(), use_container_width=True, hide_index=True)
+        with st.expander("🛠️ Server memory (admin)"):
+            governor = get_memory_governor()
+            memory_stats = governor.stats()
+            stat_cols = st.columns(len(memory_stats))
+            for stat_col, (label, value) in zip(stat_cols, memory_stats.items()):
+                stat_col.metric(label, f"{value:,.0f}")
+            st.dataframe(governor.report(), use_container_width=True, hide_index=True)
        
     except Exception as e:
         st.error(f"Error during processing or visualization: {e}")
@@ -1,8 +1,21 @@
 # data_clean3.py
+import numpy as np
 import pandas as pd
 import re
 from datetime import datetime
 
+from sketches import HyperLogLog, HLL_DEFAULT_PRECISION
+from detector_registry import Detector, DetectorRegistry
+from numeric_summary import summarize_numeric_columns
+from multiselect import column_delimiters, is_multiselect
+from aggregates import present_values
+from normalize import normalize_text_columns
+from text_index import build_text_indexes
+from sentiment import score_columns
+from timeseries import TimeBuckets
+from redact import Redactor
+from ingest import plan_read
+
 # --- Keyword patterns for initial inference ---
 QUESTION_KEYWORDS = {
     r"satisfaction|rate|agree|importance": "Likert Scale",
@@ -16,27 +29,37 @@ QUESTION_KEYWORDS = {
 
 
 # --- Helper Functions for Specific Type Detection ---
+# Known scales, ordered from most negative to most positive
 LIKERT_OPTIONS = [
     ["strongly disagree", "disagree", "neutral", "agree", "strongly agree"],
-    ["very unsatisfied", "unsatisfied", "neutral", "satisfied", "very satisfied"]
+    ["very unsatisfied", "unsatisfied", "neutral", "satisfied", "very satisfied"],
+    ["very dissatisfied", "dissatisfied", "neutral", "satisfied", "very satisfied"],
+    ["strongly disagree", "disagree", "neither agree nor disagree", "agree", "strongly agree"],
+    ["very unlikely", "unlikely", "neutral", "likely", "very likely"],
+    ["very poor", "poor", "fair", "good", "very good", "excellent"],
+    ["never", "rarely", "sometimes", "often", "always"],
+    ["not at all important", "slightly important", "moderately important", "very important", "extremely important"],
 ]
 
-def is_likert(series):
-    s = series.dropna()
+def is_likert(series, profile=None):
+    s = series.dropna() if profile is None else profile.present
 
     # ---------- 1. Detect numeric Likert scales ----------
     if pd.api.types.is_numeric_dtype(series):
         unique_vals = sorted(s.unique())
 
-        if len(unique_vals) <= 7:  # Likert scales rarely exceed 7 levels
+        if 0 < len(unique_vals) <= 7:  # Likert scales rarely exceed 7 levels
             span = max(unique_vals) - min(unique_vals)
 
             # Typical Likert spans are 3–6 points
             if 2 <= span <= 6:
                 return True
+        # Numbers never contain the scale keywords below
+        return False
 
     # ---------- 2. Detect text-based Likert options ----------
-    text_vals = s.astype(str).str.lower().unique().tolist()
+    # (on the distinct answers, not on every row)
+    text_vals = pd.Series(s.unique()).astype(str).str.lower().unique().tolist()
 
     # Partial matching allowed (only 2+ matching labels needed)
     LIKERT_KEYWORDS = [
@@ -67,47 +90,126 @@ DATETIME_PATTERNS = [
     r".*\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{2}.*",
 ]
 
+# --- Distinct counting ---
+# Columns up to this many rows are counted exactly; larger ones use a
+# HyperLogLog sketch instead of building a full hash set.
+EXACT_DISTINCT_MAX_ROWS = 100_000
+# How many standard errors around a decision threshold trigger an exact recount
+DISTINCT_FALLBACK_Z = 3.0
+
+class ColumnProfile:
+    """
+    Statistics of one column shared by every detector during inference.
+    Each one is computed on first use and reused by the detectors after it.
+    """
+
+    def __init__(self, series, precision=HLL_DEFAULT_PRECISION):
+        self.series = series
+        self.precision = precision
+        self._present = None
+        self._exact_distinct = None
+        self._sketch = None
+        self._mean_length = None
+
+    @property
+    def present(self):
+        if self._present is None:
+            self._present = self.series.dropna()
+        return self._present
+
+    @property
+    def exact_distinct(self):
+        if self._exact_distinct is None:
+            self._exact_distinct = self.series.nunique(dropna=True)
+        return self._exact_distinct
+
+    @property
+    def mean_length(self):
+        if self._mean_length is None:
+            self._mean_length = self.present.astype(str).map(len).mean()
+        return self._mean_length
+
+    def distinct(self, threshold=None):
+        """
+        Number of distinct non-null values. Large columns are estimated with
+        HyperLogLog; if a threshold is given and the estimate is too close to
+        it to be trusted, the exact count is used instead, so detector
+        decisions never flip because of sketch error.
+        """
+        if len(self.series) <= EXACT_DISTINCT_MAX_ROWS or self._exact_distinct is not None:
+            return self.exact_distinct
+
+        if self._sketch is None:
+            self._sketch = HyperLogLog(self.precision).update(self.series)
+        estimate = self._sketch.estimate()
+
+        if threshold is not None:
+            margin = DISTINCT_FALLBACK_Z * self._sketch.relative_error() * max(estimate, threshold)
+            if abs(estimate - threshold) <= max(margin, 1):
+                return self.exact_distinct
+        return estimate
+
+def count_distinct(series, threshold=None, precision=HLL_DEFAULT_PRECISION):
+    """Returns the number of distinct non-null values in a series (see ColumnProfile.distinct)."""
+    return ColumnProfile(series, precision).distinct(threshold)
+
+def unique_count(series):
+    """
+    (distinct non-null values, +/- bound) as shown for ID/Unique columns:
+    exact with a None bound up to EXACT_DISTINCT_MAX_ROWS rows, else a
+    HyperLogLog estimate with its ~95% bound.
+    """
+    if len(series) <= EXACT_DISTINCT_MAX_ROWS:
+        return int(series.nunique()), None
+    sketch = HyperLogLog().update(series)
+    return sketch.estimate(), sketch.error_bound()
+
 def is_datetime(series):
     return pd.api.types.is_datetime64_any_dtype(series)
 
-def is_categorical(series, unique_threshold=20):
-    n_unique = series.nunique(dropna=True)
+def is_categorical(series, unique_threshold=20, profile=None):
+    profile = profile or ColumnProfile(series)
+    n_unique = profile.distinct(threshold=unique_threshold)
     return n_unique <= unique_threshold
 
 def is_numeric(series):
     return pd.api.types.is_numeric_dtype(series)
 
-def is_binary(series):
-    n_unique = series.nunique(dropna=True)
+def is_binary(series, profile=None):
+    profile = profile or ColumnProfile(series)
+    n_unique = profile.distinct(threshold=2)
     return n_unique == 2
 
-def is_freetext(series, unique_threshold=20, min_mean_length=20):
+def is_freetext(series, unique_threshold=20, min_mean_length=20, profile=None):
     if not pd.api.types.is_object_dtype(series):
         return False
 
-    n_unique = series.nunique(dropna=True)
+    profile = profile or ColumnProfile(series)
+    n_unique = profile.distinct(threshold=unique_threshold)
     if n_unique <= unique_threshold:
         return False
 
     # Check average length to differentiate from short IDs
-    mean_len = series.dropna().astype(str).map(len).mean()
-    return mean_len > min_mean_length
+    return profile.mean_length > min_mean_length
 
-def is_id_field(series, uniqueness_threshold=0.95, max_mean_length=20):
+def is_id_field(series, uniqueness_threshold=0.95, max_mean_length=20, profile=None):
 
-    n_unique = series.nunique(dropna=True)
-    n_total = len(series)
-    uniqueness_ratio = n_unique / n_total
-
-    # Only consider strings or numbers
+    # Only consider strings or numbers (checked first, it is free)
     if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_integer_dtype(series)):
         return False
 
+    n_total = len(series)
+    if n_total == 0:
+        return False
+    profile = profile or ColumnProfile(series)
+    n_unique = profile.distinct(threshold=uniqueness_threshold * n_total)
+    uniqueness_ratio = n_unique / n_total
+
     # If almost all values are unique AND values are short, likely an ID
     if uniqueness_ratio > uniqueness_threshold:
         # Optional: check average length for strings
         if pd.api.types.is_object_dtype(series):
-            mean_len = series.dropna().astype(str).map(len).mean()
+            mean_len = profile.mean_length
             if mean_len <= max_mean_length:
                 return True
             else:
@@ -115,6 +217,29 @@ def is_id_field(series, uniqueness_threshold=0.95, max_mean_length=20):
         return True
     return False
 
+# --- Survey weight column ---
+WEIGHT_KEYWORDS = r"(^|[^a-z])(weight|weights|weighting|wgt|wt|pweight)([^a-z]|$)"
+
+def is_weight_column(series, col_name, max_mean=10.0):
+    """
+    A respondent weight column: weight-like header, numeric, non-negative,
+    answered for (almost) every row and centred near 1. The mean bound keeps
+    questions such as "Your weight (lbs)" out.
+    """
+    if not re.search(WEIGHT_KEYWORDS, str(col_name).lower()):
+        return False
+    values = pd.to_numeric(present_values(series), errors="coerce")
+    if len(series) == 0 or values.notna().sum() < 0.95 * len(series):
+        return False
+    return bool((values >= 0).all() and 0 < values.mean() <= max_mean)
+
+def suggest_weight_column(df, column_categories):
+    """First Numeric column that looks like a respondent weight, or None."""
+    for col, q_type in column_categories.items():
+        if q_type == "Numeric" and col in df.columns and is_weight_column(df[col], col):
+            return col
+    return None
+
 def keyword_match(col):
     col_lower = col.lower()
     for pattern, q_type in QUESTION_KEYWORDS.items():
@@ -122,30 +247,59 @@ def keyword_match(col):
             return q_type
     return None
 
+# --- Detector registry ---
+# Priority is the decision order (header keywords first, numeric last);
+# cost only decides evaluation order, see detector_registry.py.
+DETECTORS = DetectorRegistry([
+    Detector("keyword", None, lambda s, c, p: keyword_match(str(c)),
+             priority=0, cost=0.0, needs=("header",)),
+    Detector("datetime", "Datetime", lambda s, c, p: is_datetime(s),
+             priority=10, cost=0.0, needs=("dtype",), kinds=("datetime",)),
+    Detector("numeric", "Numeric", lambda s, c, p: is_numeric(s),
+             priority=80, cost=0.0, needs=("dtype",), kinds=("numeric", "bool")),
+    Detector("id_field", "ID/Unique", lambda s, c, p: is_id_field(s, profile=p),
+             priority=20, cost=2.0, needs=("dtype", "distinct", "mean_length"), kinds=("numeric", "text")),
+    Detector("binary", "Binary", lambda s, c, p: is_binary(s, profile=p),
+             priority=30, cost=2.0, needs=("distinct",)),
+    Detector("categorical", "Categorical", lambda s, c, p: is_categorical(s, profile=p),
+             priority=70, cost=2.0, needs=("distinct",)),
+    Detector("freetext", "Free Text", lambda s, c, p: is_freetext(s, profile=p),
+             priority=50, cost=2.5, needs=("dtype", "distinct", "mean_length"), kinds=("text",)),
+    Detector("likert", "Likert Scale", lambda s, c, p: is_likert(s, profile=p),
+             priority=60, cost=4.0, needs=("present", "uniques"), kinds=("numeric", "text")),
+    Detector("multiselect", "Multi-Select", lambda s, c, p: is_multiselect(s),
+             priority=40, cost=5.0, needs=("uniques", "delimiters"), kinds=("text",)),
+])
+
+def register_detector(detector):
+    """Adds a domain detector (e.g. NPS, ZIP codes) to type inference."""
+    return DETECTORS.register(detector)
+
+def detector_report():
+    """Per-detector calls, skips, hits and time since the process started."""
+    return DETECTORS.report()
+
 def infer_question_type(series, col_name):
-    # 1. Check keyword matches first
-    keyword_type = keyword_match(col_name)
-    if keyword_type:
-        return keyword_type
-
-    # 2. Use specific detection functions
-    if keyword_type:
-        return keyword_type
-    if is_datetime(series):
-        return "Datetime"
-    if is_id_field(series):
-        return "ID/Unique"
-    if is_binary(series):
-        return "Binary"
-    if is_freetext(series):
-        return "Free Text"
-    if is_likert(series):
-        return "Likert Scale"
-    if is_categorical(series):
-        return "Categorical"
-    if is_numeric(series):
-        return "Numeric"
-    return "Other"
+    # Cheapest detectors first; the best-priority match wins
+    return DETECTORS.detect(series, col_name, ColumnProfile(series))
+
+# --- File Loading ---
+
+def read_survey_file(file, filename=None, artifacts=None):
+    """
+    Reads an uploaded survey (CSV or Excel) into a dataframe.
+    `file` can be a path or a file-like object; `filename` decides the format
+    when `file` has no usable name.
+
+    The file is parsed once with the ReadPlan sniffed from its first bytes
+    (encoding, delimiter, header and metadata rows, date columns; see
+    ingest.py); with an `artifacts` dict, the plan is kept as
+    artifacts["read_plan"].
+    """
+    plan = plan_read(file, filename)
+    if artifacts is not None:
+        artifacts["read_plan"] = plan
+    return plan.read(file)
 
 # --- Internal Helper Cleaning Functions ---
 # (These are now "private" helpers, indicated by the _)
@@ -157,9 +311,13 @@ def _remove_empty_rows_columns(df):
     return df
 
 def _strip_strings(df, text_cols):
+    # Only present values are touched, so missing answers stay real NaNs
+    # (astype(str) on the whole column would turn them into "nan" strings)
     for col in text_cols:
         if col in df.columns: # Check if col exists
-            df[col] = df[col].astype(str).str.strip()
+            present = df[col].notna()
+            stripped = df.loc[present, col].astype(str).str.strip()
+            df[col] = stripped.where(stripped != "").reindex(df.index)
     return df
 
 def _convert_numeric(df, numeric_cols):
@@ -168,30 +326,127 @@ def _convert_numeric(df, numeric_cols):
             df[col] = pd.to_numeric(df[col], errors="coerce")
     return df
 
+# Columns with at least this share of missing values are stored sparsely
+SPARSE_MISSING_THRESHOLD = 0.9
+
+def _sparsify_mostly_empty(df, column_categories, threshold=SPARSE_MISSING_THRESHOLD):
+    """
+    Stores mostly-empty columns (skip-logic branches) as sparse arrays that
+    only keep the answered cells. Datetime columns stay dense.
+    """
+    if len(df) == 0:
+        return df
+    missing_share = df.isna().mean()
+    for col in missing_share[missing_share >= threshold].index:
+        if column_categories.get(col) == "Datetime":
+            continue
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            df[col] = series.astype(pd.SparseDtype("float64", np.nan))
+        elif pd.api.types.is_object_dtype(series):
+            df[col] = series.astype(pd.SparseDtype(object, np.nan))
+    return df
+
+# Question types whose answers are normalized ("Other": too many spelling
+# variants to pass as Categorical before they are merged)
+NORMALIZED_TYPES = ("Binary", "Categorical", "Likert Scale", "Multi-Select", "Other")
+
 # --- THIS IS THE FUNCTION YOUR DASHBOARD IS LOOKING FOR ---
-def process_and_analyze_data(df):
+def _no_progress(stage, fraction=None, message=""):
+    pass
+
+def process_and_analyze_data(df, artifacts=None, progress=None):
     """
     Cleans a survey dataframe and returns the cleaned df
     and an analysis of its column types.
+
+    If an `artifacts` dict is passed, by-products of cleaning are stored in it:
+      - "normalization_map": original -> normalized value of every answer
+        merged by value normalization;
+      - "numeric_summaries": {column: ColumnSummary} for numeric columns,
+        bucketed by day of the first Datetime column (if any);
+      - "weight_column": the column that looks like a respondent weight, or None;
+      - "delimiters": {column: delimiter} for Multi-Select columns;
+      - "text_indexes": {column: text_index.TextIndex} for Free Text columns;
+      - "time_buckets": {column: timeseries.TimeBuckets} for Datetime columns;
+      - "redactors": {"mask": redact.Redactor} with the personal data found
+        in every text column, for previews and exports.
+
+    `progress(stage, fraction, message)` is called per stage and per column;
+    it may raise (e.g. jobs.JobCancelled) to abort the run.
     """
+    progress = progress or _no_progress
+
     # 1. Infer question types for each column
     column_categories = {}
-    for col in df.columns:
+    n_cols = max(len(df.columns), 1)
+    for i, col in enumerate(df.columns):
+        progress("Inferring question types", 0.5 * i / n_cols, str(col))
+        column_categories[col] = infer_question_type(df[col], col)
+
+    # 1b. Merge spelling variants of the same answer ("Yes" / "yes" / "Y") in
+    # columns with a set of answers (IDs and comments are left as typed);
+    # merged columns are inferred again, "Yes" / "Y" / "No" is Binary
+    progress("Normalizing values", 0.5)
+    df, normalization_map = normalize_text_columns(
+        df, [c for c, t in column_categories.items() if t in NORMALIZED_TYPES]
+    )
+    for col in normalization_map["Column Name"].unique():
         column_categories[col] = infer_question_type(df[col], col)
+    if artifacts is not None:
+        artifacts["normalization_map"] = normalization_map
 
     # 2. Categorize columns for cleaning
     numeric_cols = df.select_dtypes(include=["number"]).columns.tolist()
     text_cols = df.select_dtypes(include=["object"]).columns.tolist()
 
     # 3. Apply cleaning functions
+    progress("Cleaning", 0.6, "Removing empty rows and columns")
     df = _remove_empty_rows_columns(df)
+    progress("Cleaning", 0.65, "Stripping text")
     df = _strip_strings(df, text_cols)
+    progress("Cleaning", 0.75, "Converting numbers")
     df = _convert_numeric(df, numeric_cols)
+    progress("Cleaning", 0.8, "Compacting mostly-empty columns")
+    df = _sparsify_mostly_empty(df, column_categories)
+
+    # 4. Build numeric sketches while the cleaned columns are at hand
+    if artifacts is not None:
+        datetime_cols = [c for c, t in column_categories.items() if t == "Datetime" and c in df.columns]
+        date_col = datetime_cols[0] if datetime_cols else None
+        numeric_cleaned = df.select_dtypes(include=["number"]).columns
+        summaries = {}
+        for i, col in enumerate(numeric_cleaned):
+            progress("Summarizing numeric columns", 0.85 + 0.1 * i / len(numeric_cleaned), str(col))
+            summaries.update(summarize_numeric_columns(df, [col], date_col))
+        artifacts["numeric_summaries"] = summaries
+        artifacts["weight_column"] = suggest_weight_column(df, column_categories)
+        artifacts["time_buckets"] = {col: TimeBuckets(df[col]) for col in datetime_cols}
+        artifacts["delimiters"] = column_delimiters(
+            df, [c for c, t in column_categories.items() if t == "Multi-Select"]
+        )
+
+        # 4b. Inverted indexes behind the free-text search box
+        text_columns = [c for c, t in column_categories.items() if t == "Free Text" and c in df.columns]
+        artifacts["text_indexes"] = build_text_indexes(
+            df, text_columns,
+            progress=lambda fraction, col: progress("Indexing free text", 0.95 + 0.02 * fraction, col)
+        )
+        # Lexicon sentiment of every comment, scored through those indexes
+        artifacts["sentiment"] = score_columns(
+            df, text_columns, artifacts["text_indexes"],
+            progress=lambda fraction, col: progress("Scoring sentiment", 0.97 + 0.01 * fraction, col)
+        )
+
+        # 4c. Personal data in text columns, redacted before display and export
+        artifacts["redactors"] = {"mask": Redactor("mask").scan(
+            df, progress=lambda fraction, col: progress("Detecting personal data", 0.98 + 0.02 * fraction, col)
+        )}
 
-            
     # 5. Create the analysis dataframe
+    # (columns dropped as entirely empty are left out)
     category_df = pd.DataFrame(
-        list(column_categories.items()), 
+        [(col, q_type) for col, q_type in column_categories.items() if col in df.columns],
         columns=["Column Name", "Inferred Type"]
     )
 
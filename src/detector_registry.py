@@ -0,0 +1,153 @@
+# detector_registry.py
+# Registry of question-type detectors used by data_clean.infer_question_type.
+#
+# Each detector declares the type it recognises, a priority (which type wins
+# when several detectors match; lower wins), a relative cost and the column
+# profile statistics it reads. Detectors run cheapest first. Once one matches,
+# every detector that could not beat it (higher priority number) is skipped,
+# so a cheap decisive signal (header keyword, datetime dtype) ends inference
+# early while the result stays the same as running them in priority order.
+# Detectors may also declare the column kinds they can match (see
+# column_kind); the others are skipped before any work, e.g. the string
+# detectors on numeric columns.
+#
+# Extra detectors can be registered in code with register() or shipped by
+# another package through the "survey_cleaner.detectors" entry point group;
+# an entry point may load a Detector, a list of them, or a callable
+# returning either.
+import threading
+import time
+import warnings
+from importlib.metadata import entry_points
+
+import pandas as pd
+
+DETECTOR_ENTRY_POINT_GROUP = "survey_cleaner.detectors"
+COLUMN_KINDS = ("bool", "numeric", "datetime", "text")
+
+
+def column_kind(series):
+    """One of COLUMN_KINDS for a column's dtype (sparse columns by their values' dtype)."""
+    dtype = series.dtype.subtype if isinstance(series.dtype, pd.SparseDtype) else series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return "bool"
+    if pd.api.types.is_numeric_dtype(dtype):
+        return "numeric"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime"
+    return "text"
+
+
+class Detector:
+    """
+    One type detector.
+
+    func     : func(series, col_name, profile) -> bool, or the type itself
+               for detectors whose type depends on the column (q_type=None)
+    q_type   : the inferred type when it matches
+    priority : lower numbers win over higher ones
+    cost     : relative cost used for the evaluation order
+    needs    : names of the profile statistics it reads (for the report)
+    kinds    : column kinds (COLUMN_KINDS) it can match; None for any
+    """
+
+    def __init__(self, name, q_type, func, priority, cost=1.0, needs=(), kinds=None):
+        self.name = name
+        self.q_type = q_type
+        self.func = func
+        self.priority = priority
+        self.cost = cost
+        self.needs = tuple(needs)
+        self.kinds = None if kinds is None else frozenset(kinds)
+
+
+class DetectorRegistry:
+    """Detectors plus per-detector call/hit/timing statistics."""
+
+    def __init__(self, detectors=(), load_plugins=True):
+        self._detectors = {}
+        self._order = []
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._plugins_loaded = not load_plugins
+        for detector in detectors:
+            self.register(detector)
+
+    def register(self, detector):
+        """Adds (or replaces, by name) a detector."""
+        with self._lock:
+            self._detectors[detector.name] = detector
+            self._order = sorted(self._detectors.values(), key=lambda d: (d.cost, d.priority))
+            self._stats.setdefault(detector.name, {"calls": 0, "hits": 0, "skipped": 0, "seconds": 0.0})
+        return detector
+
+    def unregister(self, name):
+        with self._lock:
+            self._detectors.pop(name, None)
+            self._order = [d for d in self._order if d.name != name]
+
+    def load_plugins(self):
+        """Registers the detectors published under DETECTOR_ENTRY_POINT_GROUP (once)."""
+        if self._plugins_loaded:
+            return
+        self._plugins_loaded = True
+        for entry_point in entry_points(group=DETECTOR_ENTRY_POINT_GROUP):
+            try:
+                loaded = entry_point.load()
+                if callable(loaded) and not isinstance(loaded, Detector):
+                    loaded = loaded()
+                for detector in (loaded if isinstance(loaded, (list, tuple)) else [loaded]):
+                    self.register(detector)
+            except Exception as e:
+                warnings.warn(f"Could not load detector plugin {entry_point.name!r}: {e}")
+
+    def detect(self, series, col_name, profile, default="Other"):
+        """Returns the type of the best-priority matching detector, or `default`."""
+        self.load_plugins()
+        kind = column_kind(series)
+        best, best_type = None, default
+        for detector in self._order:
+            stats = self._stats[detector.name]
+            if ((best is not None and detector.priority >= best.priority)
+                    or (detector.kinds is not None and kind not in detector.kinds)):
+                with self._lock:
+                    stats["skipped"] += 1
+                continue
+            start = time.perf_counter()
+            result = detector.func(series, col_name, profile)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats["seconds"] += elapsed
+                stats["calls"] += 1
+                stats["hits"] += bool(result)
+            if result:
+                best = detector
+                best_type = result if isinstance(result, str) else detector.q_type
+        return best_type
+
+    def report(self):
+        """Per-detector timing and hit-rate table, in evaluation order."""
+        rows = []
+        for detector in self._order:
+            stats = self._stats[detector.name]
+            calls = stats["calls"]
+            rows.append({
+                "Detector": detector.name,
+                "Type": detector.q_type or "(varies)",
+                "Priority": detector.priority,
+                "Cost": detector.cost,
+                "Needs": ", ".join(detector.needs),
+                "Kinds": ", ".join(k for k in COLUMN_KINDS if k in detector.kinds) if detector.kinds else "any",
+                "Calls": calls,
+                "Skipped": stats["skipped"],
+                "Hits": stats["hits"],
+                "Hit Rate %": round(stats["hits"] / calls * 100, 1) if calls else 0.0,
+                "Total (ms)": round(stats["seconds"] * 1000, 2),
+                "Mean (ms)": round(stats["seconds"] * 1000 / calls, 3) if calls else 0.0,
+            })
+        return pd.DataFrame(rows)
+
+    def reset_stats(self):
+        with self._lock:
+            for stats in self._stats.values():
+                stats.update(calls=0, hits=0, skipped=0, seconds=0.0)
@@ -0,0 +1,340 @@
+# ingest.py
+# Read plans for uploaded survey files.
+#
+# Before a file is parsed, its first SAMPLE_BYTES (or first SAMPLE_ROWS of an
+# Excel sheet) are sniffed for everything a plain pd.read_csv gets wrong on
+# survey exports:
+#   - the encoding (BOMs, UTF-8, else Windows-1252 / Latin-1);
+#   - the delimiter (comma, semicolon, tab or pipe);
+#   - title lines above the real header row;
+#   - metadata rows under it (Qualtrics question text and ImportId rows,
+#     SurveyMonkey sub-header rows), which otherwise turn every numeric
+#     column into text;
+#   - date columns, ID-like columns with leading zeros and empty trailing
+#     columns.
+# The result is a ReadPlan (skiprows, column names, dtypes, date formats,
+# usecols) that parses the whole file once. Plans are cached by the bytes
+# they were sniffed from, so re-reading the same export skips the sniffing.
+import codecs
+import csv
+import hashlib
+import io
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import pandas as pd
+
+# Bytes of a CSV file sniffed for its plan
+SAMPLE_BYTES = 64 * 1024
+# Rows of the sample used (and rows of an Excel sheet read for the plan)
+SAMPLE_ROWS = 200
+# Candidate CSV delimiters
+DELIMITERS = [",", ";", "\t", "|"]
+# Title lines allowed above the header row
+MAX_PREAMBLE_ROWS = 10
+# Metadata rows allowed under the header row
+MAX_METADATA_ROWS = 3
+# Plans kept in memory
+PLAN_CACHE_SIZE = 64
+
+_BOMS = [(codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")]
+# Third header row of a Qualtrics export: {"ImportId":"QID1"}
+_QUALTRICS_IMPORT_ID = re.compile(r'^\{\s*"ImportId"\s*:')
+# Second header row of a SurveyMonkey export
+_SURVEYMONKEY_MARKERS = {"Response", "Open-Ended Response"}
+# Tried in order (month-first before day-first, as survey tools export)
+DATE_FORMATS = [
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d", "%Y/%m/%d",
+    "%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%m/%d/%Y %I:%M:%S %p", "%m/%d/%Y %I:%M %p", "%m/%d/%Y",
+    "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y",
+]
+_DATE_LIKE = re.compile(r"^\d{1,4}[-/]\d{1,2}[-/]\d{1,4}")
+_LEADING_ZERO_CODE = re.compile(r"^0\d+$")
+_DECIMAL_COMMA = re.compile(r"^-?\d+,\d+$")
+_DECIMAL_POINT = re.compile(r"^-?\d+\.\d+$")
+
+
+class ReadPlan:
+    """How to parse one survey file: format, encoding, rows to skip, names and types."""
+
+    def __init__(self, kind, encoding=None, delimiter=None, header_row=0, metadata_rows=(),
+                 names=None, usecols=None, dtypes=None, date_formats=None, export=None, question_text=None,
+                 decimal="."):
+        self.kind = kind                        # "csv" or "excel"
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.decimal = decimal                  # "," for European exports ("3,5")
+        self.header_row = header_row            # 0-based line of the header
+        self.metadata_rows = list(metadata_rows)  # 0-based lines under it that are not responses
+        self.names = names                      # column labels, replacing the header row (None: keep it)
+        self.usecols = usecols                  # labels kept (None: all)
+        self.dtypes = dtypes or {}              # label -> dtype forced at parse time
+        self.date_formats = date_formats or {}  # label -> strptime format
+        self.export = export                    # "Qualtrics", "SurveyMonkey" or None
+        self.question_text = question_text or {}  # label -> short column id of the export
+
+    @property
+    def skiprows(self):
+        return list(range(self.header_row)) + self.metadata_rows
+
+    def read(self, file):
+        """Parses the whole file (a path or a binary file-like object) with this plan."""
+        if hasattr(file, "seek"):
+            file.seek(0)
+        options = {"skiprows": self.skiprows or None, "header": 0, "names": self.names,
+                   "usecols": self.usecols, "dtype": self.dtypes or None}
+        if self.kind == "csv":
+            # index_col=False: a ragged line never turns the first column into the index
+            df = pd.read_csv(file, encoding=self.encoding, sep=self.delimiter, decimal=self.decimal,
+                             index_col=False, **options)
+        else:
+            df = pd.read_excel(file, **options)
+        for col, fmt in self.date_formats.items():
+            if col not in df.columns or pd.api.types.is_datetime64_any_dtype(df[col]):
+                continue
+            parsed = pd.to_datetime(df[col], format=fmt, errors="coerce")
+            # Only when every value parsed (the sample may not show a later free-text answer)
+            if parsed.isna().sum() == df[col].isna().sum():
+                df[col] = parsed
+        return df
+
+    def notes(self):
+        """What the plan does differently from a plain read, as short sentences for the UI."""
+        notes = []
+        if self.export:
+            notes.append(f"{self.export} export detected.")
+        if self.encoding not in (None, "utf-8"):
+            notes.append(f"Encoding: {self.encoding}.")
+        if self.delimiter not in (None, ","):
+            notes.append(f"Delimiter: {'tab' if self.delimiter == chr(9) else repr(self.delimiter)}.")
+        if self.decimal != ".":
+            notes.append(f"Decimal separator: {self.decimal!r}.")
+        if self.header_row:
+            notes.append(f"{self.header_row} title line(s) above the header skipped.")
+        if self.metadata_rows:
+            notes.append(f"{len(self.metadata_rows)} metadata row(s) under the header skipped.")
+        if self.question_text:
+            notes.append(f"{len(self.question_text)} column(s) labelled with their question text.")
+        if self.date_formats:
+            notes.append(f"Date columns: {', '.join(map(str, self.date_formats))}.")
+        if self.dtypes:
+            notes.append(f"Kept as text (leading zeros): {', '.join(map(str, self.dtypes))}.")
+        if self.usecols is not None and self.names is not None:
+            dropped = len(self.names) - len(self.usecols)
+            if dropped:
+                notes.append(f"{dropped} empty trailing column(s) dropped.")
+        return notes
+
+
+# --- Sniffing ---
+
+def sniff_encoding(sample):
+    """Encoding of a byte sample: BOM, else UTF-8 if it decodes, else Windows-1252 or Latin-1."""
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as error:
+        # A multi-byte character cut by the end of the sample is still UTF-8
+        if error.start >= len(sample) - 3 and error.reason == "unexpected end of data":
+            return "utf-8"
+    try:
+        sample.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def _parse_rows(text, delimiter):
+    return list(csv.reader(io.StringIO(text), delimiter=delimiter))[:SAMPLE_ROWS]
+
+
+def _modal_width(rows):
+    widths = Counter(len(row) for row in rows if len(row) > 1)
+    if not widths:
+        return 1, 0.0
+    width, count = widths.most_common(1)[0]
+    return width, count / len(rows)
+
+
+def sniff_delimiter(text):
+    """The candidate delimiter that splits the sample rows into the most consistent number of fields."""
+    best, best_score = ",", (0.0, 0)
+    for delimiter in DELIMITERS:
+        width, share = _modal_width(_parse_rows(text, delimiter)[:50])
+        if width > 1 and (share, width) > best_score:
+            best, best_score = delimiter, (share, width)
+    return best
+
+
+def _is_number(cell):
+    try:
+        float(cell.replace(",", ""))
+        return True
+    except ValueError:
+        return False
+
+
+def _numeric_columns(body, width):
+    """Positions whose sampled body values are (almost) all numbers."""
+    positions = []
+    for i in range(width):
+        values = [row[i] for row in body if i < len(row) and row[i]]
+        if len(values) >= 3 and sum(map(_is_number, values)) >= 0.9 * len(values):
+            positions.append(i)
+    return positions
+
+
+def _unique_labels(labels):
+    """Empty labels become "Unnamed: i" and repeats get ".1", ".2", ... (as pandas does)."""
+    seen, unique = Counter(), []
+    for i, label in enumerate(labels):
+        label = label or f"Unnamed: {i}"
+        base = label
+        while label in seen:
+            label = f"{base}.{seen[base]}"
+            seen[base] += 1
+        seen[label] += 1
+        unique.append(label)
+    return unique
+
+
+def plan_from_rows(rows, kind, encoding=None, delimiter=None):
+    """Builds the plan of a file from its first rows (lists of cell strings, "" when empty)."""
+    rows = [[cell.strip() for cell in row] for row in rows]
+    width, _ = _modal_width(rows)
+
+    # Header: the first line filled at least half way across (title lines are not)
+    header_row = 0
+    for i, row in enumerate(rows[:MAX_PREAMBLE_ROWS + 1]):
+        if sum(1 for cell in row if cell) >= max(1, width / 2):
+            header_row = i
+            break
+    header = (rows[header_row] + [""] * width)[:width] if rows else []
+
+    # Metadata rows: up to a Qualtrics ImportId row, a SurveyMonkey sub-header,
+    # or text sitting on top of columns that are numeric below it
+    export, metadata_rows, labels, question_text = None, [], list(header), {}
+    below = rows[header_row + 1:header_row + 1 + MAX_METADATA_ROWS]
+    import_id_at = next((i for i, row in enumerate(below)
+                         if any(_QUALTRICS_IMPORT_ID.match(cell) for cell in row)), None)
+    if import_id_at is not None:
+        export = "Qualtrics"
+        metadata_rows = list(range(header_row + 1, header_row + 2 + import_id_at))
+        if import_id_at >= 1:
+            texts = (below[0] + [""] * width)[:width]
+            counts = Counter(texts)
+            for i, text in enumerate(texts):
+                if text and counts[text] == 1 and text != header[i]:
+                    question_text[text] = header[i]
+                    labels[i] = text
+    elif below and any(cell in _SURVEYMONKEY_MARKERS for cell in below[0]):
+        export = "SurveyMonkey"
+        metadata_rows = [header_row + 1]
+        question = ""
+        for i, sub in enumerate((below[0] + [""] * width)[:width]):
+            question = header[i] or question
+            labels[i] = question if not sub or sub in _SURVEYMONKEY_MARKERS else f"{question} - {sub}"
+    else:
+        body = rows[header_row + 1 + MAX_METADATA_ROWS:]
+        numeric = _numeric_columns(body, width)
+        for offset, row in enumerate(below):
+            texts = [i for i in numeric if i < len(row) and row[i] and not _is_number(row[i])]
+            if not numeric or len(texts) <= len(numeric) / 2:
+                break
+            metadata_rows.append(header_row + 1 + offset)
+    labels = _unique_labels(labels)
+
+    body = rows[header_row + 1 + len(metadata_rows):]
+    # Empty trailing columns (a delimiter at the end of every line)
+    keep = width
+    while keep > 1 and not header[keep - 1] and not any(keep - 1 < len(row) and row[keep - 1] for row in body):
+        keep -= 1
+    usecols = labels[:keep] if keep < width else None
+
+    dtypes, date_formats = {}, {}
+    for i, label in enumerate(labels[:keep]):
+        values = [row[i] for row in body if i < len(row) and row[i]]
+        if not values:
+            continue
+        if kind == "csv" and any(_LEADING_ZERO_CODE.match(v) for v in values) and all(v.isdigit() for v in values):
+            dtypes[label] = str
+        elif all(_DATE_LIKE.match(v) for v in values):
+            sample = pd.Series(values)
+            for fmt in DATE_FORMATS:
+                if pd.to_datetime(sample, format=fmt, errors="coerce").notna().all():
+                    date_formats[label] = fmt
+                    break
+
+    # Decimal commas only when the delimiter is not a comma and no cell uses a point
+    cells = [cell for row in body for cell in row[:keep]]
+    decimal = "." if delimiter in (None, ",") or not any(map(_DECIMAL_COMMA.match, cells)) \
+        or any(map(_DECIMAL_POINT.match, cells)) else ","
+
+    return ReadPlan(kind, encoding=encoding, delimiter=delimiter, decimal=decimal, header_row=header_row,
+                    metadata_rows=metadata_rows, names=labels, usecols=usecols, dtypes=dtypes,
+                    date_formats=date_formats, export=export, question_text=question_text)
+
+
+_PLANS = OrderedDict()
+_PLANS_LOCK = threading.Lock()
+
+
+def _cached(key, build):
+    with _PLANS_LOCK:
+        if key in _PLANS:
+            _PLANS.move_to_end(key)
+            return _PLANS[key]
+    plan = build()
+    with _PLANS_LOCK:
+        _PLANS[key] = plan
+        while len(_PLANS) > PLAN_CACHE_SIZE:
+            _PLANS.popitem(last=False)
+    return plan
+
+
+def _read_bytes(file, limit=None):
+    if hasattr(file, "read"):
+        file.seek(0)
+        data = file.read() if limit is None else file.read(limit)
+        file.seek(0)
+        return data
+    with open(file, "rb") as handle:
+        return handle.read() if limit is None else handle.read(limit)
+
+
+def _csv_plan(sample, complete):
+    encoding = sniff_encoding(sample)
+    text = sample.decode(encoding, errors="replace")
+    if not complete:
+        # The last line may be cut by the end of the sample
+        text = text[:text.rfind("\n") + 1] or text
+    delimiter = sniff_delimiter(text)
+    return plan_from_rows(_parse_rows(text, delimiter), "csv", encoding=encoding, delimiter=delimiter)
+
+
+def _excel_plan(file):
+    head = pd.read_excel(file, header=None, nrows=SAMPLE_ROWS, dtype=object)
+    rows = [["" if pd.isna(cell) else str(cell) for cell in row] for row in head.itertuples(index=False)]
+    return plan_from_rows(rows, "excel")
+
+
+def plan_read(file, filename=None):
+    """
+    The ReadPlan of a survey file (a path or a binary file-like object);
+    `filename` decides the format when `file` has no usable name.
+    """
+    name = filename or getattr(file, "name", None) or str(file)
+    if name.lower().endswith(".csv"):
+        sample = _read_bytes(file, SAMPLE_BYTES + 1)
+        complete = len(sample) <= SAMPLE_BYTES
+        sample = sample[:SAMPLE_BYTES]
+        key = ("csv", hashlib.sha256(sample).hexdigest())
+        return _cached(key, lambda: _csv_plan(sample, complete))
+    key = ("excel", hashlib.sha256(_read_bytes(file)).hexdigest())
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return _cached(key, lambda: _excel_plan(file))
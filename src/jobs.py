@@ -0,0 +1,244 @@
+# jobs.py
+# Background execution of the ingestion -> inference -> cleaning pipeline
+# (or of reading archived waves), with progress reporting, cancellation and a
+# per-server concurrency cap.
+import io
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import data_clean as data_cleaner
+from memory_governor import estimate_upload
+from shared_store import PREVIEW_ROWS, MappedFrame, dataset_id_for
+from sql_store import SQL_BACKEND_MIN_ROWS, SurveyStore
+
+# Cleaning jobs allowed to run at the same time on one server; others queue
+MAX_CONCURRENT_JOBS = 2
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it has been cancelled."""
+
+
+class Job:
+    """
+    One background run. The worker reports progress through report(), which
+    is also where a pending cancellation is noticed and raised.
+    """
+
+    QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+    def __init__(self, job_id, name, key=None):
+        self.id = job_id
+        self.name = name
+        self.key = key
+        self.state = Job.QUEUED
+        self.stage = "Waiting for a free worker"
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def report(self, stage, fraction=None, message=""):
+        """Progress callback for the worker; raises JobCancelled if cancelled."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        with self._lock:
+            self.stage = stage
+            if fraction is not None:
+                self.progress = max(0.0, min(1.0, float(fraction)))
+            self.message = message
+
+    def cancel(self):
+        self._cancel.set()
+        with self._lock:
+            if self.state == Job.QUEUED:
+                self._finish(Job.CANCELLED)
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        return self.state in (Job.DONE, Job.FAILED, Job.CANCELLED)
+
+    def snapshot(self):
+        """Consistent (state, stage, progress, message) tuple for the UI."""
+        with self._lock:
+            return self.state, self.stage, self.progress, self.message
+
+    def wait(self, timeout=None, poll=0.1):
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.done:
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(poll)
+        return True
+
+    def _finish(self, state, result=None, error=None):
+        self.state = state
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+
+
+class JobRunner:
+    """Runs jobs on a bounded thread pool; extra submissions wait in a queue."""
+
+    def __init__(self, max_workers=MAX_CONCURRENT_JOBS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="clean-job")
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, name="job", key=None, **kwargs):
+        """Queues func(job, *args, **kwargs) and returns its Job."""
+        job = Job(next(self._ids), name, key)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        with job._lock:
+            if job.cancelled:
+                if not job.done:
+                    job._finish(Job.CANCELLED)
+                return
+            job.state = Job.RUNNING
+        try:
+            result = func(job, *args, **kwargs)
+        except JobCancelled:
+            job._finish(Job.CANCELLED)
+        except Exception as e:
+            job._finish(Job.FAILED, error=e)
+        else:
+            job._finish(Job.DONE, result=result)
+        finally:
+            self._forget_finished()
+
+    def _forget_finished(self, keep_seconds=3600):
+        now = time.time()
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values()
+                           if j.done and j.finished_at and now - j.finished_at > keep_seconds]:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def queue_position(self, job):
+        """Number of queued jobs submitted before this one (0 = next in line)."""
+        with self._lock:
+            return sum(1 for j in self._jobs.values()
+                       if j.state == Job.QUEUED and j.id < job.id)
+
+    def running_count(self):
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j.state == Job.RUNNING)
+
+
+def discard_job(job, governor=None):
+    """
+    Cancels a job and releases the shared dataset lease its result holds, if
+    any, and its memory accounting with `governor`.
+    """
+    job.cancel()
+    lease = (job.result or {}).get("artifacts", {}).get("dataset_lease")
+    if lease is not None:
+        lease.release()
+    if governor is not None:
+        governor.release(job)
+
+
+def _registered(governor, job, result):
+    if governor is not None:
+        governor.register(job, result)
+    return result
+
+
+# --- The cleaning pipeline as a job ---
+
+def cleaning_job(job, file_bytes, filename, use_sql_store=None, shared_store=None, governor=None):
+    """
+    Reads an uploaded file and cleans it, reporting each stage.
+    Returns {"df", "cleaned_df", "category_df", "artifacts"}.
+
+    Large surveys (or any, with use_sql_store=True) are also loaded into an
+    SQLite query store, kept as artifacts["sql_store"]. Their cleaned rows
+    then stay on disk: "cleaned_df" is a shared_store.MappedFrame that reads
+    columns on demand, and "df" only the raw preview rows.
+
+    With a `shared_store`, a file that someone already cleaned is attached
+    instead of cleaned again, and a new one is published for the next viewer;
+    "df" is then only the raw preview rows and artifacts["dataset_lease"]
+    holds the lease.
+
+    With a `governor` (memory_governor.MemoryGovernor), cleaning waits until
+    the upload's estimated footprint fits the memory budget (or fails with
+    MemoryBudgetExceeded), and the result is registered for accounting.
+    """
+    if shared_store is not None:
+        dataset_id = dataset_id_for(file_bytes, filename)
+        job.report("Looking for a shared copy", 0.0, filename)
+        lease = shared_store.attach(dataset_id)
+        if lease is not None:
+            job.report("Done", 1.0, "Attached to the shared dataset")
+            return _registered(governor, job, {"df": lease.preview_df, "cleaned_df": lease.cleaned_df,
+                                               "category_df": lease.category_df, "artifacts": lease.artifacts()})
+
+    if governor is not None:
+        governor.admit(job, estimate_upload(len(file_bytes), filename), wait=job.report)
+    try:
+        job.report("Reading file", 0.0, filename)
+        artifacts = {}
+        df = data_cleaner.read_survey_file(io.BytesIO(file_bytes), filename, artifacts=artifacts)
+
+        cleaned_df, category_df = data_cleaner.process_and_analyze_data(
+            df.copy(), artifacts=artifacts, progress=job.report
+        )
+
+        if use_sql_store is None:
+            use_sql_store = len(cleaned_df) >= SQL_BACKEND_MIN_ROWS
+        if use_sql_store:
+            datetime_cols = category_df.loc[category_df["Inferred Type"] == "Datetime", "Column Name"]
+            date_col = datetime_cols.iloc[0] if not datetime_cols.empty else None
+            artifacts["sql_store"] = SurveyStore().load(cleaned_df, category_df, date_col, progress=job.report)
+            # The store serves the aggregates; the rows are read back a column at a time
+            job.report("Moving rows to disk", 1.0)
+            cleaned_df = MappedFrame.write(cleaned_df)
+            df = df.head(PREVIEW_ROWS)
+
+        if shared_store is not None:
+            job.report("Publishing for other viewers", 1.0)
+            lease = shared_store.publish(dataset_id, cleaned_df, category_df,
+                                         preview_df=df.head(PREVIEW_ROWS), artifacts=artifacts)
+            artifacts = lease.artifacts()
+            df = lease.preview_df
+    except BaseException:
+        # Failed or cancelled: give back the admitted memory
+        if governor is not None:
+            governor.release(job)
+        raise
+    job.report("Done", 1.0)
+    return _registered(governor, job, {"df": df, "cleaned_df": cleaned_df, "category_df": category_df,
+                                       "artifacts": artifacts})
+
+
+def archive_job(job, archive, surveys=None, start=None, end=None, governor=None):
+    """
+    Opens archived waves (already cleaned) for the dashboard, returning the
+    same dict as cleaning_job; "df" is the first rows of the combined waves.
+    """
+    job.report("Reading the archive", 0.0, ", ".join(surveys or archive.surveys()))
+    cleaned_df, category_df, weight_column = archive.open(surveys, start, end)
+    job.report("Done", 1.0, f"{len(cleaned_df):,} archived responses")
+    return _registered(governor, job, {"df": cleaned_df.head(PREVIEW_ROWS), "cleaned_df": cleaned_df,
+                                       "category_df": category_df, "artifacts": {"weight_column": weight_column}})
@@ -0,0 +1,43 @@
+# lazy_imports.py
+# Loads heavy optional backends (plotly, wordcloud, matplotlib, ...) on first
+# use and records how long each import took.
+import importlib
+import sys
+import threading
+import time
+
+import pandas as pd
+
+_lock = threading.Lock()
+_import_times = {}   # module name -> (seconds, first requester)
+
+
+def lazy_import(name, requested_by=None):
+    """
+    Imports a module the first time it is asked for and returns it.
+
+    The wall time of that first import is recorded for import_report().
+    Modules that were already imported elsewhere are recorded with 0 s.
+    """
+    module = sys.modules.get(name)
+    if module is not None and name in _import_times:
+        return module
+
+    with _lock:
+        if name in _import_times:
+            return sys.modules[name]
+        already_loaded = name in sys.modules
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        elapsed = 0.0 if already_loaded else time.perf_counter() - start
+        _import_times[name] = (elapsed, requested_by)
+    return module
+
+
+def import_report():
+    """Returns a dataframe of lazily loaded modules and their import times."""
+    rows = [
+        {"Module": name, "Import Time (ms)": round(seconds * 1000, 1), "First Used By": who or ""}
+        for name, (seconds, who) in _import_times.items()
+    ]
+    return pd.DataFrame(rows, columns=["Module", "Import Time (ms)", "First Used By"])
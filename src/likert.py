@@ -0,0 +1,209 @@
+# likert.py
+# Likert scoring engine: maps responses onto an ordered scale once (int8
+# codes), then computes mean score, top-2-box, net score and trends as
+# vectorized operations over those codes.
+import re
+
+import numpy as np
+import pandas as pd
+
+from data_clean import LIKERT_OPTIONS
+from segments import encode_categories
+
+NEUTRAL_WORDS = ("neutral", "neither", "no opinion", "undecided", "unsure")
+_NEGATIVE = re.compile(r"\b(dis|un|not\b|never|poor|bad|worse|worst|terrible|awful|hate)")
+_STRONG = re.compile(r"\b(strongly|very|extremely|completely|totally)\b")
+_MILD = re.compile(r"\b(somewhat|slightly|a little|mostly|fairly)\b")
+
+# Upper ends of numeric rating scales; a scale nobody answered at the top of still ends there
+USUAL_SCALE_MAXIMA = (5, 7, 10)
+# Header of a 0–10 "how likely are you to recommend" question
+_NPS_HEADER = re.compile(r"recommend|\bnps\b|net promoter", re.IGNORECASE)
+
+# Scales learned from unknown label sets, reused for every column with the same labels
+_learned_scales = {}
+
+
+class LikertEncoding:
+    """
+    Ordinal codes for one Likert column.
+
+    codes  : int8 array, one entry per row (-1 = missing / not on the scale)
+    labels : scale labels ordered from most negative to most positive
+    values : score of each label (1..k for text scales, the number for numeric ones)
+    kind   : "known", "numeric" or "learned"
+    """
+
+    def __init__(self, codes, labels, values, kind):
+        self.codes = codes
+        self.labels = labels
+        self.values = np.asarray(values, dtype=np.float64)
+        self.kind = kind
+
+    @property
+    def n_points(self):
+        return len(self.labels)
+
+    @property
+    def is_nps(self):
+        """0–10 "how likely are you to recommend" style scale (a 1–10 rating is not one)."""
+        return self.kind == "numeric" and self.values[0] == 0 and self.values[-1] == 10
+
+
+def _normalize(label):
+    return str(label).strip().lower()
+
+
+def _polarity(label):
+    """Signed position of a label: negative < neutral (0) < positive."""
+    text = _normalize(label)
+    if any(word in text for word in NEUTRAL_WORDS):
+        return 0.0
+    strength = 2.0 if _STRONG.search(text) else 1.0 if _MILD.search(text) else 1.5
+    return -strength if _NEGATIVE.search(text) else strength
+
+
+def learn_scale(labels):
+    """Orders an unknown set of labels by polarity words (cached per label set)."""
+    key = frozenset(_normalize(l) for l in labels)
+    if key not in _learned_scales:
+        _learned_scales[key] = sorted(key, key=lambda l: (_polarity(l), l))
+    return _learned_scales[key]
+
+
+def numeric_scale(observed, nps_hint=False):
+    """
+    Every point of an integer rating scale, answered or not: from 0 (when
+    answered, or for an NPS question) or 1 up to the next usual maximum.
+    Non-integer values keep only the observed points.
+    """
+    ordered = np.sort(np.unique(observed))
+    if not np.all(ordered == np.round(ordered)):
+        return ordered
+    low = 0 if ordered[0] <= 0 or (nps_hint and ordered[-1] <= 10) else 1
+    low = min(low, ordered[0])
+    high = next((m for m in USUAL_SCALE_MAXIMA if m >= ordered[-1]), ordered[-1])
+    return np.arange(low, high + 1, dtype=np.float64)
+
+
+def scale_for(uniques, nps_hint=False):
+    """
+    Returns (ordered normalized labels, values, kind) for a column's unique values:
+    numbers span their whole scale (see numeric_scale), label sets that fit a
+    known scale use it, anything else gets a learned order.
+    """
+    numeric = pd.to_numeric(pd.Series(uniques, dtype=object), errors="coerce")
+    if len(uniques) and numeric.notna().all():
+        ordered = numeric_scale(numeric.to_numpy(dtype=np.float64), nps_hint)
+        return [_normalize(f"{v:g}") for v in ordered], ordered, "numeric"
+
+    normalized = {_normalize(u) for u in uniques}
+    fitting = [scale for scale in LIKERT_OPTIONS if normalized <= set(scale)]
+    if fitting:
+        scale = min(fitting, key=len)
+        return list(scale), np.arange(1, len(scale) + 1), "known"
+
+    scale = learn_scale(normalized)
+    return scale, np.arange(1, len(scale) + 1), "learned"
+
+
+def encode_likert(series):
+    """Maps a Likert column to ordinal int8 codes (one pass over unique values)."""
+    categories = encode_categories(series)
+    uniques = list(categories.labels)
+    labels, values, kind = scale_for(uniques, nps_hint=bool(_NPS_HEADER.search(str(series.name))))
+    # int8 covers every real Likert scale; wider only if a user override forces it
+    code_dtype = np.int8 if len(labels) < 128 else np.int16
+
+    if kind == "numeric":
+        position = {float(v): i for i, v in enumerate(values)}
+        lookup = np.array([position[float(u)] for u in pd.to_numeric(pd.Series(uniques, dtype=object))],
+                          dtype=code_dtype)
+        display_labels = [f"{v:g}" for v in values]
+    else:
+        position = {label: i for i, label in enumerate(labels)}
+        lookup = np.array([position.get(_normalize(u), -1) for u in uniques], dtype=code_dtype)
+        # Show labels the way they were written in the data when possible
+        written = {}
+        for u in uniques:
+            written.setdefault(_normalize(u), str(u))
+        display_labels = [written.get(label, label.capitalize()) for label in labels]
+
+    codes = np.full(len(categories.codes), -1, dtype=code_dtype)
+    present = categories.codes >= 0
+    if len(lookup):
+        codes[present] = lookup[categories.codes[present]]
+    return LikertEncoding(codes, display_labels, values, kind)
+
+
+# --- Vectorized metrics ---
+
+def score_counts(encoding, row_mask=None, weights=None):
+    """Responses per scale point (weighted if weights are given)."""
+    valid = encoding.codes >= 0
+    if row_mask is not None:
+        valid &= np.asarray(row_mask, dtype=bool)
+    w = None if weights is None else np.asarray(weights, dtype=np.float64)[valid]
+    return np.bincount(encoding.codes[valid], weights=w, minlength=encoding.n_points).astype(np.float64)
+
+
+def likert_metrics(counts, encoding):
+    """
+    Mean score, top-2-box %, bottom-2-box % and net score from per-point counts.
+    `counts` may be 1-D (one distribution) or 2-D (one row per date bucket).
+    NPS scales use promoters (9–10) minus detractors (0–6) as the net score.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    values = encoding.values
+    n = counts.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (counts * values).sum(axis=-1) / n
+        if encoding.is_nps:
+            top = counts[..., values >= 9].sum(axis=-1) / n
+            bottom = counts[..., values <= 6].sum(axis=-1) / n
+        else:
+            box = 2 if encoding.n_points >= 5 else 1
+            top = counts[..., -box:].sum(axis=-1) / n
+            bottom = counts[..., :box].sum(axis=-1) / n
+    return {
+        "Responses": n,
+        "Mean Score": mean,
+        "Top-2 Box %": top * 100,
+        "Bottom-2 Box %": bottom * 100,
+        "Net Score": (top - bottom) * 100,
+    }
+
+
+def likert_trend(encoding, dates, row_mask=None, freq="D", weights=None):
+    """
+    Metrics per date bucket from one 2-D bincount over (bucket, scale point).
+    Returns a dataframe with a 'Date' column plus the likert_metrics() columns.
+    """
+    buckets = pd.to_datetime(dates, errors="coerce").dt.floor(freq).to_numpy()
+    valid = (encoding.codes >= 0) & ~pd.isna(buckets)
+    if row_mask is not None:
+        valid &= np.asarray(row_mask, dtype=bool)
+    bucket_codes, bucket_labels = pd.factorize(buckets[valid], sort=True)
+    k = encoding.n_points
+    flat = bucket_codes.astype(np.int64) * k + encoding.codes[valid]
+    w = None if weights is None else np.asarray(weights, dtype=np.float64)[valid]
+    counts = np.bincount(flat, weights=w, minlength=len(bucket_labels) * k).reshape(-1, k)
+
+    trend = pd.DataFrame(likert_metrics(counts, encoding))
+    trend.insert(0, "Date", bucket_labels)
+    return trend
+
+
+def distribution_frame(counts, encoding):
+    """'Label'/'Count'/'Percent'/'Side' frame ordered along the scale."""
+    counts = np.asarray(counts, dtype=np.float64)
+    total = counts.sum()
+    percent = counts / total * 100 if total else np.zeros_like(counts)
+    k = encoding.n_points
+    if encoding.is_nps:
+        side = np.where(encoding.values <= 6, "negative", np.where(encoding.values >= 9, "positive", "neutral"))
+    else:
+        middle = (k - 1) / 2
+        position = np.arange(k)
+        side = np.where(position < middle, "negative", np.where(position > middle, "positive", "neutral"))
+    return pd.DataFrame({"Label": encoding.labels, "Count": counts, "Percent": percent, "Side": side})
@@ -0,0 +1,390 @@
+# memory_governor.py
+# Per-session memory accounting for the dashboard server, with admission
+# control for new uploads and spill-to-disk of idle sessions.
+#
+# Every finished job (one per session: the raw preview, the cleaned frame
+# and the cleaning artifacts) is registered with the governor, which
+# measures what it holds. Objects shared between sessions (a dataset
+# attached from the shared store) are counted once. Against a global budget:
+#   - an upload is admitted when its estimated footprint fits; otherwise
+#     idle sessions are spilled to make room, and if that is not enough the
+#     job waits for memory (and is rejected when it could never fit, or
+#     when no room frees up within ADMISSION_TIMEOUT_SECONDS);
+#   - a spilled session's frames are written to Arrow IPC files and its
+#     caches dropped (the dashboard rebuilds those lazily); the frames are
+#     memory-mapped back the next time the session is used.
+import os
+import sys
+import tempfile
+import threading
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from lazy_imports import lazy_import
+from shared_store import MappedFrame, frame_from_table, frame_to_table
+
+# Overrides the memory budget (in MB)
+MEMORY_BUDGET_ENV = "SURVEY_MEMORY_BUDGET_MB"
+# Overrides the directory spilled sessions are written to
+SPILL_DIR_ENV = "SURVEY_SPILL_DIR"
+# Budget when not configured: this share of physical memory
+DEFAULT_BUDGET_SHARE = 0.5
+# Sessions unused for this long may be spilled
+COLD_AFTER_SECONDS = 120
+# Uploads wait at most this long for memory to free up
+ADMISSION_TIMEOUT_SECONDS = 600
+# Memory held after cleaning, per byte of uploaded file (raw + cleaned frames
+# and artifacts, measured on typical exports; xlsx files are zip-compressed)
+UPLOAD_EXPANSION = {".csv": 8, ".xlsx": 16}
+# A session's footprint is measured again when used, at most this often
+REMEASURE_SECONDS = 30
+# Artifacts the dashboard rebuilds on demand, dropped when a session is spilled
+SPILLED_ARTIFACTS = ("category_codes", "segment_cubes", "likert_codes", "relationships", "text_indexes",
+                     "sentiment", "key_phrases", "time_buckets", "weighted_numeric_summaries", "redactors",
+                     "topics", "wave_file")
+
+_MB = 1024 * 1024
+# Items of a container measured one by one; larger ones are extrapolated from a sample
+_SAMPLED_ITEMS = 2000
+
+
+class MemoryBudgetExceeded(Exception):
+    """An upload that cannot fit in the server's memory budget."""
+
+
+def default_budget():
+    """Budget in bytes: SURVEY_MEMORY_BUDGET_MB, else half of physical memory."""
+    configured = os.environ.get(MEMORY_BUDGET_ENV)
+    if configured:
+        return int(float(configured) * _MB)
+    try:
+        physical = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        physical = 8 * 1024 * _MB
+    return int(physical * DEFAULT_BUDGET_SHARE)
+
+
+def default_spill_dir():
+    base = os.environ.get(SPILL_DIR_ENV) or os.path.join(tempfile.gettempdir(), "survey_cleaner_spill")
+    os.makedirs(base, exist_ok=True)
+    return base
+
+
+def estimate_upload(size, filename=""):
+    """Expected bytes held once an upload of `size` bytes is cleaned."""
+    return int(size * UPLOAD_EXPANSION.get(os.path.splitext(filename)[1].lower(), max(UPLOAD_EXPANSION.values())))
+
+
+def frame_footprint(df):
+    """
+    Bytes held by a dataframe, counting object (text) values. Unlike
+    DataFrame.memory_usage(deep=True) this also handles sparse text columns.
+    A MappedFrame only holds its index (the rows are in a mapped file).
+    """
+    total = df.index.memory_usage(deep=True)
+    if isinstance(df, MappedFrame):
+        return int(total)
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.SparseDtype):
+            array = series.array
+            total += (pd.Series(array.sp_values).memory_usage(deep=True, index=False)
+                      + array.sp_index.indices.nbytes)
+        else:
+            total += series.memory_usage(deep=True, index=False)
+    return int(total)
+
+
+def object_footprint(obj, seen=None, depth=0):
+    """Approximate bytes held by a cleaning artifact (frames, arrays, indexes, caches)."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen or depth > 6:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return frame_footprint(obj)
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return frame_footprint(obj.to_frame()) if isinstance(obj, pd.Series) else int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return int(pd.Series(obj.ravel()).memory_usage(deep=True, index=False))
+        return obj.nbytes
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return sys.getsizeof(obj)
+    if isinstance(obj, (dict, list, tuple, set, frozenset)):
+        items = list(obj.items()) if isinstance(obj, dict) else list(obj)
+        # Large containers (e.g. redaction maps over millions of values) are sampled
+        sample = items if len(items) <= _SAMPLED_ITEMS else items[::len(items) // _SAMPLED_ITEMS]
+        sampled = sum(object_footprint(item, seen, depth + 1) for item in sample)
+        return sys.getsizeof(obj) + int(sampled * len(items) / max(len(sample), 1))
+    if hasattr(obj, "__dict__") and not callable(obj):
+        return sys.getsizeof(obj) + object_footprint(vars(obj), seen, depth + 1)
+    return sys.getsizeof(obj)
+
+
+def _holdings(result):
+    """{id: bytes} of the top-level objects a job result holds."""
+    holdings = {}
+    for key in ("df", "cleaned_df"):
+        frame = result.get(key)
+        if frame is not None:
+            holdings[id(frame)] = frame_footprint(frame)
+    for key, value in result.get("artifacts", {}).items():
+        if key == "dataset_lease":
+            continue     # its frames are the result's own
+        holdings[id(value)] = object_footprint(value)
+    return holdings
+
+
+class _Session:
+    """Accounting of one registered job."""
+
+    def __init__(self, job):
+        self.job_ref = weakref.ref(job)
+        self.job_id = job.id
+        self.name = job.name
+        self.holdings = {}          # id of each object held -> bytes
+        self.measured_at = 0.0
+        self.last_access = time.time()
+        self.spill_paths = None     # {"df": path, "cleaned_df": path} while spilled
+
+    @property
+    def footprint(self):
+        return sum(self.holdings.values())
+
+
+class MemoryGovernor:
+    """Tracks what each session holds, admits uploads and spills idle sessions."""
+
+    def __init__(self, budget=None, spill_dir=None, cold_after=COLD_AFTER_SECONDS, shared_store=None):
+        self.budget = budget or default_budget()
+        self.spill_dir = spill_dir or default_spill_dir()
+        self.cold_after = cold_after
+        self.shared_store = shared_store
+        self._sessions = {}         # job id -> _Session
+        self._reserved = {}         # job id -> (name, bytes) admitted but not yet registered
+        self._spills = 0
+        self._rejected = 0
+        self._lock = threading.RLock()
+
+    # --- Accounting ---
+
+    def _prune(self):
+        for job_id in [j for j, s in self._sessions.items() if s.job_ref() is None]:
+            self._drop(job_id)
+
+    def _measure(self, session, result):
+        session.holdings = _holdings(result)
+        session.measured_at = time.time()
+
+    def used(self):
+        """Bytes held by registered sessions (shared objects once) plus admitted reservations."""
+        with self._lock:
+            self._prune()
+            distinct = {}
+            for session in self._sessions.values():
+                distinct.update(session.holdings)
+            return sum(distinct.values()) + sum(nbytes for _, nbytes in self._reserved.values())
+
+    def available(self):
+        return self.budget - self.used()
+
+    def _exclusive_bytes(self, session):
+        """Bytes only this session holds (what spilling it frees)."""
+        others = {obj_id for s in self._sessions.values() if s is not session for obj_id in s.holdings}
+        return sum(nbytes for obj_id, nbytes in session.holdings.items() if obj_id not in others)
+
+    # --- Admission ---
+
+    def admit(self, job, estimate, wait=None, timeout=ADMISSION_TIMEOUT_SECONDS, poll=1.0):
+        """
+        Reserves `estimate` bytes for a job, spilling idle sessions to make
+        room and otherwise waiting for memory. `wait(stage, fraction, message)`
+        is called while waiting (a job's report(), which raises if cancelled).
+        Raises MemoryBudgetExceeded when the job can never fit or times out.
+        """
+        if estimate > self.budget:
+            with self._lock:
+                self._rejected += 1
+            raise MemoryBudgetExceeded(
+                f"This file needs about {estimate / _MB:,.0f} MB once cleaned, more than the server's "
+                f"memory budget of {self.budget / _MB:,.0f} MB.")
+        deadline = time.time() + timeout
+        while True:
+            # Checking the room and reserving it is one step, so concurrent
+            # uploads cannot both claim the same free memory
+            if self._reserve(job, estimate):
+                return
+            self.spill_cold(estimate - self.available())
+            if self._reserve(job, estimate):
+                return
+            if time.time() > deadline:
+                with self._lock:
+                    self._rejected += 1
+                raise MemoryBudgetExceeded(
+                    f"The server is out of memory for this file (needs about {estimate / _MB:,.0f} MB, "
+                    f"{max(self.available(), 0) / _MB:,.0f} MB free). Try again later.")
+            if wait is not None:
+                wait("Waiting for memory", 0.0,
+                     f"needs ~{estimate / _MB:,.0f} MB, {max(self.available(), 0) / _MB:,.0f} MB free")
+            time.sleep(poll)
+
+    def _reserve(self, job, estimate):
+        """Reserves `estimate` bytes if they are free right now; returns whether it did."""
+        with self._lock:
+            if estimate > self.available():
+                return False
+            self._reserved[job.id] = (job.name, estimate)
+            return True
+
+    def register(self, job, result):
+        """Starts accounting a finished job's result (replacing its reservation)."""
+        with self._lock:
+            self._reserved.pop(job.id, None)
+            session = self._sessions.get(job.id) or _Session(job)
+            self._sessions[job.id] = session
+            self._measure(session, result)
+            session.last_access = time.time()
+
+    def release(self, job):
+        """Stops accounting a job (its session discarded it) and removes its spill files."""
+        with self._lock:
+            self._reserved.pop(job.id, None)
+            self._drop(job.id)
+
+    def _drop(self, job_id):
+        session = self._sessions.pop(job_id, None)
+        for path in (session.spill_paths or {}).values() if session is not None else ():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # --- Spill / reload ---
+
+    def touch(self, job):
+        """
+        Marks a session as in use and returns its result, reloading spilled
+        frames first. Unregistered jobs are returned untouched.
+        """
+        with self._lock:
+            session = self._sessions.get(job.id)
+            if session is None:
+                return job.result
+            session.last_access = time.time()
+            if session.spill_paths is not None:
+                self._reload(job, session)
+            elif time.time() - session.measured_at > REMEASURE_SECONDS:
+                # Lazy caches (cubes, indexes, ...) grow as the session is used
+                self._measure(session, job.result)
+            return job.result
+
+    def spill_cold(self, needed):
+        """Spills the longest-idle sessions until `needed` bytes are freed; returns the bytes freed."""
+        freed = 0
+        now = time.time()
+        with self._lock:
+            self._prune()
+            cold = sorted((s for s in self._sessions.values()
+                           if s.spill_paths is None and now - s.last_access >= self.cold_after),
+                          key=lambda s: s.last_access)
+        for session in cold:
+            if freed >= needed:
+                break
+            freed += self.spill(session.job_ref())
+        return freed
+
+    def spill(self, job):
+        """
+        Writes a session's frames to disk and drops them (and its rebuildable
+        caches) from memory. The whole spill holds the lock, so the session
+        cannot be reloaded, spilled twice or measured halfway through.
+        """
+        with self._lock:
+            session = self._sessions.get(job.id) if job is not None else None
+            if session is None or session.spill_paths is not None or job.result is None:
+                return 0
+            freed = self._exclusive_bytes(session)
+            pa = lazy_import("pyarrow", requested_by="memory governor")
+            lazy_import("pyarrow.ipc", requested_by="memory governor")
+            result = job.result
+            paths = {}
+            for key in ("df", "cleaned_df"):
+                frame = result.get(key)
+                if frame is None or isinstance(frame, MappedFrame):
+                    continue     # already on disk
+                path = os.path.join(self.spill_dir, f"{os.getpid()}-{job.id}-{key}.arrow")
+                default_index = (isinstance(frame.index, pd.RangeIndex) and frame.index.start == 0
+                                 and frame.index.step == 1)
+                table = frame_to_table(frame, {"index": None if default_index else frame.index.tolist()})
+                with pa.OSFile(path, "wb") as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+                paths[key] = path
+
+            artifacts = result.get("artifacts", {})
+            for key in SPILLED_ARTIFACTS:
+                artifacts.pop(key, None)
+            lease = artifacts.pop("dataset_lease", None)
+            if lease is not None:
+                lease.release()
+            for key in paths:
+                result[key] = None
+            session.spill_paths = paths
+            self._measure(session, result)
+            self._spills += 1
+        if self.shared_store is not None:
+            self.shared_store.drop_unattached()
+        return freed
+
+    def _reload(self, job, session):
+        """Maps a spilled session's frames back (called with the lock held, like spill())."""
+        pa = lazy_import("pyarrow", requested_by="memory governor")
+        lazy_import("pyarrow.ipc", requested_by="memory governor")
+        frames = {}
+        for key, path in session.spill_paths.items():
+            # Memory-mapped: gap-free numeric columns are not copied
+            frame, meta = frame_from_table(pa.ipc.open_file(pa.memory_map(path, "r")).read_all())
+            if meta.get("index") is not None:
+                frame.index = meta["index"]
+            frames[key] = frame
+        job.result.update(frames)
+        paths, session.spill_paths = session.spill_paths, None
+        self._measure(session, job.result)
+        for path in paths.values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # --- Admin view ---
+
+    def stats(self):
+        """Budget, usage and counters for the admin view."""
+        used = self.used()
+        with self._lock:
+            return {"Budget (MB)": self.budget / _MB, "Used (MB)": used / _MB,
+                    "Reserved (MB)": sum(n for _, n in self._reserved.values()) / _MB,
+                    "Sessions": len(self._sessions),
+                    "Spilled": sum(s.spill_paths is not None for s in self._sessions.values()),
+                    "Spills": self._spills, "Rejected Uploads": self._rejected}
+
+    def report(self):
+        """One row per session (and pending reservation) with its footprint and state."""
+        now = time.time()
+        with self._lock:
+            self._prune()
+            rows = [{"Job": s.job_id, "File": s.name,
+                     "State": "spilled to disk" if s.spill_paths is not None else "in memory",
+                     "Footprint (MB)": round(s.footprint / _MB, 2),
+                     "Freed if Spilled (MB)": round(self._exclusive_bytes(s) / _MB, 2),
+                     "Idle (s)": round(now - s.last_access)}
+                    for s in self._sessions.values()]
+            rows += [{"Job": job_id, "File": name, "State": "admitted, cleaning",
+                      "Footprint (MB)": round(nbytes / _MB, 2), "Freed if Spilled (MB)": 0.0, "Idle (s)": 0}
+                     for job_id, (name, nbytes) in self._reserved.items()]
+        return pd.DataFrame(rows, columns=["Job", "File", "State", "Footprint (MB)", "Freed if Spilled (MB)",
+                                           "Idle (s)"])
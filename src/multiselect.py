@@ -0,0 +1,121 @@
+# multiselect.py
+# Detection and expansion of "select all that apply" columns, where one cell
+# holds several options joined by a delimiter (e.g. "Email, Phone").
+#
+# Everything works on the *unique* cell values: each distinct combination is
+# split once, turned into a row of an option-indicator matrix, and rows are
+# mapped onto it through integer codes. No per-row string splitting.
+#
+# The delimiter is detected once per column, on the whole cleaned column
+# (data_clean stores it as artifacts["delimiters"]), and passed in explicitly:
+# a filtered subset can be too small to detect it again.
+import numpy as np
+import pandas as pd
+
+from aggregates import present_values, weights_for
+
+MULTISELECT_DELIMITERS = [",", ";", "|"]
+
+
+def _unique_options(uniques, delimiter):
+    """Splits unique cell values once; returns (unique position, option) pairs."""
+    exploded = pd.Series(uniques, dtype=object).astype(str).str.split(delimiter, regex=False).explode()
+    exploded = exploded.str.strip()
+    exploded = exploded[exploded != ""]
+    return exploded.index.to_numpy(), exploded.to_numpy(dtype=object)
+
+
+def detect_delimiter(series, max_options=30, min_share=0.2, max_option_length=30,
+                     max_option_words=5, min_recurring=0.5, max_combinations=5000):
+    """
+    Returns the delimiter of a multi-select column, or None if it is not one.
+
+    A column qualifies when, for some delimiter:
+      - at least `min_share` of the answers contain it,
+      - the split produces between 2 and `max_options` distinct short options,
+      - at least `min_recurring` of the options show up in more than one
+        distinct combination (free-text commas almost never repeat).
+    Columns with more than `max_combinations` distinct answers are rejected
+    before any splitting, which keeps the check cheap on free-text columns.
+    """
+    if isinstance(series.dtype, pd.SparseDtype):
+        if not pd.api.types.is_object_dtype(series.dtype.subtype):
+            return None
+    elif not pd.api.types.is_object_dtype(series):
+        return None
+    counts = present_values(series).astype(str).value_counts()
+    if counts.empty or len(counts) > max_combinations:
+        return None
+    uniques = counts.index.to_numpy(dtype=object)
+    weights = counts.to_numpy()
+    total = weights.sum()
+
+    for delimiter in MULTISELECT_DELIMITERS:
+        has_delim = counts.index.str.contains(delimiter, regex=False)
+        if weights[has_delim].sum() / total < min_share:
+            continue
+
+        unique_pos, options = _unique_options(uniques, delimiter)
+        option_series = pd.Series(options)
+        n_options = option_series.nunique()
+        if not 2 <= n_options <= max_options:
+            continue
+        if option_series.str.len().mean() > max_option_length:
+            continue
+        if option_series.str.count(" ").mean() + 1 > max_option_words:
+            continue
+
+        # In how many distinct combinations does each option appear?
+        combos_per_option = pd.Series(unique_pos).groupby(options).nunique()
+        if (combos_per_option > 1).mean() >= min_recurring:
+            return delimiter
+    return None
+
+
+def is_multiselect(series):
+    return detect_delimiter(series) is not None
+
+
+def _indicator_parts(series, delimiter):
+    """Row codes into the uniques, plus the (uniques x options) indicator matrix."""
+    codes, uniques = pd.factorize(series)
+    unique_pos, options = _unique_options(uniques, delimiter)
+    option_codes, option_names = pd.factorize(options)
+    unique_matrix = np.zeros((len(uniques), len(option_names)), dtype=bool)
+    unique_matrix[unique_pos, option_codes] = True
+    return codes, unique_matrix, list(option_names)
+
+
+def column_delimiter(series):
+    """Delimiter of a whole multi-select column (the first candidate if none is detected)."""
+    return detect_delimiter(series) or MULTISELECT_DELIMITERS[0]
+
+
+def column_delimiters(df, columns):
+    """{column: delimiter} for the multi-select columns of a cleaned dataframe."""
+    return {col: column_delimiter(df[col]) for col in columns if col in df.columns}
+
+
+def option_frequencies(series, delimiter, weights=None):
+    """
+    Returns an 'Option'/'Count'/'Percent' dataframe, where Percent is the
+    share of respondents (non-empty answers) who picked each option.
+    Counts are a single matrix product of per-combination counts and the
+    indicator matrix; `weights` (a series sharing the index) weights them.
+    `delimiter` is the one detected on the whole column (see column_delimiter),
+    also when `series` is a filtered subset of it.
+    """
+    series = present_values(series)
+    codes, unique_matrix, options = _indicator_parts(series, delimiter)
+    valid = codes >= 0
+    w = None if weights is None else weights_for(weights, series.index)[valid]
+    combo_counts = np.bincount(codes[valid], weights=w, minlength=len(unique_matrix))
+    option_counts = combo_counts @ unique_matrix
+    respondents = combo_counts.sum()
+
+    freq = pd.DataFrame({
+        "Option": options,
+        "Count": option_counts,
+        "Percent": option_counts / respondents * 100 if respondents else 0.0,
+    })
+    return freq.sort_values(by="Count", ascending=False, ignore_index=True)
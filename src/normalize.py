@@ -0,0 +1,264 @@
+# normalize.py
+# Categorical value normalization: clusters spelling variants of the same
+# answer ("Yes", "yes ", "Y", "Yess") and maps every row to one canonical
+# spelling.
+#
+# Only the unique values of a column are compared: exact variants are merged
+# through a canonical key (case, spaces, punctuation), the remaining keys are
+# compared in batches with rapidfuzz similarity matrices ("City, ST" values
+# also join the plain city), and rows are mapped through a code lookup, so
+# the cost does not depend on the number of rows. Opposite answers are never
+# merged: keys are compared word by word for negations ("strongly agree" /
+# "strongly disagree", "satisfied" / "not satisfied") and antonyms.
+import re
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+import aggregates
+from multiselect import detect_delimiter
+
+# Two canonical keys at or above this rapidfuzz ratio are the same answer
+NORMALIZE_SIMILARITY = 85
+# A variant must be at most this share of the more common spelling to be merged;
+# two common answers ("satisfied" / "unsatisfied") are never collapsed
+MAX_VARIANT_SHARE = 0.2
+# Columns with more distinct values than this (free text, IDs) are skipped
+MAX_NORMALIZE_UNIQUES = 2000
+# Longer answers are free text, not categories
+MAX_NORMALIZE_MEAN_LENGTH = 40
+# Rows of the similarity matrix computed at a time
+NORMALIZE_BATCH = 512
+# Keys this short ("Mr" / "Ms" / "Mrs") are distinct answers one letter apart:
+# two of them only merge on the same canonical key, never by similarity
+SHORT_KEY_LENGTH = 3
+
+_NEGATION_PREFIXES = ("dis", "un", "in", "im", "ir", "non")
+# Words that negate the answer they are added to ("not satisfied")
+_NEGATION_WORDS = frozenset({"not", "no", "never", "non", "without"})
+# Opposite words that are never spelling variants of each other
+_ANTONYMS = {frozenset(pair) for pair in [
+    ("yes", "no"), ("true", "false"), ("good", "bad"), ("better", "worse"), ("best", "worst"),
+    ("more", "less"), ("most", "least"), ("high", "low"), ("higher", "lower"), ("always", "never"),
+    ("easy", "difficult"), ("easy", "hard"), ("positive", "negative"), ("increase", "decrease"),
+    ("increased", "decreased"), ("above", "below"), ("like", "dislike"), ("before", "after"),
+]}
+# "new york, NY": a value, a comma and a 2-3 letter upper-case qualifier (state, country)
+_QUALIFIED = re.compile(r"^(.*\S)\s*,\s*([A-Z]{2,3})\.?$")
+
+
+def canonical_keys(values):
+    """
+    Case-folded, whitespace-collapsed, punctuation-free keys (vectorized).
+    Values with digits keep their punctuation so "-1" and "1" stay apart.
+    """
+    text = pd.Series(values, dtype=object).astype(str).str.casefold()
+    keys = text.where(text.str.contains(r"\d"), text.str.replace(r"[^\w\s]", " ", regex=True))
+    return keys.str.replace(r"\s+", " ", regex=True).str.strip().to_numpy(dtype=object)
+
+
+def _is_opposite_word(a, b):
+    """True for words like ('agree', 'disagree') or ('good', 'bad')."""
+    short, long_ = (a, b) if len(a) <= len(b) else (b, a)
+    return any(long_ == prefix + short for prefix in _NEGATION_PREFIXES) or frozenset((a, b)) in _ANTONYMS
+
+
+def _is_negation_pair(a, b):
+    """
+    True for keys that must stay apart because they are opposite answers.
+    Keys are compared word by word: "strongly agree" / "strongly disagree"
+    differ by a negated word, "satisfied" / "not satisfied" by a negation.
+    """
+    words_a, words_b = set(a.split()), set(b.split())
+    only_a, only_b = words_a - words_b, words_b - words_a
+    if (only_a | only_b) & _NEGATION_WORDS:
+        return True
+    if _is_opposite_word(a.replace(" ", ""), b.replace(" ", "")):
+        return True
+    return any(_is_opposite_word(x, y) for x in only_a for y in only_b)
+
+
+def _textual_keys(keys):
+    """Positions of keys without digits: "10-20" and "10-25" are different bands."""
+    return np.flatnonzero(~pd.Series(keys, dtype=object).str.contains(r"\d").to_numpy(dtype=bool))
+
+
+def _similar_pairs(keys):
+    """
+    (i, j) index pairs of textual keys whose rapidfuzz ratio passes the cutoff.
+    Pairs of two short keys are left out, see SHORT_KEY_LENGTH.
+    """
+    textual = _textual_keys(keys)
+    words = keys[textual]
+    short = pd.Series(words, dtype=object).str.len().to_numpy() <= SHORT_KEY_LENGTH
+    pairs = []
+    for start in range(0, len(words), NORMALIZE_BATCH):
+        block = process.cdist(words[start:start + NORMALIZE_BATCH], words, scorer=fuzz.ratio,
+                              score_cutoff=NORMALIZE_SIMILARITY, dtype=np.uint8, workers=-1)
+        rows, cols = np.nonzero(block)
+        rows = rows + start
+        upper = (rows < cols) & ~(short[rows] & short[cols])
+        pairs.extend(zip(textual[rows[upper]].tolist(), textual[cols[upper]].tolist()))
+    return pairs
+
+
+def _abbreviations(keys):
+    """
+    {initial position: positions of the longer keys it starts} for one-letter
+    keys ("y" -> "yes"); "mr" is not an abbreviation of "mrs".
+    """
+    textual = _textual_keys(keys)
+    words = pd.Series(keys[textual], dtype=object)
+    candidates = {}
+    for i in np.flatnonzero(words.str.len().to_numpy() == 1):
+        matches = np.flatnonzero(words.str.startswith(words.iloc[i]).to_numpy(dtype=bool))
+        candidates[int(textual[i])] = textual[matches[matches != i]].tolist()
+    return candidates
+
+
+def _qualified_pairs(values, keys, key_codes):
+    """
+    (i, j) key code pairs where value i is value j plus a ", XX" qualifier
+    ("new york, NY" -> "new york"), the qualifier not being an answer itself.
+    """
+    position = {key: code for code, key in enumerate(keys)}
+    pairs = []
+    for value, code in zip(values, key_codes):
+        match = _QUALIFIED.match(str(value))
+        if match is None or canonical_keys([match.group(2)])[0] in position:
+            continue
+        head = position.get(canonical_keys([match.group(1)])[0])
+        if head is not None and head != code:
+            pairs.append((code, head))
+    return pairs
+
+
+def cluster_values(values, counts, qualifiers=True):
+    """
+    Returns an array mapping each value to its cluster's canonical spelling
+    (the most common original spelling in the cluster). With `qualifiers`,
+    "City, ST" values also join the plain "City" (not for multi-select
+    columns, where ", SMS" is another option).
+    """
+    values = np.asarray(values, dtype=object)
+    counts = np.asarray(counts, dtype=np.float64)
+    keys = canonical_keys(values)
+
+    # 1. Exact variants share a key
+    key_codes, unique_keys = pd.factorize(keys)
+    key_counts = np.bincount(key_codes, weights=counts, minlength=len(unique_keys))
+
+    # 2. Fuzzy variants: union-find over similar key pairs, the more common cluster is the root
+    parent = np.arange(len(unique_keys))
+    members = {i: [key] for i, key in enumerate(unique_keys)}
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j, any_share=False):
+        ri, rj = find(i), find(j)
+        if ri == rj:
+            return
+        big, small = (ri, rj) if key_counts[ri] >= key_counts[rj] else (rj, ri)
+        if not any_share and key_counts[small] > MAX_VARIANT_SHARE * key_counts[big]:
+            return
+        # No chain of near-spellings may join two opposite answers
+        if any(_is_negation_pair(a, b) for a in members[big] for b in members[small]):
+            return
+        parent[small] = big
+        key_counts[big] += key_counts[small]
+        members[big] += members.pop(small)
+
+    if len(unique_keys) > 1:
+        unique_keys = np.asarray(unique_keys, dtype=object)
+        for i, j in _similar_pairs(unique_keys):
+            union(i, j)
+        # A qualified place is the same answer whatever its share
+        if qualifiers:
+            for i, j in _qualified_pairs(values, unique_keys, key_codes):
+                union(i, j, any_share=True)
+        # Abbreviations ("y" -> "yes") once the fuzzy clusters are known:
+        # only when every longer key it starts is in one cluster
+        for i, matches in _abbreviations(unique_keys).items():
+            roots = {find(j) for j in matches}
+            if len(roots) == 1:
+                union(i, roots.pop())
+
+    roots = np.array([find(i) for i in range(len(unique_keys))])
+    cluster_of_value = roots[key_codes]
+
+    # 3. Canonical spelling = most common original value in each cluster
+    order = np.lexsort((-counts, cluster_of_value))
+    first = np.r_[True, cluster_of_value[order][1:] != cluster_of_value[order][:-1]]
+    canonical = {}
+    for pos in order[first]:
+        canonical[cluster_of_value[pos]] = values[pos]
+    return np.array([canonical[c] for c in cluster_of_value], dtype=object)
+
+
+def normalize_column(series):
+    """
+    Returns (normalized series, mapping dataframe) for one text column.
+    Rows are mapped through integer codes; only unique values are clustered.
+    """
+    present = aggregates.present_values(series)
+    counts = present.astype(str).value_counts()
+    if len(counts) < 2:
+        return series, None
+
+    mapped_uniques = cluster_values(counts.index.to_numpy(dtype=object), counts.to_numpy(),
+                                    qualifiers=detect_delimiter(series) is None)
+    changed = counts.index.to_numpy(dtype=object) != mapped_uniques
+    if not changed.any():
+        return series, None
+
+    # Map row codes through the mapped uniques (unchanged values keep their type);
+    # code -1 (missing) picks the trailing NaN
+    lookup = pd.Series(mapped_uniques, index=counts.index)
+    codes, uniques = pd.factorize(series)
+    uniques = np.asarray(uniques, dtype=object)
+    as_text = pd.Index(uniques).astype(str)
+    mapped = lookup.reindex(as_text).to_numpy(dtype=object)
+    mapped = np.where(mapped == as_text.to_numpy(dtype=object), uniques, mapped)
+    normalized = pd.Series(np.append(mapped, np.nan)[codes], index=series.index,
+                           name=series.name, dtype=object)
+
+    mapping = pd.DataFrame({
+        "Column Name": series.name,
+        "Original Value": counts.index[changed],
+        "Normalized Value": mapped_uniques[changed],
+        "Count": counts.to_numpy()[changed],
+    })
+    return normalized, mapping
+
+
+def should_normalize(series):
+    """Short-answer text columns with a bounded number of distinct values."""
+    if not pd.api.types.is_object_dtype(series):
+        return False
+    present = aggregates.present_values(series)
+    if present.empty or present.nunique() > MAX_NORMALIZE_UNIQUES:
+        return False
+    return present.astype(str).str.len().mean() <= MAX_NORMALIZE_MEAN_LENGTH
+
+
+def normalize_text_columns(df, columns=None):
+    """
+    Normalizes every eligible text column in place.
+    Returns (df, mapping dataframe of all changed values).
+    """
+    columns = df.columns if columns is None else columns
+    mappings = []
+    for col in columns:
+        if col in df.columns and should_normalize(df[col]):
+            normalized, mapping = normalize_column(df[col])
+            if mapping is not None:
+                df[col] = normalized
+                mappings.append(mapping)
+    if mappings:
+        return df, pd.concat(mappings, ignore_index=True)
+    return df, pd.DataFrame(columns=["Column Name", "Original Value", "Normalized Value", "Count"])
@@ -0,0 +1,178 @@
+# numeric_summary.py
+# Sketch-based summaries (count, mean, quantiles, histogram) for numeric columns.
+import numpy as np
+import pandas as pd
+
+from aggregates import present_values
+from sketches import TDigest, StreamingHistogram
+
+HISTOGRAM_BINS = 20
+SUMMARY_CHUNK_ROWS = 250_000
+
+
+class NumericSummary:
+    """
+    Mergeable summary of one numeric column (or one slice of it).
+
+    Holds exact count/sum/min/max plus a t-digest for quantiles and a
+    fixed-bin histogram. Summaries that share histogram edges can be merged,
+    so a date-filtered view is just the merge of its daily buckets.
+    """
+
+    def __init__(self, edges):
+        self.count = 0.0
+        self.total = 0.0
+        self.missing = 0
+        self.digest = TDigest()
+        self.histogram = StreamingHistogram(edges[0], edges[-1], len(edges) - 1)
+
+    def update(self, values, weights=None):
+        values = np.asarray(values, dtype=np.float64)
+        present = np.isfinite(values)
+        self.missing += int((~present).sum())
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)[present]
+        values = values[present]
+
+        for start in range(0, len(values), SUMMARY_CHUNK_ROWS):
+            chunk = values[start:start + SUMMARY_CHUNK_ROWS]
+            chunk_w = None if weights is None else weights[start:start + SUMMARY_CHUNK_ROWS]
+            self.digest.update(chunk, chunk_w)
+            self.histogram.update(chunk, chunk_w)
+            if chunk_w is None:
+                self.count += len(chunk)
+                self.total += float(chunk.sum())
+            else:
+                self.count += float(chunk_w.sum())
+                self.total += float((chunk * chunk_w).sum())
+        return self
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.missing += other.missing
+        self.digest.merge(other.digest)
+        self.histogram.merge(other.histogram)
+        return self
+
+    def copy(self):
+        clone = NumericSummary.__new__(NumericSummary)
+        clone.count, clone.total, clone.missing = self.count, self.total, self.missing
+        clone.digest = self.digest.copy()
+        clone.histogram = self.histogram.copy()
+        return clone
+
+    # --- Summary statistics ---
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else float("nan")
+
+    @property
+    def min(self):
+        return self.digest.min if self.count else float("nan")
+
+    @property
+    def max(self):
+        return self.digest.max if self.count else float("nan")
+
+    def quantile(self, q):
+        return self.digest.quantile(q)
+
+    @property
+    def median(self):
+        return self.quantile(0.5)
+
+    @property
+    def p90(self):
+        return self.quantile(0.9)
+
+    @property
+    def iqr(self):
+        return self.quantile(0.75) - self.quantile(0.25)
+
+    def histogram_frame(self):
+        """Returns the histogram as a dataframe with bin bounds and counts."""
+        edges = self.histogram.edges
+        return pd.DataFrame({
+            "Bin Start": edges[:-1],
+            "Bin End": edges[1:],
+            "Bin Center": (edges[:-1] + edges[1:]) / 2,
+            "Count": self.histogram.counts,
+        })
+
+
+class ColumnSummary:
+    """
+    Numeric summary of a whole column plus one summary per day of the
+    reference datetime column (when there is one).
+    """
+
+    def __init__(self, overall, buckets=None, date_col=None):
+        self.overall = overall
+        self.buckets = buckets or {}
+        self.date_col = date_col
+
+    def for_range(self, date_range=None):
+        """Merges the daily buckets inside (start_date, end_date), inclusive."""
+        if date_range is None or self.date_col is None:
+            return self.overall
+        start, end = date_range
+        selected = [s for day, s in self.buckets.items() if start <= day.date() <= end]
+        if not selected:
+            return NumericSummary(self.overall.histogram.edges)
+        merged = selected[0].copy()
+        for summary in selected[1:]:
+            merged.merge(summary)
+        return merged
+
+
+def histogram_edges(values, bins=HISTOGRAM_BINS):
+    """Fixed bin edges shared by every bucket of a column."""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return np.linspace(0.0, 1.0, bins + 1)
+    lo, hi = float(values.min()), float(values.max())
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return np.linspace(lo, hi, bins + 1)
+
+
+def summarize_column(series, dates=None, date_col=None, weights=None, bins=HISTOGRAM_BINS):
+    """
+    Builds a ColumnSummary for a numeric series.
+
+    If `dates` (a datetime series aligned with `series`) is given, one
+    summary per calendar day is kept as well so date filters can be served
+    by merging buckets instead of re-scanning the column.
+    """
+    # Work on present values only; a positional index keeps them aligned with dates/weights
+    present = pd.to_numeric(present_values(series.reset_index(drop=True)), errors="coerce")
+    present = present.dropna()
+    positions = present.index.to_numpy()
+    values = present.to_numpy(dtype=np.float64)
+    w = None if weights is None else np.asarray(weights, dtype=np.float64)[positions]
+    edges = histogram_edges(values, bins)
+
+    overall = NumericSummary(edges).update(values, w)
+    overall.missing = len(series) - len(values)
+
+    buckets = {}
+    if dates is not None:
+        dates = pd.to_datetime(dates, errors="coerce").reset_index(drop=True).iloc[positions]
+        days = dates.dt.floor("D").reset_index(drop=True)
+        for day, day_positions in days.groupby(days, sort=True).indices.items():
+            buckets[day] = NumericSummary(edges).update(
+                values[day_positions], None if w is None else w[day_positions]
+            )
+    return ColumnSummary(overall, buckets, date_col if dates is not None else None)
+
+
+def summarize_numeric_columns(df, columns, date_col=None):
+    """Returns {column: ColumnSummary} for the given numeric columns."""
+    dates = df[date_col] if date_col is not None and date_col in df.columns else None
+    return {
+        col: summarize_column(df[col], dates=dates, date_col=date_col)
+        for col in columns
+        if col in df.columns
+    }
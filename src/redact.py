@@ -0,0 +1,190 @@
+# redact.py
+# Detection and redaction of personal data before anything is displayed or
+# exported (raw and cleaned previews, search results, CSV/JSON downloads).
+#
+# Text columns are scanned over their unique values only, with one compiled
+# alternation of every pattern (emails, phone numbers, SSNs, card numbers,
+# IP addresses), so PII embedded in free-text comments is found as well.
+# Columns whose header names personal data (email, phone, a person's name,
+# address) are redacted as whole values; "Trip name" or "Product name" are
+# ordinary answers and are left alone. The result is a per-column mapping
+# {original value: redacted value} that is computed once at clean time and
+# reused for every preview and download.
+#
+# Modes:
+#   mask   "call me at [PHONE]"
+#   hash   "call me at [PHONE:3fa94c1d]" -- keyed BLAKE2 digest, so the same
+#          value gets the same token within a dataset but cannot be looked up
+import hashlib
+import os
+import re
+from collections import Counter
+
+import pandas as pd
+
+from aggregates import present_values
+
+REDACTION_MODES = ("mask", "hash")
+
+_CARD = r"(?<![\d-])(?:\d[ -]?){12,18}\d(?![\d-])"
+PII_PATTERNS = {
+    "EMAIL": r"[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}",
+    "SSN": r"(?<![\d-])\d{3}-\d{2}-\d{4}(?![\d-])",
+    "CARD": _CARD,
+    "PHONE": (r"(?<![\w+])(?:\+\d{1,3}[\s.-]?)?(?:\(\d{3}\)\s?|\d{3}[\s.-])\d{3}[\s.-]\d{4}(?![\w-])"
+              r"|(?<![\w+])\+\d{1,3}[\s.-]?\d(?:[\s.-]?\d){6,12}(?![\w-])"),
+    "IP": r"(?<![\d.])(?:(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)\.){3}(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)(?![\d.])",
+}
+PII_PATTERN = re.compile("|".join(f"(?P<{kind}>{pattern})" for kind, pattern in PII_PATTERNS.items()))
+# Same alternation without groups, for the vectorized "contains anything" pass
+_ANY_PII = re.compile("|".join(f"(?:{pattern})" for pattern in PII_PATTERNS.values()))
+
+# Headers whose values are personal data as a whole (kind of the redacted value)
+PII_HEADERS = {
+    r"e-?mail": "EMAIL",
+    r"phone|mobile|cell\b|telephone": "PHONE",
+    (r"^(?:what is |what's )?(?:your |respondent'?s? |participant'?s? |customer'?s? |contact |employee )?"
+     r"(?:(?:first|last|full|given|family|middle|sur)[\s_.-]?)?name\??$"
+     r"|\b(?:first|last|full|given|family)[\s_.-]?name\b|\bsurname\b"): "NAME",
+    r"(?:^|\b(?:home|street|mailing|postal|billing)\s)address(?:es)?$|postcode|postal code": "ADDRESS",
+    r"\bssn\b|social security": "SSN",
+    r"\bip\b|ip address": "IP",
+}
+
+
+def header_kind(col):
+    """Kind of personal data named by a column header, or None."""
+    col_lower = str(col).lower()
+    for pattern, kind in PII_HEADERS.items():
+        if re.search(pattern, col_lower):
+            return kind
+    return None
+
+
+def _is_text(series):
+    dtype = series.dtype.subtype if isinstance(series.dtype, pd.SparseDtype) else series.dtype
+    return pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)
+
+
+def _luhn_valid(digits):
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        d = int(d)
+        if i % 2:
+            d = d * 2 - 9 if d > 4 else d * 2
+        total += d
+    return total % 10 == 0
+
+
+class ColumnRedaction:
+    """Redacted replacement of every affected unique value of one column."""
+
+    def __init__(self, column, mapping, kinds, whole_values=False):
+        self.column = column
+        self.mapping = mapping          # original value -> redacted text
+        self.kinds = kinds              # Counter of detected kinds
+        self.whole_values = whole_values
+
+    def apply(self, series):
+        """The series with affected values replaced (others, and missing values, untouched)."""
+        if not self.mapping:
+            return series
+        if isinstance(series.dtype, pd.SparseDtype):
+            series = series.sparse.to_dense()
+        replaced = series.map(self.mapping)
+        return replaced.where(replaced.notna(), series)
+
+
+class Redactor:
+    """Finds and redacts personal data, caching one ColumnRedaction per column."""
+
+    def __init__(self, mode="mask", key=None):
+        if mode not in REDACTION_MODES:
+            raise ValueError(f"mode must be one of {REDACTION_MODES}")
+        self.mode = mode
+        # Hash tokens are only comparable within one redactor (one dataset)
+        self.key = key or os.urandom(16)
+        self.columns = {}
+
+    def _token(self, kind, value):
+        if self.mode == "mask":
+            return f"[{kind}]"
+        digest = hashlib.blake2b(str(value).encode("utf-8"), key=self.key, digest_size=4).hexdigest()
+        return f"[{kind}:{digest}]"
+
+    def _replace_match(self, kinds):
+        def replace(match):
+            kind = match.lastgroup
+            if kind == "CARD" and not _luhn_valid(re.sub(r"\D", "", match.group(0))):
+                return match.group(0)
+            kinds[kind] += 1
+            return self._token(kind, match.group(0))
+        return replace
+
+    def redact_text(self, text):
+        """Redacts the PII patterns inside one string."""
+        return PII_PATTERN.sub(self._replace_match(Counter()), str(text))
+
+    def _build(self, series, col):
+        present = present_values(series)
+        uniques = pd.Series(pd.unique(present.to_numpy(dtype=object)), dtype=object)
+        kind = header_kind(col)
+        if kind is not None:
+            # The whole value is personal data (names, emails, ...)
+            mapping = {value: self._token(kind, value) for value in uniques}
+            return ColumnRedaction(col, mapping, Counter({kind: len(mapping)}), whole_values=True)
+        texts = uniques.astype(str)
+        hits = texts.str.contains(_ANY_PII, regex=True)
+        kinds = Counter()
+        replaced = texts[hits].str.replace(PII_PATTERN, self._replace_match(kinds), regex=True)
+        changed = replaced != texts[hits]
+        return ColumnRedaction(col, dict(zip(uniques[hits][changed], replaced[changed])), kinds)
+
+    def scan_column(self, series, col):
+        """Builds (and caches) the redaction of one column from its unique values."""
+        self.columns[col] = self._build(series, col)
+        return self.columns[col]
+
+    def scan(self, df, columns=None, progress=None):
+        """Scans the text (object) columns of a frame; returns self."""
+        if columns is None:
+            columns = [c for c in df.columns if _is_text(df[c]) or header_kind(c) is not None]
+        for i, col in enumerate(columns):
+            if progress is not None:
+                progress(i / max(len(columns), 1), str(col))
+            self.scan_column(df[col], col)
+        return self
+
+    def redact_series(self, series, col=None):
+        """A column with its personal data redacted (scanned on first use)."""
+        col = series.name if col is None else col
+        redaction = self.columns.get(col)
+        if redaction is None:
+            if not (_is_text(series) or header_kind(col) is not None):
+                return series
+            redaction = self.scan_column(series, col)
+        return redaction.apply(series)
+
+    def redact_frame(self, df, cached=True):
+        """
+        Copy of a frame with its personal data redacted; the input is not modified.
+        With cached=False (e.g. raw rows, whose values differ from the cleaned
+        ones) every column is scanned afresh and nothing is cached.
+        """
+        redacted = df.copy()
+        for col in df.columns:
+            series = df[col]
+            if cached:
+                redacted[col] = self.redact_series(series, col)
+            elif _is_text(series) or header_kind(col) is not None:
+                redacted[col] = self._build(series, col).apply(series)
+        return redacted
+
+    def report(self):
+        """'Column'/'Detected'/'Values Redacted' frame of the columns with personal data."""
+        rows = [{"Column": r.column,
+                 "Detected": ", ".join(f"{kind} ({count:,})" for kind, count in r.kinds.most_common()),
+                 "Values Redacted": len(r.mapping),
+                 "Whole Values": r.whole_values}
+                for r in self.columns.values() if r.mapping]
+        return pd.DataFrame(rows, columns=["Column", "Detected", "Values Redacted", "Whole Values"])
@@ -0,0 +1,194 @@
+# relationships.py
+# Pairwise relationships between questions, computed as whole matrices:
+#   - Pearson correlation among Numeric and (encoded) Likert columns, with
+#     pairwise-complete observations, from a handful of masked matrix products;
+#   - Cramér's V among Categorical/Binary columns, from one block contingency
+#     matrix (one-hot codes, D.T @ D) reduced block-wise.
+# No Python loop over column pairs, so 150+ questions stay interactive.
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Rows processed per matrix product, at most
+RELATIONSHIP_CHUNK_ROWS = 50_000
+# Memory for the per-chunk working arrays; wide one-hot blocks get fewer rows
+RELATIONSHIP_CHUNK_BYTES = 64 * 1024 * 1024
+# Number of (filter, column set) results kept per session
+RELATIONSHIP_CACHE_SIZE = 4
+
+
+def _chunk_rows(bytes_per_row):
+    """Rows per chunk that keep the working arrays within RELATIONSHIP_CHUNK_BYTES."""
+    return int(np.clip(RELATIONSHIP_CHUNK_BYTES // max(bytes_per_row, 1), 1, RELATIONSHIP_CHUNK_ROWS))
+
+
+# --- Correlation among numeric / Likert columns ---
+
+def pairwise_correlation(X, weights=None):
+    """
+    Pearson correlation with pairwise deletion of missing values.
+
+    X is an (n_rows, p) float array with NaN for missing values and
+    `weights` optional per-row weights. Returns (corr, n_obs) as (p, p)
+    arrays, n_obs being unweighted response counts; pairs with fewer than 3
+    shared observations or no variance are NaN.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    p = X.shape[1]
+    n_obs = np.zeros((p, p))
+    n = np.zeros((p, p))
+    sx = np.zeros((p, p))
+    sxx = np.zeros((p, p))
+    sxy = np.zeros((p, p))
+    # M, X0, W, XW and XW * X0 are (rows, p) float64 each
+    chunk_rows = _chunk_rows(5 * 8 * p)
+    for start in range(0, X.shape[0], chunk_rows):
+        chunk = X[start:start + chunk_rows]
+        M = (~np.isnan(chunk)).astype(np.float64)
+        X0 = np.where(M > 0, chunk, 0.0)
+        # Weighting the left operand weights every product sum
+        if weights is None:
+            W, XW = M, X0
+        else:
+            w = np.asarray(weights[start:start + chunk_rows], dtype=np.float64)[:, None]
+            W, XW = M * w, X0 * w
+        n_obs += M.T @ M
+        n += W.T @ M
+        sx += XW.T @ M          # sum of x_i over rows where x_j is present too
+        sxx += (XW * X0).T @ M
+        sxy += XW.T @ X0
+
+    sy = sx.T
+    syy = sxx.T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = n * sxy - sx * sy
+        var = (n * sxx - sx ** 2) * (n * syy - sy ** 2)
+        corr = cov / np.sqrt(var)
+    corr[(n_obs < 3) | ~np.isfinite(corr)] = np.nan
+    np.fill_diagonal(corr, 1.0)
+    return np.clip(corr, -1.0, 1.0), n_obs
+
+
+# --- Cramér's V among categorical columns ---
+
+def _block_contingency(code_arrays, sizes, row_mask=None, weights=None):
+    """
+    Stacked contingency matrix O = D.T @ diag(w) @ D over one-hot codes, built
+    in chunks, plus the (m, m) unweighted counts of rows answering both columns.
+    Only rows kept by `row_mask` enter the chunks, and chunks hold fewer rows
+    the more categories there are (see RELATIONSHIP_CHUNK_BYTES).
+    """
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    K = int(offsets[-1])
+    m = len(code_arrays)
+    O = np.zeros((K, K))
+    n_obs = np.zeros((m, m))
+    positions = None if row_mask is None else np.flatnonzero(np.asarray(row_mask, dtype=bool))
+    n_rows = len(positions) if positions is not None else (len(code_arrays[0]) if code_arrays else 0)
+    # D (and its weighted copy) plus P, all float32
+    chunk_rows = _chunk_rows(4 * (K * (1 if weights is None else 2) + m))
+    for start in range(0, n_rows, chunk_rows):
+        stop = min(start + chunk_rows, n_rows)
+        take = slice(start, stop) if positions is None else positions[start:stop]
+        D = np.zeros((stop - start, K), dtype=np.float32)
+        P = np.zeros((stop - start, m), dtype=np.float32)
+        rows = np.arange(stop - start)
+        for c, (codes, offset) in enumerate(zip(code_arrays, offsets[:-1])):
+            chunk = codes[take]
+            present = chunk >= 0
+            D[rows[present], offset + chunk[present]] = 1.0
+            P[:, c] = present
+        DW = D if weights is None else D * np.asarray(weights[take], dtype=np.float32)[:, None]
+        O += (DW.T @ D).astype(np.float64)
+        n_obs += (P.T @ P).astype(np.float64)
+    return O, offsets, n_obs
+
+
+def cramers_v_matrix(code_arrays, sizes, row_mask=None, weights=None):
+    """
+    Cramér's V for every pair of categorical columns.
+
+    `code_arrays` are int code arrays (-1 = missing), `sizes` the number
+    of categories of each and `weights` optional per-row weights. Returns
+    (V, n_obs) as (m, m) arrays, n_obs being unweighted response counts.
+    """
+    m = len(code_arrays)
+    if m == 0:
+        return np.zeros((0, 0)), np.zeros((0, 0))
+    O, offsets, n_obs = _block_contingency(code_arrays, sizes, row_mask, weights)
+    starts = offsets[:-1]
+    sizes = np.asarray(sizes)
+
+    # Row/column margins of every block, broadcast back to cell level
+    row_sums = np.add.reduceat(O, starts, axis=1)            # (K, m): sum over each column block
+    col_sums = np.add.reduceat(O, starts, axis=0)            # (m, K)
+    R = np.repeat(row_sums, sizes, axis=1)                   # (K, K)
+    C = np.repeat(col_sums, sizes, axis=0)                   # (K, K)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.where(O > 0, O * O / (R * C), 0.0)
+    S = np.add.reduceat(np.add.reduceat(ratio, starts, axis=0), starts, axis=1)
+    N = np.add.reduceat(np.add.reduceat(O, starts, axis=0), starts, axis=1)
+
+    # Categories that actually occur within each pair's shared rows
+    k_rows = np.add.reduceat((row_sums > 0).astype(np.float64), starts, axis=0)   # (m, m)
+    k_cols = np.add.reduceat((col_sums > 0).astype(np.float64), starts, axis=1)   # (m, m)
+    dof = np.minimum(k_rows, k_cols) - 1
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        phi2 = np.clip(S - 1, 0, None)       # chi2 / N
+        V = np.sqrt(phi2 / dof)
+    V[(dof <= 0) | (N == 0)] = np.nan
+    np.fill_diagonal(V, 1.0)
+    return np.clip(V, 0.0, 1.0), n_obs
+
+
+# --- Helpers for the dashboard ---
+
+def matrix_frame(matrix, columns):
+    return pd.DataFrame(matrix, index=columns, columns=columns)
+
+
+def top_pairs(matrix, columns, n_obs, kind, limit=25):
+    """Strongest off-diagonal pairs as a dataframe (by absolute value)."""
+    i, j = np.triu_indices(len(columns), k=1)
+    values = matrix[i, j]
+    keep = np.isfinite(values)
+    pairs = pd.DataFrame({
+        "Column A": np.asarray(columns, dtype=object)[i[keep]],
+        "Column B": np.asarray(columns, dtype=object)[j[keep]],
+        kind: values[keep],
+        "Responses": n_obs[i[keep], j[keep]].astype(int),
+    })
+    order = np.argsort(-np.abs(pairs[kind].to_numpy()), kind="stable")
+    return pairs.iloc[order[:limit]].reset_index(drop=True)
+
+
+def crosstab_counts(codes_a, codes_b, row_mask=None, weights=None):
+    """(k_a, k_b) counts for one pair of code arrays (drill-down)."""
+    valid = (codes_a.codes >= 0) & (codes_b.codes >= 0)
+    if row_mask is not None:
+        valid &= np.asarray(row_mask, dtype=bool)
+    ka, kb = codes_a.n_categories, codes_b.n_categories
+    flat = codes_a.codes[valid].astype(np.int64) * kb + codes_b.codes[valid]
+    w = None if weights is None else np.asarray(weights, dtype=np.float64)[valid]
+    return np.bincount(flat, weights=w, minlength=ka * kb).reshape(ka, kb)
+
+
+class RelationshipCache:
+    """Small LRU of computed matrices keyed by (filter, column set)."""
+
+    def __init__(self, max_entries=RELATIONSHIP_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+
+    def get(self, key, compute):
+        if key in self._results:
+            self._results.move_to_end(key)
+            return self._results[key]
+        result = compute()
+        self._results[key] = result
+        if len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+        return result
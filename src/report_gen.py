@@ -0,0 +1,306 @@
+# report_gen.py
+# Headless report builder: turns a cleaned survey into one self-contained
+# HTML file with the same tabs and cards as the Streamlit dashboard.
+#
+# Usage: uv run python src/report_gen.py survey.csv -o report.html [--workers 4]
+import argparse
+import base64
+import html
+import io
+from concurrent.futures import ProcessPoolExecutor
+
+import aggregates
+import charts
+import data_clean as data_cleaner
+import likert
+from lazy_imports import lazy_import
+from multiselect import column_delimiter, option_frequencies
+from redact import header_kind
+from numeric_summary import summarize_column
+from sentiment import key_phrases, score_column
+from timeseries import GRANULARITIES, TimeBuckets, response_series
+
+# Tab order and titles mirror dash_gen.py
+TABS = [
+    ("cat", "📊 Categorical and Likert"),
+    ("num", "🔢 Numeric"),
+    ("text", "✍️ Free Text"),
+    ("id", "🆔 ID Fields"),
+    ("time", "⏳ Datetime Columns and Time Series"),
+]
+
+
+# --- Chart rendering (runs in worker processes) ---
+
+def render_chart(spec):
+    """Renders one chart spec to an HTML fragment. Only gets small aggregates."""
+    kind = spec["kind"]
+    if kind == "wordcloud":
+        try:
+            image = charts.word_cloud(spec["data"]).to_image()
+        except ValueError:
+            return "<p class='note'>Could not generate word cloud. (Perhaps all words were filtered out?)</p>"
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        encoded = base64.b64encode(buffer.getvalue()).decode("ascii")
+        return f"<img class='wordcloud' alt='Word cloud' src='data:image/png;base64,{encoded}'>"
+
+    if kind == "pie":
+        fig = charts.pie_chart(spec["data"])
+    elif kind == "bar":
+        fig = charts.bar_chart(spec["data"], spec["color"])
+    elif kind == "likert":
+        fig = charts.likert_diverging_chart(spec["data"])
+    elif kind == "options":
+        fig = charts.option_bar_chart(spec["data"], spec["color"])
+    elif kind == "histogram":
+        fig = charts.histogram_chart(spec["data"], spec["color"])
+    elif kind == "line":
+        fig = charts.time_series_chart(spec["data"], spec["title"], spec["granularity"])
+    else:
+        raise ValueError(f"Unknown chart kind: {kind}")
+    return fig.to_html(full_html=False, include_plotlyjs=False, div_id=spec["id"],
+                       default_width="100%", default_height="420px")
+
+
+# --- Card collection (runs in the main process) ---
+
+def _unique_metric(series):
+    """Unique count card metrics and note, as plot_id shows them (data_clean.unique_count)."""
+    count, bound = data_cleaner.unique_count(series)
+    if bound is None:
+        return [("Total Unique Values", f"{count:,}")], None
+    note = f"± {bound:,} (HyperLogLog estimate, ~95% bound)"
+    return [("Total Unique Values (approx.)", f"{count:,}")], note
+
+
+def _likert_card(col, encoding, chart_id):
+    """Score cards and diverging chart, as plot_likert shows them."""
+    counts = likert.score_counts(encoding)
+    if counts.sum() == 0:
+        return {"title": col, "note": "This column contains no responses on the detected scale."}
+    metrics = likert.likert_metrics(counts, encoding)
+    box_label = "Top-2 Box" if encoding.n_points >= 5 and not encoding.is_nps else "Top Box"
+    return {
+        "title": col,
+        "metrics": [("Mean Score", f"{metrics['Mean Score']:.2f} / {encoding.values.max():g}"),
+                    (box_label, f"{metrics['Top-2 Box %']:.0f}%"),
+                    ("Net Score", f"{metrics['Net Score']:+.0f}")],
+        "chart": {"id": chart_id, "kind": "likert", "data": likert.distribution_frame(counts, encoding)},
+    }
+
+
+def collect_cards(cleaned_df, category_df, numeric_summaries=None, delimiters=None, redactor=None):
+    """
+    Builds {tab key: [card]} where each card has a title, optional metrics,
+    an optional note and an optional chart spec with precomputed data.
+    With a `redactor` (redact.Redactor), free text is redacted before it
+    reaches the word clouds and columns holding personal data are not
+    charted, as in the dashboard.
+    """
+    numeric_summaries = numeric_summaries or {}
+    delimiters = delimiters or {}
+    palette = charts.COLOR_PALETTE
+    cards = {key: [] for key, _ in TABS}
+
+    def chart_id():
+        return f"chart-{sum(len(c) for c in cards.values())}"
+
+    # Categorical, Binary and Likert share a tab, like in the dashboard
+    cat_cols = (aggregates.columns_of_type(category_df, "Binary")
+                + aggregates.columns_of_type(category_df, "Categorical")
+                + aggregates.columns_of_type(category_df, "Likert Scale")
+                + aggregates.columns_of_type(category_df, "Multi-Select"))
+    binary_cols = set(aggregates.columns_of_type(category_df, "Binary"))
+    multi_cols = set(aggregates.columns_of_type(category_df, "Multi-Select"))
+    likert_cols = set(aggregates.columns_of_type(category_df, "Likert Scale"))
+    for i, col in enumerate(cat_cols):
+        if redactor is not None and header_kind(col) is not None:
+            cards["cat"].append({"title": col, "note": f"Not charted: this column holds personal data "
+                                                        f"({header_kind(col).lower()})."})
+            continue
+        if col in likert_cols:
+            cards["cat"].append(_likert_card(col, likert.encode_likert(cleaned_df[col]), chart_id()))
+            continue
+        if col in multi_cols:
+            delimiter = delimiters.get(col) or column_delimiter(cleaned_df[col])
+            counts, kind = option_frequencies(cleaned_df[col], delimiter), "options"
+        else:
+            counts = aggregates.value_counts_frame(cleaned_df[col])
+            kind = "pie" if col in binary_cols else "bar"
+        cards["cat"].append({"title": col, "chart": {
+            "id": chart_id(), "kind": kind, "data": counts, "color": palette[i % len(palette)]}})
+
+    for i, col in enumerate(aggregates.columns_of_type(category_df, "Numeric")):
+        summary = numeric_summaries.get(col)
+        summary = summary.overall if summary is not None else summarize_column(cleaned_df[col]).overall
+        if summary.count == 0:
+            cards["num"].append({"title": col, "note": "This column contains no numeric data to plot."})
+            continue
+        cards["num"].append({
+            "title": col,
+            "metrics": [("Median", f"{summary.median:,.2f}"), ("P90", f"{summary.p90:,.2f}"),
+                        ("IQR", f"{summary.iqr:,.2f}")],
+            "chart": {"id": chart_id(), "kind": "histogram", "data": summary.histogram_frame(),
+                      "color": palette[i % len(palette)]},
+        })
+
+    for col in aggregates.columns_of_type(category_df, "Free Text"):
+        shown = cleaned_df[col] if redactor is None else redactor.redact_series(cleaned_df[col], col)
+        text = aggregates.text_for_wordcloud(shown)
+        if not text:
+            cards["text"].append({"title": col, "note": "This column contains no text data to visualize."})
+            continue
+        # Same lexicon sentiment cards and key phrases as plot_sentiment in the dashboard
+        column_sentiment = score_column(cleaned_df[col])
+        shares = column_sentiment.distribution().set_index("Sentiment")["Share"]
+        phrases = key_phrases(cleaned_df[col], column_sentiment)
+        cards["text"].append({
+            "title": col,
+            "metrics": [("Positive", f"{shares['Positive']:.0f}%"), ("Negative", f"{shares['Negative']:.0f}%"),
+                        ("Mean Sentiment", f"{column_sentiment.mean():+.2f}")],
+            "note": ("Key phrases: " + ", ".join(phrases["Phrase"].head(8))) if not phrases.empty else None,
+            "chart": {"id": chart_id(), "kind": "wordcloud", "data": text},
+        })
+
+    for col in aggregates.columns_of_type(category_df, "ID/Unique"):
+        metrics, note = _unique_metric(cleaned_df[col])
+        cards["id"].append({"title": col, "metrics": metrics, "note": note})
+
+    for col in aggregates.columns_of_type(category_df, "Datetime"):
+        buckets = TimeBuckets(cleaned_df[col])
+        if buckets.empty:
+            cards["time"].append({"title": col, "note": "This datetime column contains no valid datetime data."})
+        else:
+            granularity = buckets.default_granularity()
+            freq = GRANULARITIES[granularity]
+            cards["time"].append({"title": col, "chart": {
+                "id": chart_id(), "kind": "line", "data": response_series(buckets.counts(freq), freq),
+                "title": col, "granularity": granularity}})
+    return cards
+
+
+# --- Page assembly ---
+
+_STYLE = """
+body { font-family: -apple-system, "Segoe UI", Roboto, sans-serif; margin: 2rem; color: #262730; }
+.tabs button { border: none; background: none; padding: .6rem 1rem; font-size: 1rem; cursor: pointer; }
+.tabs button.active { border-bottom: 3px solid #ff4b4b; color: #ff4b4b; }
+.tab { display: none; } .tab.active { display: block; }
+.grid { display: grid; grid-template-columns: repeat(var(--cols), minmax(0, 1fr)); gap: 1rem; }
+.card { border: 1px solid #e6e6e6; border-radius: .5rem; padding: 1rem; }
+.metrics { display: flex; gap: 2rem; } .metric .label { font-size: .85rem; color: #666; }
+.metric .value { font-size: 2rem; } .note { color: #555; font-size: .9rem; }
+img.wordcloud { width: 100%; } table.categories { border-collapse: collapse; }
+table.categories td, table.categories th { border: 1px solid #ddd; padding: .3rem .6rem; text-align: left; }
+"""
+
+_SCRIPT = """
+function showTab(key) {
+  document.querySelectorAll('.tab').forEach(t => t.classList.toggle('active', t.id === 'tab-' + key));
+  document.querySelectorAll('.tabs button').forEach(b => b.classList.toggle('active', b.dataset.tab === key));
+  // Plotly sizes hidden charts to zero width; resize once they are visible
+  document.querySelectorAll('#tab-' + key + ' .plotly-graph-div').forEach(d => Plotly.Plots.resize(d));
+}
+"""
+
+_GRID_COLUMNS = {"cat": 3, "num": 2, "text": 2, "id": 4, "time": 1}
+
+
+def _card_html(card, rendered):
+    parts = [f"<div class='card'><h3>{html.escape(str(card['title']))}</h3>"]
+    if card.get("metrics"):
+        parts.append("<div class='metrics'>")
+        for label, value in card["metrics"]:
+            parts.append(f"<div class='metric'><div class='label'>{html.escape(label)}</div>"
+                         f"<div class='value'>{html.escape(value)}</div></div>")
+        parts.append("</div>")
+    if card.get("note"):
+        parts.append(f"<p class='note'>{html.escape(card['note'])}</p>")
+    if card.get("chart"):
+        parts.append(rendered[card["chart"]["id"]])
+    parts.append("</div>")
+    return "".join(parts)
+
+
+def render_page(cards, rendered, category_df, title="Survey Report", plotlyjs="inline"):
+    """Assembles the final HTML page from the cards and rendered chart fragments."""
+    offline = lazy_import("plotly.offline", requested_by="html report")
+    if plotlyjs == "inline":
+        plotly_js = f"<script>{offline.get_plotlyjs()}</script>"
+    else:
+        plotly_js = f"<script src='https://cdn.plot.ly/plotly-{offline.get_plotlyjs_version()}.min.js'></script>"
+
+    buttons, tabs = [], []
+    for i, (key, label) in enumerate(TABS):
+        active = " active" if i == 0 else ""
+        buttons.append(f"<button class='{active.strip()}' data-tab='{key}' "
+                       f"onclick=\"showTab('{key}')\">{html.escape(label)} ({len(cards[key])})</button>")
+        body = "".join(_card_html(card, rendered) for card in cards[key]) or \
+            "<p class='note'>No columns of this type found.</p>"
+        tabs.append(f"<section id='tab-{key}' class='tab{active}'>"
+                    f"<div class='grid' style='--cols:{_GRID_COLUMNS[key]}'>{body}</div></section>")
+
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>
+<style>{_STYLE}</style>{plotly_js}<script>{_SCRIPT}</script></head>
+<body><h1>🧹 {html.escape(title)}</h1>
+<h2>🧭 Inferred Question Types</h2>
+{category_df.to_html(index=False, classes='categories', border=0)}
+<h2>📈 Detailed Visualizations by Column Type</h2>
+<nav class='tabs'>{''.join(buttons)}</nav>
+{''.join(tabs)}
+</body></html>"""
+
+
+def build_report(cleaned_df, category_df, output_path=None, numeric_summaries=None,
+                 workers=None, title="Survey Report", plotlyjs="inline", delimiters=None, redactor=None):
+    """
+    Builds the HTML report and returns it (also written to `output_path` if given).
+
+    Aggregates are computed once here; figures are then rendered in parallel
+    worker processes, which only receive the small aggregate tables.
+    """
+    cards = collect_cards(cleaned_df, category_df, numeric_summaries, delimiters, redactor)
+    specs = [card["chart"] for tab in cards.values() for card in tab if card.get("chart")]
+
+    if workers == 1 or len(specs) <= 1:
+        fragments = [render_chart(spec) for spec in specs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            fragments = list(pool.map(render_chart, specs))
+    rendered = {spec["id"]: fragment for spec, fragment in zip(specs, fragments)}
+
+    page = render_page(cards, rendered, category_df, title=title, plotlyjs=plotlyjs)
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(page)
+    return page
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a static HTML report from a survey file")
+    parser.add_argument("input", help="survey file (.csv or .xlsx)")
+    parser.add_argument("-o", "--output", default="survey_report.html")
+    parser.add_argument("--workers", type=int, default=None, help="chart rendering processes")
+    parser.add_argument("--title", default="Survey Report")
+    parser.add_argument("--cdn", action="store_true",
+                        help="load plotly.js from a CDN instead of embedding it")
+    parser.add_argument("--unredacted", action="store_true",
+                        help="keep personal data (emails, phone numbers, ...) in the free text")
+    args = parser.parse_args()
+
+    artifacts = {}
+    df = data_cleaner.read_survey_file(args.input, artifacts=artifacts)
+    cleaned_df, category_df = data_cleaner.process_and_analyze_data(df, artifacts=artifacts)
+    build_report(cleaned_df, category_df, args.output,
+                 numeric_summaries=artifacts.get("numeric_summaries"),
+                 delimiters=artifacts.get("delimiters"),
+                 redactor=None if args.unredacted else artifacts["redactors"]["mask"],
+                 workers=args.workers, title=args.title,
+                 plotlyjs="cdn" if args.cdn else "inline")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
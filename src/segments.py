@@ -0,0 +1,127 @@
+# segments.py
+# Segment comparison ("split by gender / location / ...") backed by a
+# group-by cube over integer category codes.
+#
+# Every categorical column is factorized once into int32 codes. A cube for
+# one segment column is then a single np.bincount per target column over
+# (segment_code * n_categories + category_code), computed for all target
+# columns at once and cached, so switching segments or charts is instant.
+import re
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Number of (segment, filter) cubes kept per session
+CUBE_CACHE_SIZE = 8
+
+
+class CategoryCodes:
+    """Integer codes (-1 = missing) and the labels they point to."""
+
+    def __init__(self, codes, labels):
+        self.codes = codes
+        self.labels = labels
+
+    @property
+    def n_categories(self):
+        return len(self.labels)
+
+
+def encode_categories(series):
+    """Factorizes a column into CategoryCodes (sparse-aware)."""
+    if isinstance(series.dtype, pd.SparseDtype) and pd.isna(series.array.fill_value):
+        array = series.array
+        try:
+            present_codes, labels = pd.factorize(array.sp_values, sort=True)
+        except TypeError:
+            present_codes, labels = pd.factorize(array.sp_values)
+        codes = np.full(len(series), -1, dtype=np.int32)
+        codes[array.sp_index.indices] = present_codes
+        return CategoryCodes(codes, pd.Index(labels))
+    try:
+        codes, labels = pd.factorize(series, sort=True)
+    except TypeError:
+        # Mixed types (e.g. numbers and strings) cannot be sorted
+        codes, labels = pd.factorize(series)
+    return CategoryCodes(codes.astype(np.int32), pd.Index(labels))
+
+
+def get_codes(code_cache, df, col):
+    """Returns the cached CategoryCodes of a column, encoding it on first use."""
+    if col not in code_cache:
+        code_cache[col] = encode_categories(df[col])
+    return code_cache[col]
+
+
+def build_cube(segment, targets, row_mask=None, weights=None):
+    """
+    Returns {target column: counts array of shape (n_segments, n_categories)}.
+
+    `segment` is the CategoryCodes of the segment column, `targets` maps
+    column names to CategoryCodes. `row_mask` restricts the rows (e.g. the
+    date filter) and `weights` gives per-row weights.
+    """
+    g = segment.n_categories
+    base_valid = segment.codes >= 0
+    if row_mask is not None:
+        base_valid &= np.asarray(row_mask, dtype=bool)
+
+    cube = {}
+    for col, target in targets.items():
+        k = target.n_categories
+        valid = base_valid & (target.codes >= 0)
+        flat = segment.codes[valid].astype(np.int64) * k + target.codes[valid]
+        w = None if weights is None else np.asarray(weights, dtype=np.float64)[valid]
+        cube[col] = np.bincount(flat, weights=w, minlength=g * k).reshape(g, k)
+    return cube
+
+
+def cube_frame(counts, segment, target):
+    """Long 'Segment'/'Category'/'Count'/'Percent' frame for one cube slice."""
+    g, k = counts.shape
+    totals = counts.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        percent = np.where(totals > 0, counts / totals * 100, 0.0)
+    return pd.DataFrame({
+        "Segment": np.repeat(segment.labels.astype(str), k),
+        "Category": np.tile(target.labels.astype(str), g),
+        "Count": counts.ravel(),
+        "Percent": percent.ravel(),
+    })
+
+
+class CubeCache:
+    """Small LRU of cubes keyed by (segment column, filter key)."""
+
+    def __init__(self, max_entries=CUBE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._cubes = OrderedDict()
+
+    def get(self, code_cache, df, segment_col, target_cols, row_mask=None, mask_key=None,
+            weights=None, weights_key=None):
+        key = (segment_col, tuple(target_cols), mask_key, weights_key)
+        if key in self._cubes:
+            self._cubes.move_to_end(key)
+            return self._cubes[key]
+
+        segment = get_codes(code_cache, df, segment_col)
+        targets = {col: get_codes(code_cache, df, col) for col in target_cols}
+        cube = build_cube(segment, targets, row_mask, weights)
+        self._cubes[key] = cube
+        if len(self._cubes) > self.max_entries:
+            self._cubes.popitem(last=False)
+        return cube
+
+
+def suggest_segments(category_df, keyword_patterns):
+    """
+    Categorical/Binary columns that can be used as segments, with the ones
+    whose header matches a demographic keyword (gender, location, ...) first.
+    """
+    candidates = category_df.loc[
+        category_df["Inferred Type"].isin(["Categorical", "Binary"]), "Column Name"
+    ].tolist()
+    preferred = [c for c in candidates
+                 if any(re.search(p, str(c).lower()) for p in keyword_patterns)]
+    return preferred + [c for c in candidates if c not in preferred]
@@ -0,0 +1,323 @@
+# sentiment.py
+# Offline sentiment scores and key phrases for free-text answers.
+#
+# Scores come from the bundled lexicon (sentiment_lexicon.py). The inverted
+# index of a column (text_index.TextIndex) already is a sparse
+# token x response matrix, so the lexicon score of every response is one
+# np.bincount over the posting lists of the lexicon words -- no second pass
+# over the text. Only responses that also contain a negation ("not", "never",
+# "didn't", ...) are tokenized again, in one vectorized batch, to flip the
+# scored words that follow it. Raw sums are squashed into [-1, 1].
+#
+# Scores are cached per response text hash (RESPONSE_CACHE), so a re-upload
+# or a later wave of the same survey only scores comments not seen before.
+#
+# Key phrases are the most frequent 2-3 word n-grams (no stop word at either
+# end, no personal data) over a sample of the filtered responses, with
+# their mean sentiment.
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import present_values
+from redact import PII_PATTERN
+from sentiment_lexicon import LEXICON, NEGATION_WINDOW, NEGATORS, STOPWORDS
+from text_index import TOKEN_PATTERN, TextIndex, union_rows
+
+SENTIMENT_LABELS = ("Negative", "Neutral", "Positive")
+# Scores beyond +/- this are Positive / Negative
+SENTIMENT_THRESHOLD = 0.05
+# Weight of a scored word after a negation ("not good" counts as mildly negative)
+NEGATION_FACTOR = -0.75
+# Raw sum s -> s / sqrt(s^2 + alpha); one "good" (2) scores about 0.46
+_SQUASH_ALPHA = 15.0
+# Responses whose n-grams are counted for key phrases (a uniform sample beyond this)
+KEY_PHRASE_SAMPLE = 50_000
+MAX_KEY_PHRASES = 15
+# Fewest (sampled) responses a phrase must appear in
+MIN_PHRASE_RESPONSES = 3
+# A bigram inside a trigram seen at least this often (relative) is dropped for it
+_SUBSUMED_SHARE = 0.8
+# Response scores kept by the per-process cache (it starts over when full)
+MAX_CACHED_RESPONSES = 2_000_000
+
+# Words, plus sentence punctuation that ends a negation's scope and breaks phrases
+_SCOPE_PATTERN = TOKEN_PATTERN + r"|[.!?;:,]"
+_SCOPE_BREAKS = frozenset(".!?;:,") | {"but", "however", "although", "though"}
+
+
+class ResponseCache:
+    """Sentiment score of every response text seen in this process, by 64-bit hash."""
+
+    def __init__(self, max_entries=MAX_CACHED_RESPONSES):
+        self.max_entries = max_entries
+        self.keys = np.empty(0, dtype=np.uint64)      # sorted
+        self.scores = np.empty(0, dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, hashes):
+        """(found mask, scores with NaN where not found) for an array of hashes."""
+        keys, scores = self.keys, self.scores
+        if len(keys) == 0 or len(hashes) == 0:
+            return np.zeros(len(hashes), dtype=bool), np.full(len(hashes), np.nan, dtype=np.float32)
+        pos = np.minimum(np.searchsorted(keys, hashes), len(keys) - 1)
+        found = keys[pos] == hashes
+        return found, np.where(found, scores[pos], np.float32(np.nan))
+
+    def add(self, hashes, scores):
+        with self._lock:
+            if len(self.keys) + len(hashes) > self.max_entries:
+                self.keys = np.empty(0, dtype=np.uint64)
+                self.scores = np.empty(0, dtype=np.float32)
+            keys = np.concatenate([self.keys, np.asarray(hashes, dtype=np.uint64)])
+            scores = np.concatenate([self.scores, np.asarray(scores, dtype=np.float32)])
+            order = np.argsort(keys, kind="stable")
+            keys, scores = keys[order], scores[order]
+            first = np.concatenate(([True], keys[1:] != keys[:-1])) if len(keys) else np.zeros(0, dtype=bool)
+            # Swap in whole arrays so lookups never see a half-updated cache
+            self.keys, self.scores = keys[first], scores[first]
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+def response_hashes(texts):
+    """64-bit hash of every response text (an object array or series of str)."""
+    return pd.util.hash_array(np.asarray(texts, dtype=object))
+
+
+def _squash(raw):
+    return raw / np.sqrt(raw * raw + _SQUASH_ALPHA)
+
+
+def _scope_tokens(texts):
+    """
+    Tokens (with punctuation) of some texts as flat arrays: the position of
+    the text each token came from, the token's code in `vocabulary`, whether
+    it is a scope break, and a scope id that changes at every text,
+    punctuation mark or "but".
+    """
+    texts = pd.Series(np.asarray(texts, dtype=object), dtype=object)
+    tokens = texts.astype(str).str.lower().str.findall(_SCOPE_PATTERN).explode().dropna()
+    doc = tokens.index.to_numpy(dtype=np.int64)
+    # Word flags are looked up once per distinct token, not once per occurrence
+    codes, vocabulary = pd.factorize(tokens.to_numpy(dtype=object))
+    vocabulary = pd.Index(vocabulary, dtype=object)
+    breaks = vocabulary.isin(_SCOPE_BREAKS)[codes]
+    new_doc = np.concatenate(([True], doc[1:] != doc[:-1])) if len(doc) else np.zeros(0, dtype=bool)
+    scope = np.cumsum(breaks | new_doc)
+    return doc, codes, vocabulary, breaks, scope
+
+
+def _negated_raw_scores(texts):
+    """Raw lexicon sums of some texts, with scored words after a negation flipped."""
+    doc, codes, vocabulary, breaks, scope = _scope_tokens(texts)
+    weights = vocabulary.map(LEXICON).fillna(0.0).to_numpy(dtype=np.float64)[codes]
+    is_negator = vocabulary.isin(NEGATORS)[codes]
+    negated = np.zeros(len(codes), dtype=bool)
+    for k in range(1, NEGATION_WINDOW + 1):
+        if len(codes) <= k:
+            break
+        negated[k:] |= is_negator[:-k] & (scope[k:] == scope[:-k])
+    scored = weights != 0
+    # Presence, not frequency, like the index: each (response, word, negated) counts once
+    hits = pd.DataFrame({"doc": doc[scored], "word": codes[scored], "negated": negated[scored],
+                         "weight": np.where(negated, weights * NEGATION_FACTOR, weights)[scored]})
+    hits = hits.drop_duplicates(["doc", "word", "negated"])
+    return np.bincount(hits["doc"].to_numpy(), weights=hits["weight"].to_numpy(), minlength=len(texts))
+
+
+def score_indexed(series, index, rows=None):
+    """
+    Sentiment in [-1, 1] of the responses at positions `rows` (all answered
+    rows by default) of a column, using its TextIndex for the lexicon pass.
+    """
+    postings = [index.postings(word) for word in LEXICON]
+    hit_rows = np.concatenate(postings)
+    weights = np.repeat(np.array(list(LEXICON.values()), dtype=np.float64), [len(p) for p in postings])
+    raw = np.bincount(hit_rows, weights=weights, minlength=index.n_rows)
+    scored = np.bincount(hit_rows, minlength=index.n_rows) > 0
+
+    rows = index.documents if rows is None else np.asarray(rows)
+    # Responses with a negation and a scored word get the positional pass
+    negated_rows = union_rows(index.postings(word) for word in NEGATORS)
+    candidates = np.intersect1d(negated_rows, rows, assume_unique=True)
+    candidates = candidates[scored[candidates]]
+    if len(candidates):
+        raw[candidates] = _negated_raw_scores(series.iloc[candidates])
+    return _squash(raw[rows]).astype(np.float32)
+
+
+def score_texts(texts):
+    """Sentiment in [-1, 1] of each text of a series (each distinct text scored once)."""
+    codes, uniques = pd.factorize(texts.astype(str).to_numpy(dtype=object))
+    if len(uniques) == 0:
+        return np.empty(0, dtype=np.float32)
+    unique_texts = pd.Series(uniques, dtype=object)
+    return score_indexed(unique_texts, TextIndex(unique_texts))[codes]
+
+
+class ColumnSentiment:
+    """Sentiment score of every row of one text column (NaN where unanswered)."""
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    @property
+    def answered(self):
+        return ~np.isnan(self.scores)
+
+    def label_codes(self):
+        """0 Negative, 1 Neutral, 2 Positive, -1 unanswered."""
+        codes = np.where(self.scores > SENTIMENT_THRESHOLD, 2, np.where(self.scores < -SENTIMENT_THRESHOLD, 0, 1))
+        return np.where(self.answered, codes, -1)
+
+    def distribution(self, row_mask=None, weights=None):
+        """'Sentiment'/'Count'/'Share' frame of the answered rows under `row_mask`."""
+        codes = self.label_codes()
+        keep = codes >= 0 if row_mask is None else (codes >= 0) & row_mask
+        totals = np.bincount(codes[keep], weights=None if weights is None else weights[keep], minlength=3)
+        share = totals / totals.sum() * 100 if totals.sum() else np.zeros(3)
+        return pd.DataFrame({"Sentiment": SENTIMENT_LABELS, "Count": totals, "Share": share})
+
+    def mean(self, row_mask=None, weights=None):
+        keep = self.answered if row_mask is None else self.answered & row_mask
+        if not keep.any():
+            return float("nan")
+        return float(np.average(self.scores[keep], weights=None if weights is None else weights[keep]))
+
+    def over_time(self, buckets, freq="D", row_mask=None, weights=None):
+        """
+        'Date'/'Responses'/'Mean Sentiment'/'% Positive'/'% Negative' per
+        bucket of a timeseries.TimeBuckets, for the answered rows under `row_mask`.
+        """
+        codes = self.label_codes()
+        w = np.ones(len(codes)) if weights is None else np.nan_to_num(weights)
+        answered = codes >= 0
+        keep = answered if row_mask is None else answered & row_mask
+        totals = buckets.totals({
+            "Responses": w,
+            "Score": np.where(answered, np.nan_to_num(self.scores) * w, 0.0),
+            "Positive": (codes == 2) * w,
+            "Negative": (codes == 0) * w,
+        }, freq, keep)
+        responses = totals["Responses"].where(totals["Responses"] > 0)
+        return pd.DataFrame({
+            "Date": totals["Date"],
+            "Responses": totals["Responses"],
+            "Mean Sentiment": totals["Score"] / responses,
+            "% Positive": totals["Positive"] / responses * 100,
+            "% Negative": totals["Negative"] / responses * 100,
+        })
+
+
+def score_column(series, index=None, cache=RESPONSE_CACHE):
+    """
+    ColumnSentiment of a text column. Responses already in `cache` are not
+    scored again; the others are scored through the column's TextIndex when
+    given, else by indexing just those (distinct) texts.
+    """
+    series = series.reset_index(drop=True)
+    scores = np.full(len(series), np.nan, dtype=np.float32)
+    present = present_values(series)
+    if present.empty:
+        return ColumnSentiment(scores)
+    positions = present.index.to_numpy()
+    texts = present.astype(str).to_numpy(dtype=object)
+    hashes = response_hashes(texts)
+    if cache is not None:
+        found, cached = cache.lookup(hashes)
+        scores[positions[found]] = cached[found]
+    else:
+        found = np.zeros(len(positions), dtype=bool)
+    new = ~found
+    if new.any():
+        if index is not None and index.n_rows == len(series):
+            new_scores = score_indexed(series, index, positions[new])
+        else:
+            new_scores = score_texts(pd.Series(texts[new], dtype=object))
+        scores[positions[new]] = new_scores
+        if cache is not None:
+            cache.add(hashes[new], new_scores)
+    return ColumnSentiment(scores)
+
+
+def score_columns(df, columns, indexes=None, progress=None):
+    """{column: ColumnSentiment} for the given text columns."""
+    indexes = indexes or {}
+    sentiments = {}
+    for i, col in enumerate(columns):
+        if progress is not None:
+            progress(i / max(len(columns), 1), str(col))
+        sentiments[col] = score_column(df[col], indexes.get(col))
+    return sentiments
+
+
+def key_phrases(series, sentiment=None, row_mask=None, top=MAX_KEY_PHRASES, sample=KEY_PHRASE_SAMPLE, seed=0):
+    """
+    'Phrase'/'Responses'/'Mean Sentiment' frame of the most frequent 2-3 word
+    phrases in the answered rows under `row_mask`. Beyond `sample` responses
+    the counts come from a uniform sample, scaled to all rows.
+    """
+    series = series.reset_index(drop=True)
+    present = present_values(series)
+    rows = present.index.to_numpy()
+    if row_mask is not None:
+        rows = rows[row_mask[rows]]
+    columns = ["Phrase", "Responses", "Mean Sentiment"]
+    if len(rows) == 0:
+        return pd.DataFrame(columns=columns)
+    scale = 1.0
+    if len(rows) > sample:
+        scale = len(rows) / sample
+        rows = np.sort(np.random.default_rng(seed).choice(rows, sample, replace=False))
+
+    # Personal data (emails, phone numbers, ...) never becomes a phrase: it breaks the scope
+    texts = series.iloc[rows].astype(str).str.replace(PII_PATTERN, " . ", regex=True)
+    doc, codes, vocabulary, breaks, scope = _scope_tokens(texts)
+    stop = (vocabulary.isin(STOPWORDS) | vocabulary.str.isdigit())[codes] | breaks
+    words = vocabulary.to_numpy()
+    grams = []
+    for n in (2, 3):
+        if len(codes) < n:
+            continue
+        last = len(codes) - n + 1
+        # Every word in one scope, no stop word at either end
+        keep = (scope[:last] == scope[n - 1:]) & ~stop[:last] & ~stop[n - 1:]
+        phrase = words[codes[:last][keep]]
+        for k in range(1, n):
+            phrase = phrase + " " + words[codes[k:last + k][keep]]
+        grams.append(pd.DataFrame({"doc": doc[:last][keep], "Phrase": phrase, "n": n}))
+    if not grams:
+        return pd.DataFrame(columns=columns)
+    grams = pd.concat(grams, ignore_index=True).drop_duplicates(["doc", "Phrase"])
+    counts = grams.groupby("Phrase", sort=False).agg(Responses=("doc", "size"), n=("n", "first"))
+    counts = counts[counts["Responses"] >= MIN_PHRASE_RESPONSES]
+    if counts.empty:
+        return pd.DataFrame(columns=columns)
+
+    # "check in" is dropped when "check in desk" accounts for most of its uses
+    trigrams = counts[counts["n"] == 3]
+    covered = pd.concat([
+        pd.Series(trigrams["Responses"].to_numpy(), index=trigrams.index.str.rsplit(" ", n=1).str[0]),
+        pd.Series(trigrams["Responses"].to_numpy(), index=trigrams.index.str.split(" ", n=1).str[1]),
+    ]).groupby(level=0).max()
+    bigram_counts = counts.loc[counts["n"] == 2, "Responses"]
+    subsumed = covered.reindex(bigram_counts.index).fillna(0) >= _SUBSUMED_SHARE * bigram_counts
+    counts = counts.drop(bigram_counts.index[subsumed.to_numpy()])
+    counts = counts.sort_values(["Responses", "n"], ascending=[False, False]).head(top)
+
+    result = pd.DataFrame({"Phrase": counts.index,
+                           "Responses": np.round(counts["Responses"].to_numpy() * scale).astype(np.int64)})
+    if sentiment is not None:
+        doc_scores = sentiment.scores[rows]
+        matched = grams[grams["Phrase"].isin(counts.index)]
+        means = pd.Series(doc_scores[matched["doc"].to_numpy()]).groupby(matched["Phrase"].to_numpy()).mean()
+        result["Mean Sentiment"] = means.reindex(result["Phrase"]).to_numpy()
+    else:
+        result["Mean Sentiment"] = np.nan
+    return result
@@ -0,0 +1,94 @@
+# sentiment_lexicon.py
+# Bundled word list behind sentiment.py (no download, no network).
+#
+# Scores run from -3 (strongly negative) to +3 (strongly positive) and are
+# written for survey feedback: service, staff, product, travel and workplace
+# comments. Words are lower-case single tokens as produced by
+# text_index.tokenize (so "don't" is one token), with every inflection
+# listed: "didn't like it" only scores through "like". "like" weighs 1, as
+# it is often a preposition ("felt like a queue").
+_SCORED_WORDS = {
+    3: """
+        amazing awesome brilliant excellent exceptional fabulous fantastic flawless
+        incredible magnificent marvelous marvellous outstanding perfect phenomenal
+        superb spectacular stellar terrific wonderful love loved loves loving
+        delighted thrilled ecstatic best superior impeccable exquisite
+    """,
+    2: """
+        good great nice lovely pleasant enjoyable enjoyed enjoy enjoying happy glad
+        satisfied pleased impressive impressed beautiful clean comfortable convenient
+        friendly helpful kind courteous polite professional efficient effective
+        reliable responsive quick fast smooth easy seamless intuitive recommend
+        recommended valuable worthwhile useful attentive welcoming knowledgeable
+        caring generous thoughtful fun exciting excited delicious tasty fresh
+        spacious quiet relaxing safe secure affordable reasonable fair thank thanks
+        thankful grateful appreciate appreciates appreciated appreciative liked
+        enjoys recommends
+        organized prompt punctual accurate consistent supportive
+        positive improved improvement upgrade excellence success successful
+        favorite favourite cheerful charming gorgeous elegant stylish modern
+        informative clear transparent honest trustworthy dependable
+    """,
+    1: """
+        ok okay fine decent adequate acceptable solid better improving
+        works worked working helped help helps easier cheaper faster calm tidy
+        interesting available respectful patient sufficient
+        satisfactory simple straightforward flexible cozy cosy
+        warm neat handy hopeful resolved fixed
+        like likes
+    """,
+    -1: """
+        slow slower wait waiting waited long confusing confused unclear complicated
+        crowded noisy loud expensive pricey costly overpriced small cramped basic
+        limited lacking lack lacks missing missed outdated old dated tired bland
+        meh mediocre average inconsistent delay delayed delays late busy
+        difficult hard tricky awkward odd strange cold lukewarm stale dull boring
+        unfortunately issue issues problem problems concern
+        concerned complaint complain complained
+    """,
+    -2: """
+        bad poor poorly rude unhelpful unfriendly unprofessional dirty messy
+        uncomfortable inconvenient unreliable broken fail failed fails failure
+        error errors bug buggy crash crashed crashes disappointed disappointing
+        disappointment annoying annoyed annoyance frustrating frustrated
+        frustration unhappy dissatisfied unsatisfied upset angry worse wrong
+        useless pointless waste wasted overcrowded filthy smelly stinky
+        careless ignored ignoring incompetent inaccurate misleading unacceptable
+        lost cancelled canceled ripoff scam hate hates hated hating dislike
+        dislikes disliked disliking disappoint disappoints
+        regret regrets sad sorry painful pain stressful stress worried unsafe
+        inadequate insufficient subpar sloppy neglected slowest lengthy
+    """,
+    -3: """
+        awful horrible horrendous terrible dreadful atrocious abysmal appalling
+        disgusting disgraceful pathetic worst nightmare furious outrageous
+        unbearable shocking shameful hostile abusive dangerous toxic
+        catastrophe disaster disastrous
+    """,
+}
+
+LEXICON = {word: score for score, words in _SCORED_WORDS.items() for word in words.split()}
+
+# A scored word within NEGATION_WINDOW tokens after one of these flips sign
+NEGATORS = frozenset("""
+    not no never none nobody nothing neither nor without hardly barely
+    don't doesn't didn't isn't aren't wasn't weren't won't wouldn't can't
+    cannot couldn't shouldn't haven't hasn't hadn't dont doesnt didnt isnt
+    arent wasnt werent wont wouldnt cant couldnt shouldnt havent hasnt hadnt
+""".split())
+NEGATION_WINDOW = 3
+
+# Common words that never start or end a key phrase
+STOPWORDS = frozenset("""
+    a about above after again against all also am an and any are as at be
+    because been before being below between both but by could did do does
+    doing down during each even ever every few for from further get got had
+    has have having he her here hers herself him himself his how i if in
+    into is it it's its itself just me more most much my myself of off on
+    once only or other our ours ourselves out over own really same she should
+    so some such than that that's the their theirs them themselves then there
+    these they this those through to too under until up us very was we were
+    what when where which while who whom why will with would you your yours
+    yourself yourselves i'm i've we're they're you're there's lot lots quite
+    one two three s t can may might must shall
+""".split()) | NEGATORS
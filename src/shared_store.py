@@ -0,0 +1,404 @@
+# shared_store.py
+# Shared, read-only store of cleaned datasets.
+#
+# A cleaned dataset is published once as an uncompressed Arrow IPC file
+# (under /dev/shm when available, else the temp dir), keyed by a hash of the
+# uploaded bytes. Everyone who opens the same export attaches to it instead
+# of parsing and cleaning it again:
+#   - sessions in the same server process share one in-memory frame;
+#   - other processes memory-map the IPC file, so its buffers live once in
+#     the page cache (numeric columns without gaps are not copied at all).
+#
+# Every attachment is a DatasetLease. Leases are counted per process and
+# marked on disk per process, and a dataset is evicted (memory and file)
+# once nobody holds a lease and it has been idle for SHARED_IDLE_SECONDS.
+#
+# The same Arrow files back MappedFrame: a cleaned frame kept on disk and
+# read back one column (or one chunk of rows) at a time, for surveys whose
+# aggregates are served by the SQL query store.
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from lazy_imports import lazy_import
+
+# Overrides the store directory
+SHARED_STORE_ENV = "SURVEY_SHARED_STORE"
+# Datasets nobody is attached to are evicted after this long
+SHARED_IDLE_SECONDS = 15 * 60
+# Raw rows kept for the "Raw Data Preview" of attached sessions
+PREVIEW_ROWS = 5
+# Rows per chunk when a MappedFrame is read row-wise (exports)
+MAPPED_CHUNK_ROWS = 50_000
+
+_META_KEY = b"survey_cleaner"
+
+
+def _pyarrow():
+    lazy_import("pyarrow.ipc", requested_by="shared dataset store")
+    return lazy_import("pyarrow", requested_by="shared dataset store")
+
+
+def default_store_dir():
+    base = os.environ.get(SHARED_STORE_ENV)
+    if not base:
+        shm = "/dev/shm"
+        root = shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else tempfile.gettempdir()
+        base = os.path.join(root, "survey_cleaner")
+    os.makedirs(base, exist_ok=True)
+    return base
+
+
+def dataset_id_for(file_bytes, filename=""):
+    """Content key of an upload: the same export gets the same id for every viewer."""
+    digest = hashlib.sha256(file_bytes)
+    digest.update(os.path.splitext(filename)[1].lower().encode())
+    return digest.hexdigest()[:32]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# --- Arrow conversion ---
+
+def _frame_to_json(df):
+    return None if df is None else df.to_json(orient="split", date_format="iso", default_handler=str)
+
+
+def _frame_from_json(text):
+    return None if text is None else pd.read_json(io.StringIO(text), orient="split")
+
+
+def frame_to_table(cleaned_df, meta):
+    """Arrow table of a cleaned frame, with `meta` (JSON-able) in the schema metadata."""
+    pa = _pyarrow()
+    arrays, names, sparse_cols = [], [], []
+    for col in cleaned_df.columns:
+        series = cleaned_df[col]
+        if isinstance(series.dtype, pd.SparseDtype):
+            sparse_cols.append(str(col))
+            series = series.sparse.to_dense()
+        try:
+            array = pa.array(series, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed-type object columns (numbers and text) are stored as text
+            array = pa.array(series.astype(str).where(series.notna(), None), from_pandas=True)
+        arrays.append(array)
+        names.append(str(col))
+    meta = dict(meta, sparse_columns=sparse_cols)
+    return pa.Table.from_arrays(arrays, names=names, metadata={_META_KEY: json.dumps(meta).encode()})
+
+
+def frame_from_table(table):
+    """(frame, meta) back from frame_to_table's table (sparse columns restored)."""
+    meta = json.loads(table.schema.metadata[_META_KEY])
+    # split_blocks keeps one block per column, so gap-free numeric columns stay views on the map
+    df = table.to_pandas(split_blocks=True)
+    for col in df.columns[df.dtypes == object]:
+        # Arrow nulls come back as None; cleaned frames use NaN for missing text
+        df[col] = df[col].where(df[col].notna(), np.nan)
+    for col in meta["sparse_columns"]:
+        if col not in df.columns:
+            continue     # a selection of the table's columns
+        if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+            df[col] = df[col].astype(pd.SparseDtype("float64", float("nan")))
+        else:
+            df[col] = df[col].astype(pd.SparseDtype(object, float("nan")))
+    return df, meta
+
+
+def _remove_path(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class MappedFrame:
+    """
+    Read-only stand-in for a cleaned frame whose rows live in a memory-mapped
+    Arrow file. Columns are decoded when asked for and not kept, so holding
+    one costs little more than its index. Supports what the dashboard needs
+    of cleaned_df: columns, index, len(), empty, frame[col], head() and
+    row chunks (iter_chunks) for exports.
+    """
+
+    def __init__(self, path, remove=False):
+        pa = _pyarrow()
+        self.path = path
+        self._table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        meta = json.loads(self._table.schema.metadata[_META_KEY])
+        # Arrow names are strings; keep the frame's own column labels
+        self._names = dict(zip(meta["columns"], self._table.column_names))
+        self.columns = pd.Index(meta["columns"], dtype=object)
+        self.index = pd.Index(meta["index"]) if meta["index"] is not None else pd.RangeIndex(self._table.num_rows)
+        if remove:
+            # The mapping stays valid after the file is unlinked
+            self._finalizer = weakref.finalize(self, _remove_path, path)
+
+    @classmethod
+    def write(cls, cleaned_df, path=None):
+        """Writes a cleaned frame to an Arrow file (a temp file by default) and maps it."""
+        pa = _pyarrow()
+        remove = path is None
+        if remove:
+            fd, path = tempfile.mkstemp(prefix="rows_", suffix=".arrow")
+            os.close(fd)
+        index = cleaned_df.index
+        default_index = isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1
+        table = frame_to_table(cleaned_df, {"index": None if default_index else index.tolist(),
+                                            "columns": cleaned_df.columns.tolist()})
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        return cls(path, remove=remove)
+
+    def __len__(self):
+        return self._table.num_rows
+
+    @property
+    def empty(self):
+        return len(self) == 0 or len(self.columns) == 0
+
+    def __contains__(self, col):
+        return col in self._names
+
+    def _frame(self, table, index):
+        frame, _ = frame_from_table(table)
+        frame.columns = [c for c in self.columns if self._names[c] in table.column_names]
+        frame.index = index
+        return frame
+
+    def __getitem__(self, col):
+        if col not in self._names:
+            raise KeyError(col)
+        return self._frame(self._table.select([self._names[col]]), self.index)[col]
+
+    def head(self, n=5):
+        return self._frame(self._table.slice(0, n), self.index[:n])
+
+    def iter_chunks(self, rows=MAPPED_CHUNK_ROWS):
+        """The rows as consecutive dataframes of at most `rows` rows."""
+        for start in range(0, len(self), rows):
+            yield self._frame(self._table.slice(start, rows), self.index[start:start + rows])
+
+
+class _Entry:
+    """One dataset attached in this process."""
+
+    def __init__(self, dataset_id, cleaned_df, category_df, preview_df, artifacts, table=None):
+        self.dataset_id = dataset_id
+        self.cleaned_df = cleaned_df
+        self.category_df = category_df
+        self.preview_df = preview_df
+        self.artifacts = artifacts
+        self.table = table
+        self.refcount = 0
+        self.idle_since = time.time()
+
+
+class DatasetLease:
+    """
+    One viewer's read-only handle on a shared dataset. Released explicitly
+    with release(), or when the lease is garbage collected (session ended).
+    """
+
+    def __init__(self, store, entry):
+        self.dataset_id = entry.dataset_id
+        self.cleaned_df = entry.cleaned_df        # shared: never modify in place
+        self.category_df = entry.category_df.copy()
+        self.preview_df = entry.preview_df
+        self.table = entry.table                  # Arrow table over the mapped file (other processes)
+        self._shared_artifacts = entry.artifacts
+        marker = store._add_marker(entry.dataset_id)
+        self._finalizer = weakref.finalize(self, store._release, entry.dataset_id, marker)
+
+    def artifacts(self):
+        """A per-viewer artifacts dict holding the shared cleaning by-products."""
+        return dict(self._shared_artifacts, dataset_lease=self)
+
+    def release(self):
+        self._finalizer()
+
+    @property
+    def released(self):
+        return not self._finalizer.alive
+
+
+class SharedDatasetStore:
+    """Publishes cleaned datasets once and hands out leases on them."""
+
+    def __init__(self, directory=None, idle_seconds=SHARED_IDLE_SECONDS):
+        self.directory = directory or default_store_dir()
+        self.idle_seconds = idle_seconds
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _path(self, dataset_id):
+        return os.path.join(self.directory, f"{dataset_id}.arrow")
+
+    def _lease_dir(self, dataset_id):
+        return os.path.join(self.directory, f"{dataset_id}.leases")
+
+    # --- Lease markers (cross-process reference counts) ---
+
+    def _add_marker(self, dataset_id):
+        lease_dir = self._lease_dir(dataset_id)
+        os.makedirs(lease_dir, exist_ok=True)
+        marker = os.path.join(lease_dir, f"{os.getpid()}-{uuid.uuid4().hex}")
+        open(marker, "w").close()
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+            if entry is not None:
+                entry.refcount += 1
+        return marker
+
+    def _release(self, dataset_id, marker):
+        try:
+            os.remove(marker)
+            os.utime(os.path.dirname(marker))     # idle clock for other processes
+        except OSError:
+            pass
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+            if entry is not None:
+                entry.refcount -= 1
+                if entry.refcount <= 0:
+                    entry.idle_since = time.time()
+
+    # --- Publish / attach ---
+
+    def publish(self, dataset_id, cleaned_df, category_df, preview_df=None, artifacts=None):
+        """Writes a cleaned dataset to the store and returns a lease on it."""
+        artifacts = {k: v for k, v in (artifacts or {}).items() if k != "dataset_lease"}
+        normalization_map = artifacts.get("normalization_map")
+        meta = {
+            "category_df": _frame_to_json(category_df),
+            "preview_df": _frame_to_json(preview_df),
+            "normalization_map": _frame_to_json(normalization_map),
+            "weight_column": artifacts.get("weight_column"),
+            "published_at": time.time(),
+        }
+        pa = _pyarrow()
+        table = frame_to_table(cleaned_df, meta)
+        path = self._path(dataset_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+            if entry is None:
+                entry = _Entry(dataset_id, cleaned_df, category_df, preview_df, artifacts)
+                self._entries[dataset_id] = entry
+        lease = DatasetLease(self, entry)
+        self.evict_idle()
+        return lease
+
+    def attach(self, dataset_id):
+        """Returns a lease on a published dataset, or None if it is not in the store."""
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+        if entry is None:
+            entry = self._map_file(dataset_id)
+            if entry is None:
+                return None
+        return DatasetLease(self, entry)
+
+    def _map_file(self, dataset_id):
+        """Memory-maps a dataset published by another process."""
+        pa = _pyarrow()
+        path = self._path(dataset_id)
+        try:
+            table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        except (OSError, pa.ArrowInvalid):
+            return None
+        cleaned_df, meta = frame_from_table(table)
+        artifacts = {"normalization_map": _frame_from_json(meta["normalization_map"]),
+                     "weight_column": meta["weight_column"]}
+        entry = _Entry(dataset_id, cleaned_df, _frame_from_json(meta["category_df"]),
+                       _frame_from_json(meta["preview_df"]), artifacts, table)
+        with self._lock:
+            # Another session may have mapped it meanwhile; keep the first
+            return self._entries.setdefault(dataset_id, entry)
+
+    # --- Eviction ---
+
+    def _live_markers(self, dataset_id):
+        lease_dir = self._lease_dir(dataset_id)
+        live = 0
+        for name in os.listdir(lease_dir) if os.path.isdir(lease_dir) else []:
+            pid = int(name.split("-", 1)[0]) if name.split("-", 1)[0].isdigit() else -1
+            if _pid_alive(pid):
+                live += 1
+            else:
+                # Lease left behind by a process that died
+                try:
+                    os.remove(os.path.join(lease_dir, name))
+                except OSError:
+                    pass
+        return live
+
+    def evict_idle(self, now=None):
+        """Drops datasets nobody is attached to once they have been idle long enough."""
+        now = now or time.time()
+        with self._lock:
+            for dataset_id in [d for d, e in self._entries.items()
+                               if e.refcount <= 0 and now - e.idle_since > self.idle_seconds]:
+                del self._entries[dataset_id]
+
+        for name in os.listdir(self.directory):
+            if not name.endswith(".arrow"):
+                continue
+            dataset_id = name[:-len(".arrow")]
+            # Under the lock: a session attaching meanwhile keeps its file
+            with self._lock:
+                if dataset_id in self._entries or self._live_markers(dataset_id):
+                    continue
+                lease_dir = self._lease_dir(dataset_id)
+                try:
+                    last_used = os.path.getmtime(lease_dir if os.path.isdir(lease_dir) else self._path(dataset_id))
+                except OSError:
+                    continue     # removed by another process
+                if now - last_used > self.idle_seconds:
+                    for path in (self._path(dataset_id), lease_dir):
+                        try:
+                            os.rmdir(path) if os.path.isdir(path) else os.remove(path)
+                        except OSError:
+                            pass
+
+    def drop_unattached(self):
+        """
+        Forgets the in-memory copies of datasets nobody holds a lease on right
+        now (their files stay, so the next viewer attaches again).
+        """
+        with self._lock:
+            for dataset_id in [d for d, e in self._entries.items() if e.refcount <= 0]:
+                del self._entries[dataset_id]
+
+    def stats(self):
+        """Attached datasets in this process with their lease counts."""
+        with self._lock:
+            return pd.DataFrame([
+                {"Dataset": d, "Rows": len(e.cleaned_df), "Leases": e.refcount,
+                 "Memory-mapped": e.table is not None}
+                for d, e in self._entries.items()
+            ], columns=["Dataset", "Rows", "Leases", "Memory-mapped"])
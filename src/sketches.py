@@ -0,0 +1,244 @@
+# sketches.py
+# Small, mergeable data sketches used by the profiler and the dashboard.
+import math
+
+import numpy as np
+import pandas as pd
+
+# --- HyperLogLog distinct counting ---
+
+HLL_DEFAULT_PRECISION = 14   # 2**14 registers -> ~0.8% standard error, 16 KB
+HLL_CHUNK_ROWS = 1_000_000   # rows hashed at a time, bounds temporary memory
+
+
+def hash_values(values):
+    """Returns a uint64 hash for every value (NaNs should be dropped first)."""
+    if not isinstance(values, pd.Series):
+        values = pd.Series(values)
+    return pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+
+
+def _bit_length(x):
+    """Vectorized int.bit_length() for a uint64 array."""
+    x = x.copy()
+    n = np.zeros(x.shape, dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        n += (big * shift).astype(np.uint8)
+        x = np.where(big, x >> np.uint64(shift), x)
+    return n + (x > 0).astype(np.uint8)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog cardinality sketch.
+
+    Uses 2**precision one-byte registers no matter how many values are added.
+    Two sketches with the same precision can be merged, so a column can be
+    counted chunk by chunk and the partial sketches combined afterwards.
+    """
+
+    def __init__(self, precision=HLL_DEFAULT_PRECISION):
+        if not 4 <= precision <= 18:
+            raise ValueError("HyperLogLog precision must be between 4 and 18.")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        """Adds an array of uint64 hashes to the sketch."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if hashes.size == 0:
+            return self
+        p = np.uint64(self.precision)
+        idx = (hashes >> (np.uint64(64) - p)).astype(np.intp)
+        rest = hashes & ((np.uint64(1) << (np.uint64(64) - p)) - np.uint64(1))
+        # Rank = position of the first 1-bit in the remaining 64 - p bits
+        rank = (64 - self.precision) - _bit_length(rest).astype(np.int16) + 1
+        np.maximum.at(self.registers, idx, rank.astype(np.uint8))
+        return self
+
+    def update(self, values, chunk_rows=HLL_CHUNK_ROWS):
+        """Adds the non-null values of a series (or array) in fixed-size chunks."""
+        if not isinstance(values, pd.Series):
+            values = pd.Series(values)
+        values = values.dropna()
+        for start in range(0, len(values), chunk_rows):
+            self.add_hashes(hash_values(values.iloc[start:start + chunk_rows]))
+        return self
+
+    def merge(self, other):
+        """Folds another sketch into this one (register-wise max)."""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision.")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        """Returns the estimated number of distinct values."""
+        m = self.m
+        if m == 16:
+            alpha = 0.673
+        elif m == 32:
+            alpha = 0.697
+        elif m == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / m)
+
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+
+        # Small range correction: linear counting is far more accurate here
+        if raw <= 2.5 * m and zeros > 0:
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def relative_error(self):
+        """Standard error of the estimate, as a fraction of the true count."""
+        return 1.04 / math.sqrt(self.m)
+
+    def error_bound(self, z=2.0):
+        """Absolute +/- bound around estimate() (~95% coverage with z=2)."""
+        return int(math.ceil(z * self.relative_error() * self.estimate()))
+
+    def __len__(self):
+        return self.estimate()
+
+    def __repr__(self):
+        return f"HyperLogLog(precision={self.precision}, estimate={self.estimate()})"
+
+
+# --- t-digest quantile sketch ---
+
+TDIGEST_DEFAULT_COMPRESSION = 200
+
+
+class TDigest:
+    """
+    Merging t-digest for approximate quantiles.
+
+    Values are summarised as weighted centroids that are small near the tails
+    and larger around the median, so extreme quantiles stay accurate. The
+    number of centroids is bounded by the compression, and digests built on
+    different chunks (or date buckets) can be merged.
+    """
+
+    def __init__(self, compression=TDIGEST_DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0, dtype=np.float64)
+        self.weights = np.empty(0, dtype=np.float64)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def total_weight(self):
+        return float(self.weights.sum())
+
+    def update(self, values, weights=None):
+        """Adds an array of values (with optional per-value weights)."""
+        values = np.asarray(values, dtype=np.float64)
+        if weights is None:
+            weights = np.ones(values.shape, dtype=np.float64)
+        else:
+            weights = np.asarray(weights, dtype=np.float64)
+        keep = np.isfinite(values) & np.isfinite(weights) & (weights > 0)
+        values, weights = values[keep], weights[keep]
+        if values.size == 0:
+            return self
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, weights]))
+        return self
+
+    def merge(self, other):
+        """Folds another digest into this one."""
+        if other.weights.size == 0:
+            return self
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(np.concatenate([self.means, other.means]),
+                       np.concatenate([self.weights, other.weights]))
+        return self
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="mergesort")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+
+        # Scale function k1: every centroid covers at most one unit of k
+        q_left = (np.cumsum(weights) - weights) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_left - 1)
+        cluster = np.floor(k - k.min()).astype(np.int64)
+
+        starts = np.flatnonzero(np.r_[True, cluster[1:] != cluster[:-1]])
+        new_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / new_weights
+        self.weights = new_weights
+
+    def quantile(self, q):
+        """Returns the approximate q-quantile (q in [0, 1]), or NaN if empty."""
+        if self.weights.size == 0:
+            return float("nan")
+        total = self.total_weight
+        centers = np.cumsum(self.weights) - self.weights / 2
+        xp = np.concatenate([[0.0], centers, [total]])
+        fp = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(np.clip(q, 0, 1) * total, xp, fp))
+
+    def copy(self):
+        clone = TDigest(self.compression)
+        clone.means = self.means.copy()
+        clone.weights = self.weights.copy()
+        clone.min, clone.max = self.min, self.max
+        return clone
+
+
+# --- Fixed-bin streaming histogram ---
+
+class StreamingHistogram:
+    """
+    Histogram with fixed bin edges that can be filled incrementally.
+
+    Histograms that share the same edges merge by adding their counts,
+    which is what makes per-chunk and per-date-bucket histograms cheap.
+    """
+
+    def __init__(self, lo, hi, bins=20):
+        if not (np.isfinite(lo) and np.isfinite(hi)):
+            lo, hi = 0.0, 1.0
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5
+        self.edges = np.linspace(lo, hi, bins + 1)
+        self.counts = np.zeros(bins, dtype=np.float64)
+        self.underflow = 0.0
+        self.overflow = 0.0
+
+    def update(self, values, weights=None):
+        values = np.asarray(values, dtype=np.float64)
+        keep = np.isfinite(values)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)[keep]
+        values = values[keep]
+        counts, _ = np.histogram(values, bins=self.edges, weights=weights)
+        self.counts += counts
+        w = np.ones(values.shape) if weights is None else weights
+        self.underflow += float(w[values < self.edges[0]].sum())
+        self.overflow += float(w[values > self.edges[-1]].sum())
+        return self
+
+    def merge(self, other):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot merge histograms with different bin edges.")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    def copy(self):
+        clone = StreamingHistogram.__new__(StreamingHistogram)
+        clone.edges = self.edges.copy()
+        clone.counts = self.counts.copy()
+        clone.underflow, clone.overflow = self.underflow, self.overflow
+        return clone
@@ -0,0 +1,237 @@
+# sql_store.py
+# Optional out-of-core query backend: the cleaned survey is loaded once into
+# an indexed SQLite file (stdlib, no server), and the date filter, value
+# counts, segment splits and time counts run as SQL aggregates. Only the
+# small aggregate results come back to Python, so each dashboard session
+# needs almost no memory of its own for these views.
+#
+# Rows are written one chunk at a time, so loading never holds more than
+# SQL_LOAD_CHUNK_ROWS rows as Python values. Once the store is loaded, the
+# job keeps the cleaned rows on disk (shared_store.MappedFrame) and the views
+# that still need raw rows (numeric, free text, search, exports) read just
+# the columns they use.
+#
+# Categorical columns are stored as the same integer codes that
+# segments.encode_categories produces, so SQL results line up with the
+# in-memory cubes and charts.
+import os
+import sqlite3
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from aggregates import present_values
+from segments import encode_categories
+
+# Surveys with at least this many rows are served from the store by the dashboard
+SQL_BACKEND_MIN_ROWS = 200_000
+# Rows inserted per executemany() batch while loading
+SQL_LOAD_CHUNK_ROWS = 50_000
+# SQLite page cache per connection, in KiB (kept small: the file is the cache)
+SQL_CACHE_KIB = 8 * 1024
+
+_CODE_TYPES = ("Categorical", "Binary", "Likert Scale")
+_EPOCH = pd.Timestamp("1970-01-01")
+
+
+def _day_number(day):
+    """Days since 1970-01-01 for a date / timestamp."""
+    return (pd.Timestamp(day).normalize() - _EPOCH).days
+
+
+def _remove_file(path):
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+
+def _sql_values(series, kind, codes=None):
+    """One chunk of a column as Python values for SQLite (None for missing)."""
+    if kind == "code":
+        values = codes.astype(object)
+        values[codes < 0] = None
+        return values
+    if kind == "day":
+        dates = pd.to_datetime(series, errors="coerce")
+        days = (dates.dt.normalize() - _EPOCH).dt.days
+        return days.astype(object).where(days.notna(), None).to_numpy(dtype=object)
+    if kind == "real":
+        dense = series.sparse.to_dense() if isinstance(series.dtype, pd.SparseDtype) else series
+        return dense.astype(object).where(dense.notna(), None).to_numpy(dtype=object)
+    values = np.full(len(series), None, dtype=object)
+    present = present_values(series.reset_index(drop=True))
+    values[present.index.to_numpy()] = present.astype(str).to_numpy(dtype=object)
+    return values
+
+
+class SurveyStore:
+    """
+    One cleaned survey in an SQLite file.
+
+    Each thread (Streamlit session) gets its own read connection. Columns are
+    stored as: integer codes (categorical/binary/Likert, with their labels
+    kept here), day numbers (datetime), REAL (numeric) or TEXT (the rest).
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="survey_", suffix=".sqlite")
+            os.close(fd)
+            # The temporary file goes away with the store
+            self._finalizer = weakref.finalize(self, _remove_file, path)
+        self.path = path
+        self.columns = {}     # column name -> (sql column, kind)
+        self.labels = {}      # column name -> labels of its codes
+        self.date_col = None
+        self.n_rows = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(f"PRAGMA cache_size = -{SQL_CACHE_KIB}")
+            self._local.conn = conn
+        return conn
+
+    # --- Loading ---
+
+    def load(self, cleaned_df, category_df, date_col=None, progress=None):
+        """Writes the cleaned dataframe and indexes its filter/group-by columns."""
+        types = dict(zip(category_df["Column Name"], category_df["Inferred Type"]))
+        self.n_rows = len(cleaned_df)
+        self.date_col = date_col
+
+        # Column kinds first; category codes (small integers) are the only
+        # full-length arrays kept while the rows are written
+        codes = {}
+        for i, col in enumerate(cleaned_df.columns):
+            series = cleaned_df[col]
+            q_type = types.get(col)
+            if q_type in _CODE_TYPES:
+                categories = encode_categories(series)
+                self.labels[col] = categories.labels
+                codes[col] = categories.codes
+                kind = "code"
+            elif q_type == "Datetime":
+                kind = "day"
+            elif pd.api.types.is_numeric_dtype(series):
+                kind = "real"
+            else:
+                kind = "text"
+            self.columns[col] = (f"c{i}", kind)
+
+        sql_types = {"code": "INTEGER", "day": "INTEGER", "real": "REAL", "text": "TEXT"}
+        definitions = ", ".join(f"{sql_col} {sql_types[kind]}" for sql_col, kind in self.columns.values())
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("DROP TABLE IF EXISTS responses")
+        conn.execute(f"CREATE TABLE responses ({definitions})")
+        placeholders = ", ".join("?" * len(self.columns))
+        for start in range(0, self.n_rows, SQL_LOAD_CHUNK_ROWS):
+            if progress is not None:
+                progress("Loading query store", start / max(self.n_rows, 1))
+            stop = start + SQL_LOAD_CHUNK_ROWS
+            arrays = [_sql_values(cleaned_df[col].iloc[start:stop], kind,
+                                  codes[col][start:stop] if col in codes else None)
+                      for col, (_, kind) in self.columns.items()]
+            conn.executemany(f"INSERT INTO responses VALUES ({placeholders})", zip(*(a.tolist() for a in arrays)))
+
+        # Filter and group-by columns get an index; the date is the leading key
+        # of the composite indexes so date-filtered group-bys stay index-only
+        date_sql = self.columns[date_col][0] if date_col in self.columns else None
+        for sql_col, kind in self.columns.values():
+            if kind == "day":
+                conn.execute(f"CREATE INDEX idx_{sql_col} ON responses ({sql_col})")
+            elif kind == "code":
+                conn.execute(f"CREATE INDEX idx_{sql_col} ON responses ({sql_col})")
+                if date_sql is not None:
+                    conn.execute(f"CREATE INDEX idx_{date_sql}_{sql_col} ON responses ({date_sql}, {sql_col})")
+        conn.commit()
+        conn.execute("ANALYZE")
+        return self
+
+    # --- Queries ---
+
+    def _where(self, date_range, *not_null):
+        """WHERE clause and parameters for the date filter plus non-missing columns."""
+        clauses = [f"{self.columns[col][0]} IS NOT NULL" for col in not_null]
+        params = []
+        if date_range is not None and self.date_col in self.columns:
+            clauses.append(f"{self.columns[self.date_col][0]} BETWEEN ? AND ?")
+            params += [_day_number(date_range[0]), _day_number(date_range[1])]
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _measure(self, weight_col):
+        """COUNT(*) or the sum of positive weights (same rule as aggregates.respondent_weights)."""
+        if weight_col is None:
+            return "COUNT(*)"
+        w = self.columns[weight_col][0]
+        return f"TOTAL(CASE WHEN {w} > 0 THEN {w} ELSE 0 END)"
+
+    def _query(self, sql, params):
+        return self._connection().execute(sql, params).fetchall()
+
+    def is_date_column(self, col):
+        return self.columns.get(col, (None, None))[1] == "day"
+
+    def row_count(self, date_range=None):
+        where, params = self._where(date_range)
+        return self._query(f"SELECT COUNT(*) FROM responses{where}", params)[0][0]
+
+    def value_counts(self, col, date_range=None, weight_col=None):
+        """'Category'/'Count' dataframe, like aggregates.value_counts_frame."""
+        sql_col, kind = self.columns[col]
+        where, params = self._where(date_range, col)
+        rows = self._query(f"SELECT {sql_col}, {self._measure(weight_col)} FROM responses{where} "
+                           f"GROUP BY {sql_col}", params)
+        keys = [r[0] for r in rows]
+        if kind == "code":
+            keys = self.labels[col][np.asarray(keys, dtype=np.int64)] if keys else []
+        elif kind == "day":
+            keys = _EPOCH + pd.to_timedelta(keys, unit="D")
+        counts = pd.DataFrame({"Category": keys, "Count": [r[1] for r in rows]})
+        return counts.sort_values(by="Count", ascending=False, ignore_index=True)
+
+    def segment_cube(self, segment_col, target_cols, date_range=None, weight_col=None):
+        """
+        {target column: (n_segments, n_categories) counts}, matching
+        segments.build_cube for the same filter and weights.
+        """
+        seg_sql = self.columns[segment_col][0]
+        g = len(self.labels[segment_col])
+        cube = {}
+        for col in target_cols:
+            tgt_sql = self.columns[col][0]
+            where, params = self._where(date_range, segment_col, col)
+            rows = self._query(f"SELECT {seg_sql}, {tgt_sql}, {self._measure(weight_col)} FROM responses{where} "
+                               f"GROUP BY {seg_sql}, {tgt_sql}", params)
+            counts = np.zeros((g, len(self.labels[col])))
+            if rows:
+                cells = np.asarray(rows, dtype=np.float64)
+                counts[cells[:, 0].astype(np.int64), cells[:, 1].astype(np.int64)] = cells[:, 2]
+            cube[col] = counts
+        return cube
+
+    def time_counts(self, col, date_range=None, weight_col=None):
+        """'Date'/'Count' dataframe of responses per day, like aggregates.time_counts_frame."""
+        sql_col = self.columns[col][0]
+        where, params = self._where(date_range, col)
+        rows = self._query(f"SELECT {sql_col}, {self._measure(weight_col)} FROM responses{where} "
+                           f"GROUP BY {sql_col} ORDER BY {sql_col}", params)
+        return pd.DataFrame({
+            "Date": _EPOCH + pd.to_timedelta([r[0] for r in rows], unit="D"),
+            "Count": [r[1] for r in rows],
+        })
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
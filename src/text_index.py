@@ -0,0 +1,218 @@
+# text_index.py
+# Keyword search over free-text answers.
+#
+# Each Free Text column gets an inverted index built once at clean time:
+# token -> sorted row positions of the responses containing it. The postings
+# of all tokens live in one int32 array (CSR layout: `offsets` delimits the
+# slice of each token), and the vocabulary is a sorted array, so a term is a
+# binary search and a prefix ("satisf*") is a contiguous run of tokens.
+# Queries intersect posting lists instead of scanning the text, so they stay
+# in the millisecond range on millions of comments.
+#
+# Query syntax:
+#   bus late        responses containing both words
+#   satisf*         any word starting with "satisf"
+#   -hotel          responses without "hotel"
+#   "very clean"    the exact phrase (checked only on the candidate rows)
+import html
+import re
+
+import numpy as np
+import pandas as pd
+
+from aggregates import present_values
+
+# Letters, digits and inner apostrophes ("don't"); everything else separates words
+TOKEN_PATTERN = r"[^\W_]+(?:'[^\W_]+)*"
+_TOKEN_RE = re.compile(TOKEN_PATTERN)
+_QUERY_RE = re.compile(r'(-?)"([^"]*)"|(\S+)')
+# Matching responses listed under the search box
+MAX_SHOWN_MATCHES = 50
+
+
+def _sorted_unique(values):
+    """np.unique for integer arrays (sort + drop repeats; much faster on large arrays)."""
+    values = np.sort(values)
+    if len(values) < 2:
+        return values
+    return values[np.concatenate(([True], values[1:] != values[:-1]))]
+
+
+def tokenize(text):
+    """Lower-cased word tokens of a text."""
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+class Query:
+    """
+    A parsed search query.
+
+    terms    : (token, is_prefix) pairs every match must contain
+    excluded : (token, is_prefix) pairs no match may contain
+    phrases  : lower-cased phrases every match must contain verbatim
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.terms, self.excluded, self.phrases = [], [], []
+        for negated, phrase, word in _QUERY_RE.findall(text or ""):
+            if phrase:
+                tokens = tokenize(phrase)
+                if negated or not tokens:
+                    continue
+                self.terms += [(t, False) for t in tokens]
+                if len(tokens) > 1:
+                    self.phrases.append(" ".join(tokens))
+                continue
+            negated = word.startswith("-") and len(word) > 1
+            is_prefix = word.endswith("*")
+            tokens = tokenize(word)
+            if not tokens:
+                continue
+            if negated:
+                if len(tokens) == 1:
+                    self.excluded.append((tokens[0], is_prefix))
+                continue
+            # "self-driving" is the phrase "self driving"; a prefix applies to its last word
+            self.terms += [(t, False) for t in tokens[:-1]] + [(tokens[-1], is_prefix)]
+            if len(tokens) > 1 and not is_prefix:
+                self.phrases.append(" ".join(tokens))
+
+    @property
+    def empty(self):
+        return not self.terms and not self.excluded
+
+    def pattern(self):
+        """Regex matching the words to highlight, or None."""
+        words = sorted({re.escape(t) + (r"[^\W_]*" if p else "") for t, p in self.terms},
+                       key=len, reverse=True)
+        if not words:
+            return None
+        return re.compile(r"(?<![^\W_])(?:" + "|".join(words) + r")(?![^\W_])", re.IGNORECASE)
+
+
+class TextIndex:
+    """Inverted index of one text column (row positions, not index labels)."""
+
+    def __init__(self, series):
+        self.n_rows = len(series)
+        present = present_values(series.reset_index(drop=True))
+        tokens = present.astype(str).str.lower().str.findall(TOKEN_PATTERN).explode().dropna()
+        # Rows with an answer (the universe of a query with only exclusions)
+        self.documents = present.index.to_numpy(dtype=np.int32 if self.n_rows < 2 ** 31 else np.int64)
+        if tokens.empty:
+            self.vocabulary = np.array([], dtype=object)
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.rows = self.documents[:0]
+            return
+        codes, vocabulary = pd.factorize(tokens.to_numpy(dtype=object), sort=True)
+        # One (token, row) pair per occurrence -> unique pairs sorted by token, then row
+        keys = _sorted_unique(codes.astype(np.int64) * self.n_rows + tokens.index.to_numpy(dtype=np.int64))
+        token_codes = keys // self.n_rows
+        self.vocabulary = np.asarray(vocabulary, dtype=object)
+        self.offsets = np.searchsorted(token_codes, np.arange(len(self.vocabulary) + 1)).astype(np.int64)
+        self.rows = (keys % self.n_rows).astype(self.documents.dtype)
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.rows.nbytes + self.documents.nbytes + sum(len(t) for t in self.vocabulary) + 8 * len(self.vocabulary)
+
+    def _token_range(self, token, is_prefix=False):
+        """[start, stop) of the vocabulary entries matching a token or prefix."""
+        start = np.searchsorted(self.vocabulary, token, side="left")
+        if is_prefix:
+            stop = np.searchsorted(self.vocabulary, token + "\U0010ffff", side="left")
+        else:
+            stop = start + 1 if start < len(self.vocabulary) and self.vocabulary[start] == token else start
+        return start, stop
+
+    def postings(self, token, is_prefix=False):
+        """Sorted row positions of the responses containing the token (or a word with the prefix)."""
+        start, stop = self._token_range(token, is_prefix)
+        if stop - start == 1:
+            return self.rows[self.offsets[start]:self.offsets[stop]]
+        if stop <= start:
+            return self.rows[:0]
+        # A prefix covers several tokens: union of their lists through a row mask
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.rows[self.offsets[start]:self.offsets[stop]]] = True
+        return np.flatnonzero(mask).astype(self.rows.dtype)
+
+    def document_frequency(self, token, is_prefix=False):
+        start, stop = self._token_range(token, is_prefix)
+        return int(self.offsets[stop] - self.offsets[start]) if stop > start else 0
+
+    def search(self, query, series=None):
+        """
+        Row positions (sorted) of the responses matching `query` (a Query or a string).
+        Phrases are only verified when the column `series` is given.
+        """
+        query = query if isinstance(query, Query) else Query(query)
+        if query.empty:
+            return self.rows[:0]
+        # Rarest term first, so every intersection is at most that long
+        terms = sorted(set(query.terms), key=lambda t: self.document_frequency(*t))
+        matches = self.postings(*terms[0]) if terms else self.documents
+        for term in terms[1:]:
+            if len(matches) == 0:
+                break
+            matches = np.intersect1d(matches, self.postings(*term), assume_unique=True)
+        for term in query.excluded:
+            if len(matches) == 0:
+                break
+            matches = np.setdiff1d(matches, self.postings(*term), assume_unique=True)
+        if query.phrases and series is not None and len(matches):
+            # Compare whole words: " very clean " must not match "avery cleanup"
+            texts = series.iloc[matches].astype(str).map(lambda s: f" {' '.join(tokenize(s))} ")
+            keep = np.ones(len(matches), dtype=bool)
+            for phrase in query.phrases:
+                keep &= texts.str.contains(f" {phrase} ", regex=False).to_numpy()
+            matches = matches[keep]
+        return matches
+
+
+def build_text_indexes(df, columns, progress=None):
+    """{column: TextIndex} for the given text columns."""
+    indexes = {}
+    for i, col in enumerate(columns):
+        if progress is not None:
+            progress(i / max(len(columns), 1), str(col))
+        indexes[col] = TextIndex(df[col])
+    return indexes
+
+
+def search_columns(indexes, df, query, columns=None):
+    """{column: sorted row positions matching `query`} for the indexed columns."""
+    query = query if isinstance(query, Query) else Query(query)
+    return {col: indexes[col].search(query, df[col]) for col in (columns or list(indexes)) if col in indexes}
+
+
+def union_rows(matches):
+    """Sorted row positions in any of the given position arrays."""
+    matches = list(matches)
+    if not matches:
+        return np.array([], dtype=np.int64)
+    return matches[0] if len(matches) == 1 else _sorted_unique(np.concatenate(matches))
+
+
+def row_mask(positions, n_rows):
+    """Boolean mask over all rows from sorted row positions."""
+    mask = np.zeros(n_rows, dtype=bool)
+    mask[positions] = True
+    return mask
+
+
+def highlight(text, query):
+    """HTML-escaped text with the query words wrapped in <mark>."""
+    query = query if isinstance(query, Query) else Query(query)
+    pattern = query.pattern()
+    text = str(text)
+    if pattern is None:
+        return html.escape(text)
+    parts, last = [], 0
+    for match in pattern.finditer(text):
+        parts.append(html.escape(text[last:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group(0))}</mark>")
+        last = match.end()
+    parts.append(html.escape(text[last:]))
+    return "".join(parts)
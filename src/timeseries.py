@@ -0,0 +1,191 @@
+# timeseries.py
+# Responses-over-time series for the time tab and the static report.
+#
+# Every datetime column is bucketed once (hour of each row, as integer codes);
+# any granularity, date/search filter or weighting is then one np.bincount
+# over those codes plus a resample of the (small) hourly totals. Before
+# plotting, the series is downsampled with Largest-Triangle-Three-Buckets to
+# a fixed point budget, so the chart payload stays bounded however long the
+# survey runs. Spikes and drops in response volume are flagged against a
+# trailing rolling median.
+import numpy as np
+import pandas as pd
+
+# Label -> pandas frequency of the time buckets
+GRANULARITIES = {"Hourly": "h", "Daily": "D", "Weekly": "W-MON", "Monthly": "MS"}
+# Most points sent to the chart for one series
+POINT_BUDGET = 1000
+# Most anomaly markers drawn on one chart (the strongest are kept)
+MAX_ANOMALY_MARKERS = 100
+# Trailing window (in buckets) the expected volume is taken from
+ANOMALY_WINDOWS = {"h": 24, "D": 14, "W-MON": 8, "MS": 6}
+# Robust z-score beyond which a bucket is flagged
+ANOMALY_THRESHOLD = 3.5
+# Columns spanning more hours than this are bucketed by day (no hourly view)
+MAX_HOURLY_SPAN = 20 * 366 * 24
+
+_UNIT_NS = {"h": 3_600_000_000_000, "D": 86_400_000_000_000}
+
+
+class TimeBuckets:
+    """Hour (or day, for very long spans) bucket of every row of a datetime column."""
+
+    def __init__(self, series):
+        if isinstance(series.dtype, pd.SparseDtype):
+            series = series.sparse.to_dense()
+        dates = pd.to_datetime(series, errors="coerce")
+        if getattr(dates.dt, "tz", None) is not None:
+            dates = dates.dt.tz_convert(None)
+        stamps = dates.to_numpy(dtype="datetime64[ns]")
+        valid = ~np.isnat(stamps)
+        ns = stamps.view(np.int64)
+        self.unit = "h"
+        self.first = None
+        self.n_buckets = 0
+        self.codes = np.full(len(series), -1, dtype=np.int32)
+        if not valid.any():
+            return
+        span_hours = (ns[valid].max() - ns[valid].min()) // _UNIT_NS["h"]
+        if span_hours > MAX_HOURLY_SPAN:
+            self.unit = "D"
+        buckets = np.floor_divide(ns[valid], _UNIT_NS[self.unit])
+        first = buckets.min()
+        self.first = pd.Timestamp(int(first) * _UNIT_NS[self.unit])
+        self.n_buckets = int(buckets.max() - first) + 1
+        self.codes[valid] = buckets - first
+
+    @property
+    def empty(self):
+        return self.n_buckets == 0
+
+    @property
+    def granularities(self):
+        """Granularity labels this column supports."""
+        return [label for label, freq in GRANULARITIES.items() if not (freq == "h" and self.unit != "h")]
+
+    def default_granularity(self):
+        """Hourly for a few days of data, then daily, weekly or monthly as the span grows."""
+        days = self.n_buckets / (24 if self.unit == "h" else 1)
+        if days <= 3 and self.unit == "h":
+            return "Hourly"
+        if days <= 366:
+            return "Daily"
+        return "Weekly" if days <= 5 * 366 else "Monthly"
+
+    def counts(self, freq="D", row_mask=None, weights=None):
+        """
+        'Date'/'Count' dataframe of responses per bucket, with empty buckets
+        as 0 between the first and last response under the filter.
+        `row_mask` / `weights` are positional, like cleaned_df's rows.
+        """
+        if self.empty:
+            return pd.DataFrame({"Date": pd.DatetimeIndex([]), "Count": []})
+        codes = self.codes if row_mask is None else self.codes[row_mask]
+        w = weights if weights is None or row_mask is None else weights[row_mask]
+        answered = codes >= 0
+        totals = np.bincount(codes[answered], weights=None if w is None else w[answered],
+                             minlength=self.n_buckets)
+        base = pd.DataFrame({
+            "Date": pd.date_range(self.first, periods=self.n_buckets, freq=self.unit),
+            "Count": totals,
+        })
+        return resample_counts(base, freq)
+
+    def totals(self, values, freq="D", row_mask=None):
+        """
+        'Date' plus one column per {name: positional per-row values} entry,
+        summed per bucket over the rows in `row_mask`; buckets outside the
+        first and last nonzero total of the first entry are trimmed.
+        """
+        if self.empty:
+            return pd.DataFrame({"Date": pd.DatetimeIndex([]), **{name: [] for name in values}})
+        codes = self.codes if row_mask is None else self.codes[row_mask]
+        answered = codes >= 0
+        frame = {"Date": pd.date_range(self.first, periods=self.n_buckets, freq=self.unit)}
+        for name, per_row in values.items():
+            per_row = per_row if row_mask is None else per_row[row_mask]
+            frame[name] = np.bincount(codes[answered], weights=per_row[answered], minlength=self.n_buckets)
+        totals = pd.DataFrame(frame).set_index("Date").resample(freq, label="left", closed="left").sum()
+        nonzero = np.flatnonzero(totals.iloc[:, 0].to_numpy() != 0)
+        if len(nonzero) == 0:
+            return pd.DataFrame({"Date": pd.DatetimeIndex([]), **{name: [] for name in values}})
+        return totals.iloc[nonzero[0]:nonzero[-1] + 1].reset_index()
+
+
+def resample_counts(time_counts, freq):
+    """
+    Re-buckets pre-bucketed 'Date'/'Count' counts to a coarser frequency,
+    filling empty buckets with 0 and trimming empty ones at both ends.
+    """
+    if time_counts.empty:
+        return time_counts.reset_index(drop=True)
+    totals = (time_counts.set_index("Date")["Count"]
+              .resample(freq, label="left", closed="left").sum())
+    nonzero = np.flatnonzero(totals.to_numpy() != 0)
+    if len(nonzero) == 0:
+        return pd.DataFrame({"Date": pd.DatetimeIndex([]), "Count": []})
+    totals = totals.iloc[nonzero[0]:nonzero[-1] + 1]
+    return pd.DataFrame({"Date": totals.index, "Count": totals.to_numpy()})
+
+
+def flag_anomalies(time_counts, window, threshold=ANOMALY_THRESHOLD):
+    """
+    Adds 'Expected', 'Score' and 'Anomaly' ('Spike', 'Drop' or '') columns.
+
+    The expected volume is the median of the previous `window` buckets and the
+    spread their median absolute deviation, floored at the Poisson noise of the
+    expected count so that quiet periods do not flag every small wiggle.
+    """
+    counts = time_counts["Count"].astype(np.float64)
+    min_periods = max(3, window // 2)
+    expected = counts.shift(1).rolling(window, min_periods=min_periods).median()
+    deviation = (counts - expected).abs()
+    mad = deviation.shift(1).rolling(window, min_periods=min_periods).median() * 1.4826
+    scale = np.maximum(np.maximum(mad.fillna(0.0), np.sqrt(expected.clip(lower=0).fillna(0.0))), 1.0)
+    score = ((counts - expected) / scale).to_numpy()
+    anomaly = np.where(score > threshold, "Spike", np.where(score < -threshold, "Drop", ""))
+    return time_counts.assign(Expected=expected.to_numpy(), Score=score, Anomaly=anomaly)
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: positions of `n_out` points that keep the
+    visual shape of the (x, y) line. The first and last points are always kept.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (n_out - 2)
+    edges = (np.arange(n_out - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        next_lo, next_hi = (hi, edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def response_series(time_counts, freq, budget=POINT_BUDGET):
+    """
+    Flags anomalies on the full series, then keeps at most `budget` LTTB
+    points plus the strongest MAX_ANOMALY_MARKERS anomalies for the chart.
+    """
+    flagged = flag_anomalies(time_counts, ANOMALY_WINDOWS[freq])
+    if flagged.empty:
+        return flagged
+    keep = lttb_indices(flagged["Date"].to_numpy().view(np.int64), flagged["Count"].to_numpy(), budget)
+    anomalies = np.flatnonzero(flagged["Anomaly"].to_numpy() != "")
+    if len(anomalies) > MAX_ANOMALY_MARKERS:
+        strongest = np.argsort(-np.abs(flagged["Score"].to_numpy()[anomalies]))[:MAX_ANOMALY_MARKERS]
+        anomalies = anomalies[strongest]
+    rows = np.union1d(keep, anomalies)
+    return flagged.iloc[rows].reset_index(drop=True)
@@ -0,0 +1,311 @@
+# topics.py
+# Topic clusters of free-text answers (NumPy only).
+#
+# Every distinct response becomes a sparse hashed TF-IDF vector: its content
+# words (no stop words, no tokens with digits, no e-mail addresses) are
+# hashed into HASH_FEATURES buckets, so the vocabulary never has to be held
+# and the memory of the model does not grow with the column. Vectors are
+# built batch by batch in CSR layout (doc boundaries, feature ids, weights).
+#
+# The clusters are fitted with mini-batch k-means (k-means++ seeding, then
+# per-center learning rates) on a uniform sample of at most FIT_SAMPLE
+# distinct responses; the whole column is then streamed through the fitted
+# centers BATCH_SIZE responses at a time, so a million comments cluster in
+# bounded memory. Each topic is labelled with the heaviest words of its
+# center, and each response keeps its cosine similarity to its center, so
+# the most typical answers of a topic can be listed under any filter.
+#
+# Results are cached per column content (hash of every response and its
+# row) and clustering settings, so reruns and other sessions viewing the
+# same data reuse them.
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from aggregates import present_values
+from redact import PII_PATTERNS
+from sentiment import response_hashes
+from sentiment_lexicon import STOPWORDS
+from text_index import TOKEN_PATTERN
+
+# Hashed feature space (the centers are n_topics x HASH_FEATURES floats)
+HASH_FEATURES = 2 ** 17
+DEFAULT_TOPICS = 6
+MAX_TOPICS = 20
+# Distinct responses vectorized at a time
+BATCH_SIZE = 8192
+# Distinct responses the centers are fitted on (a uniform sample beyond this)
+FIT_SAMPLE = 100_000
+# Passes of mini-batch updates over the fitting sample
+FIT_EPOCHS = 3
+TOP_TERMS = 6
+MAX_EXAMPLES = 3
+# Topic results kept in memory
+TOPIC_CACHE_SIZE = 16
+
+_EMAIL = re.compile(PII_PATTERNS["EMAIL"])
+
+
+def _content_tokens(texts):
+    """(text position, token) arrays of the content words of some texts."""
+    texts = pd.Series(np.asarray(texts, dtype=object), dtype=object).astype(str)
+    # Addresses would otherwise leave "gmail" / "com" behind as words
+    has_email = texts.str.contains("@", regex=False)
+    if has_email.any():
+        texts[has_email] = texts[has_email].str.replace(_EMAIL, " ", regex=True)
+    tokens = texts.str.lower().str.findall(TOKEN_PATTERN).explode().dropna()
+    codes, vocabulary = pd.factorize(tokens.to_numpy(dtype=object))
+    vocabulary = pd.Index(vocabulary, dtype=object)
+    keep = ~(vocabulary.isin(STOPWORDS) | vocabulary.str.contains(r"\d") | (vocabulary.str.len() < 2))
+    keep = keep[codes]
+    return tokens.index.to_numpy(dtype=np.int64)[keep], vocabulary.to_numpy()[codes[keep]]
+
+
+def _hash_tokens(tokens, n_features):
+    return (pd.util.hash_array(np.asarray(tokens, dtype=object)) % np.uint64(n_features)).astype(np.int64)
+
+
+class _Batch:
+    """Sparse term counts of a batch of texts: one (doc, feature, count) entry per distinct pair, by doc."""
+
+    def __init__(self, texts, n_features, terms=None):
+        doc, tokens = _content_tokens(texts)
+        feature = _hash_tokens(tokens, n_features)
+        if terms is not None and len(feature):
+            # One readable word per bucket, for the topic labels
+            unseen, first = np.unique(feature, return_index=True)
+            missing = pd.isna(terms[unseen])
+            terms[unseen[missing]] = tokens[first[missing]]
+        keys, counts = np.unique(doc * n_features + feature, return_counts=True)
+        doc = keys // n_features
+        self.feature = (keys % n_features).astype(np.int32)
+        self.counts = counts
+        starts = np.concatenate(([True], doc[1:] != doc[:-1])) if len(keys) else np.zeros(0, dtype=bool)
+        self.starts = np.flatnonzero(starts)
+        self.docs = doc[self.starts]              # texts with at least one content word
+        self.data = None
+
+    def weigh(self, idf):
+        """L2-normalized sublinear TF-IDF weights of every entry."""
+        data = (1.0 + np.log(self.counts)) * idf[self.feature]
+        norms = np.sqrt(np.add.reduceat(data * data, self.starts)) if len(data) else data
+        self.data = (data / np.repeat(norms, np.diff(np.append(self.starts, len(data))))).astype(np.float32)
+        self.counts = None
+        return self
+
+    def dots(self, centers):
+        """(n_centers, n_docs) dot products of the batch's vectors with dense centers."""
+        if len(self.data) == 0:
+            return np.zeros((len(centers), 0), dtype=np.float32)
+        return np.add.reduceat(centers[:, self.feature] * self.data, self.starts, axis=1)
+
+    def rows(self):
+        """Position in `docs` of every entry."""
+        return np.repeat(np.arange(len(self.docs)), np.diff(np.append(self.starts, len(self.feature))))
+
+
+def _assign(batch, centers, center_norms):
+    """Nearest center (Euclidean, vectors are unit length) and cosine similarity of each doc."""
+    dots = batch.dots(centers)
+    labels = np.argmin(center_norms[:, None] ** 2 - 2 * dots, axis=0)
+    cosine = dots[labels, np.arange(dots.shape[1])] / np.maximum(center_norms[labels], 1e-12)
+    return labels, cosine.astype(np.float32)
+
+
+def _seed_centers(batch, n_topics, n_features, rng):
+    """
+    Greedy k-means++ seeding among the batch's docs (their vectors become
+    the first centers): of a few candidates drawn per step, the one that
+    brings the docs closest to a center is kept.
+    """
+    rows = batch.rows()
+    n_docs = len(batch.docs)
+    n_candidates = 2 + int(np.log(n_topics))
+
+    def dense(doc_rows):
+        centers = np.zeros((len(doc_rows), n_features), dtype=np.float32)
+        for i, doc_row in enumerate(doc_rows):
+            entries = rows == doc_row
+            centers[i, batch.feature[entries]] = batch.data[entries]
+        return centers
+
+    centers = dense([rng.integers(n_docs)])
+    closest = 2.0 - 2 * batch.dots(centers)[0]
+    for _ in range(1, n_topics):
+        weights = np.clip(closest, 0, None)
+        if weights.sum() > 0:
+            picks = rng.choice(n_docs, n_candidates, p=weights / weights.sum())
+        else:
+            picks = rng.integers(n_docs, size=n_candidates)
+        candidates = dense(picks)
+        distances = np.minimum(closest, 2.0 - 2 * batch.dots(candidates))
+        best = int(np.argmin(distances.sum(axis=1)))
+        centers = np.vstack([centers, candidates[best]])
+        closest = distances[best]
+    return centers
+
+
+def _fit(texts, n_topics, n_features, batch_size, rng, progress):
+    """Centers, idf and per-bucket words fitted on some texts with mini-batch k-means."""
+    terms = np.full(n_features, None, dtype=object)
+    batches = [_Batch(texts[i:i + batch_size], n_features, terms) for i in range(0, len(texts), batch_size)]
+    # Document frequencies of the sample
+    doc_freq = np.zeros(n_features, dtype=np.int64)
+    n_docs = 0
+    for batch in batches:
+        doc_freq += np.bincount(batch.feature, minlength=n_features)
+        n_docs += len(batch.docs)
+    idf = (np.log((1.0 + n_docs) / (1.0 + doc_freq)) + 1.0).astype(np.float32)
+    batches = [b.weigh(idf) for b in batches if len(b.docs)]
+    if not batches:
+        return None, idf, terms
+
+    seed_batch = batches[0]
+    n_topics = min(n_topics, len(seed_batch.docs))
+    centers = _seed_centers(seed_batch, n_topics, n_features, rng)
+    seen = np.zeros(n_topics, dtype=np.float64)
+    steps = FIT_EPOCHS * len(batches)
+    for step in range(steps):
+        batch = batches[rng.integers(len(batches))] if step >= len(batches) else batches[step]
+        labels, cosine = _assign(batch, centers, np.linalg.norm(centers, axis=1))
+        sizes = np.bincount(labels, minlength=n_topics).astype(np.float64)
+        # Mini-batch update: each center moves to the running mean of everything assigned to it
+        seen += sizes
+        rate = np.divide(sizes, seen, out=np.zeros(n_topics), where=seen > 0)
+        centers *= (1.0 - rate)[:, None].astype(np.float32)
+        entry_labels = labels[batch.rows()]
+        np.add.at(centers, (entry_labels, batch.feature),
+                  batch.data / np.maximum(seen[entry_labels], 1.0).astype(np.float32))
+        # A center nothing was assigned to is moved onto the worst-fitted response
+        for empty in np.flatnonzero(seen == 0):
+            worst = int(np.argmin(cosine))
+            centers[empty] = 0.0
+            entries = batch.rows() == worst
+            centers[empty, batch.feature[entries]] = batch.data[entries]
+            cosine[worst] = 1.0
+        if progress is not None:
+            progress(0.5 * (step + 1) / steps, "Fitting topics")
+    return centers, idf, terms
+
+
+class ColumnTopics:
+    """Topic of every row of one text column, with the top words of each topic."""
+
+    def __init__(self, labels, similarity, terms):
+        self.labels = labels            # int16 per row; -1 unanswered or without content words
+        self.similarity = similarity    # cosine similarity of each row to its topic's center
+        self.terms = terms              # top words of each topic, largest topic first
+
+    @property
+    def n_topics(self):
+        return len(self.terms)
+
+    def names(self):
+        return [f"{i + 1}: {', '.join(words[:3])}" for i, words in enumerate(self.terms)]
+
+    def sizes(self, row_mask=None, weights=None):
+        """'Topic'/'Top Terms'/'Responses'/'Share' frame of the topics of the rows under `row_mask`."""
+        keep = self.labels >= 0 if row_mask is None else (self.labels >= 0) & row_mask
+        totals = np.bincount(self.labels[keep], weights=None if weights is None else weights[keep],
+                             minlength=self.n_topics)
+        share = totals / totals.sum() * 100 if totals.sum() else np.zeros(self.n_topics)
+        return pd.DataFrame({"Topic": self.names(), "Top Terms": [", ".join(words) for words in self.terms],
+                             "Responses": totals, "Share": share})
+
+    def examples(self, series, topic, row_mask=None, n=MAX_EXAMPLES):
+        """The `n` responses closest to a topic's center among the rows under `row_mask`."""
+        keep = self.labels == topic if row_mask is None else (self.labels == topic) & row_mask
+        rows = np.flatnonzero(keep)
+        rows = rows[np.argsort(-self.similarity[rows], kind="stable")[:n]]
+        return series.iloc[rows]
+
+
+class TopicCache:
+    """Topics of the columns clustered in this process, by content hash (least recently used dropped)."""
+
+    def __init__(self, max_entries=TOPIC_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            return self._entries.get(key)
+
+    def put(self, key, topics):
+        with self._lock:
+            self._entries[key] = topics
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+TOPIC_CACHE = TopicCache()
+
+
+def cluster_column(series, n_topics=DEFAULT_TOPICS, n_features=HASH_FEATURES, batch_size=BATCH_SIZE,
+                   fit_sample=FIT_SAMPLE, seed=0, progress=None, cache=TOPIC_CACHE):
+    """
+    ColumnTopics of a text column. Each distinct response is vectorized once;
+    `progress(fraction, message)` is called per batch.
+    """
+    series = series.reset_index(drop=True)
+    present = present_values(series)
+    positions = present.index.to_numpy(dtype=np.int64)
+    texts = present.astype(str).to_numpy(dtype=object)
+    hashes = response_hashes(texts)
+    digest = hashlib.sha256(positions.tobytes())
+    digest.update(hashes.tobytes())
+    # Every argument that changes the fitted centers is part of the key
+    key = (digest.hexdigest(), len(series), n_topics, n_features, batch_size, fit_sample, seed)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    labels = np.full(len(series), -1, dtype=np.int16)
+    similarity = np.zeros(len(series), dtype=np.float32)
+    codes, uniques = pd.factorize(hashes)
+    first = np.unique(codes, return_index=True)[1]
+    unique_texts = texts[first]
+    rng = np.random.default_rng(seed)
+    sample = np.arange(len(unique_texts))
+    if len(sample) > fit_sample:
+        sample = np.sort(rng.choice(sample, fit_sample, replace=False))
+    centers, idf, terms = _fit(unique_texts[sample], n_topics, n_features, batch_size, rng, progress)
+    if centers is None:
+        topics = ColumnTopics(labels, similarity, [])
+    else:
+        # Stream every distinct response through the fitted centers
+        center_norms = np.linalg.norm(centers, axis=1)
+        unique_labels = np.full(len(unique_texts), -1, dtype=np.int16)
+        unique_similarity = np.zeros(len(unique_texts), dtype=np.float32)
+        for start in range(0, len(unique_texts), batch_size):
+            batch = _Batch(unique_texts[start:start + batch_size], n_features).weigh(idf)
+            if len(batch.docs):
+                batch_labels, cosine = _assign(batch, centers, center_norms)
+                unique_labels[start + batch.docs] = batch_labels
+                unique_similarity[start + batch.docs] = cosine
+            if progress is not None:
+                progress(0.5 + 0.5 * min(start + batch_size, len(unique_texts)) / len(unique_texts),
+                         "Assigning responses")
+        # Topics are numbered from the largest; empty ones are dropped
+        counts = np.bincount(unique_labels[unique_labels >= 0], minlength=len(centers))
+        order = [t for t in np.argsort(-counts, kind="stable") if counts[t] > 0]
+        renumber = np.full(len(centers) + 1, -1, dtype=np.int16)
+        renumber[order] = np.arange(len(order))
+        row_labels = renumber[unique_labels[codes]]    # -1 indexes the trailing "-1" slot
+        labels[positions] = row_labels
+        similarity[positions] = unique_similarity[codes]
+        top = [np.argsort(-centers[t])[:TOP_TERMS * 2] for t in order]
+        words = [[terms[f] for f in features if terms[f] is not None and centers[t, f] > 0][:TOP_TERMS]
+                 for t, features in zip(order, top)]
+        topics = ColumnTopics(labels, similarity, words)
+    if cache is not None:
+        cache.put(key, topics)
+    return topics
@@ -0,0 +1,356 @@
+# waves.py
+# Wave-over-wave comparison for a survey that is run repeatedly.
+#
+# Each cleaned wave is reduced once to small per-column aggregates (category
+# counts, Likert scale counts, multi-select option counts, numeric moments
+# and quantiles) that can be saved as a JSON "wave file". Comparisons align
+# the columns of several waves by header and only read those aggregates, so
+# comparing twelve waves costs about as much as rendering one.
+#
+# Significance flags come from the count vectors (chi-square test of
+# homogeneity, two-proportion z-tests) or the stored moments (Welch's t-test);
+# p-values are computed with math.erfc / math.lgamma, so scipy is not needed.
+# Aggregates are unweighted: the tests assume counts of respondents.
+import json
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+import likert
+from aggregates import present_values
+from multiselect import column_delimiter, option_frequencies
+from numeric_summary import summarize_column
+
+WAVE_FORMAT_VERSION = 1
+# p-value below which a change is flagged as significant
+SIGNIFICANCE_LEVEL = 0.05
+# Categories stored per column; rarer ones are pooled into OTHER_LABEL
+MAX_WAVE_CATEGORIES = 50
+OTHER_LABEL = "(other)"
+
+_DISTRIBUTION_TYPES = ("Categorical", "Binary")
+
+
+def header_key(col):
+    """Alignment key of a column header: case and spacing differences are ignored."""
+    return " ".join(str(col).split()).casefold()
+
+
+# --- Building and storing wave aggregates ---
+
+def _top_counts(counts):
+    """{label: count} of the most common categories, the rest pooled."""
+    counts = counts.sort_values(ascending=False)
+    top = {str(k): float(v) for k, v in counts.iloc[:MAX_WAVE_CATEGORIES].items()}
+    rest = float(counts.iloc[MAX_WAVE_CATEGORIES:].sum())
+    if rest:
+        top[OTHER_LABEL] = top.get(OTHER_LABEL, 0.0) + rest
+    return top
+
+
+def _column_aggregate(series, q_type, delimiter=None):
+    present = present_values(series)
+    aggregate = {"type": q_type, "n": int(len(present))}
+    if q_type in _DISTRIBUTION_TYPES:
+        aggregate["counts"] = _top_counts(present.astype(str).value_counts())
+    elif q_type == "Likert Scale":
+        encoding = likert.encode_likert(series)
+        aggregate.update(labels=list(encoding.labels), values=encoding.values.tolist(), kind=encoding.kind,
+                         counts=likert.score_counts(encoding).tolist())
+    elif q_type == "Multi-Select":
+        freq = option_frequencies(series, delimiter or column_delimiter(series))
+        aggregate["counts"] = {str(o): float(c) for o, c in zip(freq["Option"], freq["Count"])}
+    elif q_type == "Numeric":
+        values = pd.to_numeric(present, errors="coerce").dropna().to_numpy(dtype=np.float64)
+        summary = summarize_column(series).overall
+        aggregate.update(
+            n=int(len(values)),
+            mean=float(values.mean()) if len(values) else None,
+            var=float(values.var(ddof=1)) if len(values) > 1 else None,
+            median=float(summary.median) if len(values) else None,
+            p90=float(summary.p90) if len(values) else None,
+        )
+    return aggregate
+
+
+def build_wave(cleaned_df, category_df, name, delimiters=None):
+    """
+    Per-column aggregates of one cleaned wave (a JSON-serializable dict).
+    `delimiters` are the multi-select delimiters found while cleaning, if any.
+    """
+    types = dict(zip(category_df["Column Name"], category_df["Inferred Type"]))
+    delimiters = delimiters or {}
+    return {
+        "version": WAVE_FORMAT_VERSION,
+        "name": str(name),
+        "created_at": time.time(),
+        "n_rows": int(len(cleaned_df)),
+        "columns": {str(col): _column_aggregate(cleaned_df[col], types[col], delimiters.get(col))
+                    for col in cleaned_df.columns if col in types},
+    }
+
+
+def dump_wave(wave):
+    """Wave aggregates as JSON bytes (the downloadable wave file)."""
+    return json.dumps(wave).encode("utf-8")
+
+
+def load_wave(data):
+    """Reads a wave file written by dump_wave(); raises ValueError if it is not one."""
+    try:
+        wave = json.loads(data)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Not a wave file: {e}") from e
+    if not isinstance(wave, dict) or "columns" not in wave:
+        raise ValueError("Not a wave file: no column aggregates found.")
+    if wave.get("version") != WAVE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported wave file version: {wave.get('version')!r}")
+    return wave
+
+
+# --- p-values (stdlib only) ---
+
+def _normal_two_sided(z):
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def _gamma_q(a, x):
+    """Regularized upper incomplete gamma Q(a, x) (series / continued fraction)."""
+    if x <= 0:
+        return 1.0
+    log_prefix = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        term = total = 1.0 / a
+        n = a
+        for _ in range(1000):
+            n += 1
+            term *= x / n
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+        return max(0.0, 1.0 - total * math.exp(log_prefix))
+    b = x + 1 - a
+    c, d = 1e300, 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = 1e-300 if abs(d) < 1e-300 else d
+        c = b + an / c
+        c = 1e-300 if abs(c) < 1e-300 else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return min(1.0, math.exp(log_prefix) * h)
+
+
+def _beta_i(a, b, x):
+    """Regularized incomplete beta I_x(a, b) (continued fraction)."""
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    log_front = math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log1p(-x)
+    if x > (a + 1) / (a + b + 2):
+        return 1.0 - _beta_i(b, a, 1 - x)
+    c, d = 1.0, 1 - (a + b) * x / (a + 1)
+    d = 1 / (1e-300 if abs(d) < 1e-300 else d)
+    h = d
+    for m in range(1, 1000):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1 + numerator * d
+            d = 1 / (1e-300 if abs(d) < 1e-300 else d)
+            c = 1 + numerator / c
+            c = 1e-300 if abs(c) < 1e-300 else c
+            h *= d * c
+        if abs(d * c - 1) < 1e-15:
+            break
+    return math.exp(log_front) * h / a
+
+
+def chi_square_test(counts):
+    """
+    Chi-square test of homogeneity for a (waves x categories) count matrix.
+    Returns (statistic, degrees of freedom, p-value); p is NaN when untestable.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    counts = counts[counts.sum(axis=1) > 0][:, counts.sum(axis=0) > 0]
+    if counts.shape[0] < 2 or counts.shape[1] < 2:
+        return float("nan"), 0, float("nan")
+    expected = counts.sum(axis=1, keepdims=True) * counts.sum(axis=0, keepdims=True) / counts.sum()
+    statistic = float(((counts - expected) ** 2 / expected).sum())
+    dof = (counts.shape[0] - 1) * (counts.shape[1] - 1)
+    return statistic, dof, _gamma_q(dof / 2, statistic / 2)
+
+
+def proportion_test(count_a, n_a, count_b, n_b):
+    """Two-sided p-value of the two-proportion z-test (pooled variance)."""
+    if n_a <= 0 or n_b <= 0:
+        return float("nan")
+    pooled = (count_a + count_b) / (n_a + n_b)
+    se = math.sqrt(pooled * (1 - pooled) * (1 / n_a + 1 / n_b))
+    if se == 0:
+        return 1.0
+    return _normal_two_sided((count_b / n_b - count_a / n_a) / se)
+
+
+def welch_test(mean_a, var_a, n_a, mean_b, var_b, n_b):
+    """Two-sided p-value of Welch's t-test from summary statistics."""
+    if None in (mean_a, var_a, mean_b, var_b) or n_a < 2 or n_b < 2:
+        return float("nan")
+    se2_a, se2_b = var_a / n_a, var_b / n_b
+    if se2_a + se2_b == 0:
+        return 1.0 if mean_a == mean_b else 0.0
+    t = (mean_b - mean_a) / math.sqrt(se2_a + se2_b)
+    dof = (se2_a + se2_b) ** 2 / (se2_a ** 2 / (n_a - 1) + se2_b ** 2 / (n_b - 1))
+    return _beta_i(dof / 2, 0.5, dof / (dof + t * t))
+
+
+# --- Aligning and comparing waves ---
+
+def _column(wave, key):
+    for col, aggregate in wave["columns"].items():
+        if header_key(col) == key:
+            return col, aggregate
+    return None, None
+
+
+def align_columns(waves):
+    """
+    'Column'/'Key'/'Type'/'Waves' frame of the columns found (by header, with
+    the same type as in the latest wave) in at least two waves.
+    """
+    latest = {}
+    for wave in waves:
+        for col, aggregate in wave["columns"].items():
+            latest[header_key(col)] = (col, aggregate["type"])
+    rows = []
+    for key, (col, q_type) in latest.items():
+        present = sum(1 for wave in waves if (_column(wave, key)[1] or {}).get("type") == q_type)
+        if present >= 2:
+            rows.append({"Column": col, "Key": key, "Type": q_type, "Waves": present})
+    return pd.DataFrame(rows, columns=["Column", "Key", "Type", "Waves"])
+
+
+def _waves_with(waves, key, q_type):
+    """(wave name, aggregate) of the waves holding the column with that type, in order."""
+    found = []
+    for wave in waves:
+        aggregate = _column(wave, key)[1]
+        if aggregate is not None and aggregate["type"] == q_type:
+            found.append((wave["name"], aggregate))
+    return found
+
+
+def _significant(p):
+    return bool(p < SIGNIFICANCE_LEVEL) if not np.isnan(p) else False
+
+
+def compare_distribution(waves, key, q_type):
+    """
+    Shares of every category (or multi-select option) per wave, the change of
+    the latest wave against the previous one in points, and its p-value.
+    Returns (frame, omnibus chi-square p-value; NaN for multi-select).
+    """
+    found = _waves_with(waves, key, q_type)
+    names = [name for name, _ in found]
+    labels = list(dict.fromkeys(label for _, aggregate in found for label in aggregate["counts"]))
+    counts = np.array([[aggregate["counts"].get(label, 0.0) for label in labels] for _, aggregate in found])
+    # Options of a multi-select are shares of respondents, not of answers
+    bases = np.array([aggregate["n"] if q_type == "Multi-Select" else sum(aggregate["counts"].values())
+                      for _, aggregate in found], dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shares = counts / bases[:, None] * 100
+    frame = pd.DataFrame(shares.T, columns=names)
+    frame.insert(0, "Category", labels)
+    frame["Δ pts"] = shares[-1] - shares[-2]
+    p_values = [proportion_test(counts[-2, j], bases[-2], counts[-1, j], bases[-1]) for j in range(len(labels))]
+    frame["p-value"] = p_values
+    frame["Significant"] = [_significant(p) for p in p_values]
+    omnibus = float("nan") if q_type == "Multi-Select" else chi_square_test(counts)[2]
+    return frame, omnibus
+
+
+def _likert_counts(aggregate, labels):
+    by_label = {str(l).casefold(): c for l, c in zip(aggregate["labels"], aggregate["counts"])}
+    return np.array([by_label.get(str(l).casefold(), 0.0) for l in labels])
+
+
+def compare_likert(waves, key):
+    """Mean score, top-2 box and net score per wave, with the change in mean against the previous wave."""
+    found = _waves_with(waves, key, "Likert Scale")
+    latest = found[-1][1]
+    labels, values = latest["labels"], np.asarray(latest["values"], dtype=np.float64)
+    scale = likert.LikertEncoding(None, labels, values, latest["kind"])
+    rows, previous = [], None
+    for name, aggregate in found:
+        counts = _likert_counts(aggregate, labels)
+        metrics = {k: float(v) for k, v in likert.likert_metrics(counts, scale).items()}
+        n = counts.sum()
+        var = float((counts * (values - metrics["Mean Score"]) ** 2).sum() / (n - 1)) if n > 1 else None
+        row = {"Wave": name, **metrics, "Δ Mean": float("nan"), "p-value": float("nan")}
+        if previous is not None:
+            row["Δ Mean"] = metrics["Mean Score"] - previous[0]
+            row["p-value"] = welch_test(previous[0], previous[1], previous[2], metrics["Mean Score"], var, n)
+        row["Significant"] = _significant(row["p-value"])
+        rows.append(row)
+        previous = (metrics["Mean Score"], var, n)
+    return pd.DataFrame(rows)
+
+
+def compare_numeric(waves, key):
+    """Mean, median and P90 per wave, with the change in mean against the previous wave."""
+    rows, previous = [], None
+    for name, aggregate in _waves_with(waves, key, "Numeric"):
+        row = {"Wave": name, "Responses": aggregate["n"], "Mean": aggregate["mean"],
+               "Median": aggregate["median"], "P90": aggregate["p90"],
+               "Δ Mean": float("nan"), "p-value": float("nan")}
+        if previous is not None and previous["mean"] is not None and aggregate["mean"] is not None:
+            row["Δ Mean"] = aggregate["mean"] - previous["mean"]
+            row["p-value"] = welch_test(previous["mean"], previous["var"], previous["n"],
+                                        aggregate["mean"], aggregate["var"], aggregate["n"])
+        row["Significant"] = _significant(row["p-value"])
+        rows.append(row)
+        previous = aggregate
+    return pd.DataFrame(rows).astype({"Mean": float, "Median": float, "P90": float})
+
+
+def compare_column(waves, key, q_type):
+    """
+    Comparison frame of one aligned column plus the p-value of its change
+    (omnibus chi-square for distributions, latest vs previous otherwise).
+    """
+    if q_type in _DISTRIBUTION_TYPES or q_type == "Multi-Select":
+        frame, omnibus = compare_distribution(waves, key, q_type)
+        if np.isnan(omnibus) and len(frame):
+            omnibus = float(np.nanmin(frame["p-value"])) if frame["p-value"].notna().any() else omnibus
+        return frame, omnibus
+    if q_type == "Likert Scale":
+        frame = compare_likert(waves, key)
+    elif q_type == "Numeric":
+        frame = compare_numeric(waves, key)
+    else:
+        return None, float("nan")
+    return frame, float(frame["p-value"].iloc[-1])
+
+
+def comparison_summary(waves):
+    """One row per aligned column: its test, p-value and whether it changed significantly."""
+    tests = {"Categorical": "Chi-square (all waves)", "Binary": "Chi-square (all waves)",
+             "Multi-Select": "Smallest option z-test (latest vs previous)",
+             "Likert Scale": "Welch t on mean score (latest vs previous)",
+             "Numeric": "Welch t on mean (latest vs previous)"}
+    rows = []
+    for _, column in align_columns(waves).iterrows():
+        if column["Type"] not in tests:
+            continue
+        _, p = compare_column(waves, column["Key"], column["Type"])
+        rows.append({"Column": column["Column"], "Type": column["Type"], "Waves": column["Waves"],
+                     "Test": tests[column["Type"]], "p-value": p, "Significant": _significant(p)})
+    return pd.DataFrame(rows, columns=["Column", "Type", "Waves", "Test", "p-value", "Significant"])
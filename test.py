@@ -1,10 +1,259 @@
 import data_clean as data_cleaner
 import pandas as pd
+from normalize import cluster_values
+import likert
+from multiselect import column_delimiter, option_frequencies
+import numpy as np
+import aggregates
+import sql_store
+from shared_store import MappedFrame, SharedDatasetStore, frame_from_table, frame_to_table
+import gc
+import os
+import tempfile
+import threading
+import time
+from jobs import Job
+from memory_governor import MemoryBudgetExceeded, MemoryGovernor
+from redact import header_kind
+from detector_registry import Detector, DetectorRegistry
+from sentiment import score_column, score_texts
+from text_index import TextIndex
+from topics import TopicCache, cluster_column
 
 def test_process_and_analyze_data():
     df = pd.read_excel("Copy of Post Trip Survey Results - MW.xlsx")
     cleaned_df, category_df = data_cleaner.process_and_analyze_data(df.copy())
     print(category_df)
 
+def test_normalize_keeps_opposite_answers_apart():
+    # Opposite Likert answers one word apart must never be merged
+    for common, variant in [("Strongly agree", "Strongly disagree"),
+                            ("Very satisfied", "Very unsatisfied"),
+                            ("Very satisfied", "Very dissatisfied"),
+                            ("Very likely", "Very unlikely")]:
+        mapped = cluster_values([common, variant], [100, 10])
+        assert list(mapped) == [common, variant], (common, variant, mapped)
+    mapped = cluster_values(["Very satisfied", "Very unsatisfied", "Very dissatisfied"], [100, 10, 10])
+    assert "Very satisfied" not in mapped[1:]
+
+def test_normalize_merges_spelling_variants():
+    mapped = cluster_values(["Yes", "yes ", "Y", "Yess", "No", "no"], [100, 5, 3, 2, 80, 4])
+    assert list(mapped) == ["Yes"] * 4 + ["No"] * 2
+    mapped = cluster_values(["New York", "new york, NY", "Boston"], [10, 10, 5])
+    assert list(mapped) == ["New York", "New York", "Boston"]
+
+def test_normalize_keeps_short_answers_apart():
+    # "Mrs" is not a misspelling of "Mr"; only case and punctuation variants merge
+    assert list(cluster_values(["Mr", "Ms", "Mrs"], [100, 10, 10])) == ["Mr", "Ms", "Mrs"]
+    assert list(cluster_values(["Mr", "mr.", "Mrs"], [100, 5, 10])) == ["Mr", "Mr", "Mrs"]
+
+def test_normalize_leaves_ids_and_comments_as_typed():
+    rows = 60
+    df = pd.DataFrame({
+        "Respondent ID": [f"ab{i:03d}" for i in range(rows - 1)] + ["AB000"],
+        "Subscribed": (["Yes", "No", "yes"] * rows)[:rows],
+    })
+    artifacts = {}
+    cleaned_df, category_df = data_cleaner.process_and_analyze_data(df.copy(), artifacts)
+    assert cleaned_df["Respondent ID"].iloc[-1] == "AB000"
+    assert set(artifacts["normalization_map"]["Column Name"]) == {"Subscribed"}
+    types = dict(zip(category_df["Column Name"], category_df["Inferred Type"]))
+    assert types["Subscribed"] == "Binary"
+
+def test_likert_numeric_scale_keeps_unanswered_points():
+    encoding = likert.encode_likert(pd.Series([1, 2, 3, 4], name="Satisfaction"))
+    assert encoding.labels == ["1", "2", "3", "4", "5"]
+    assert not encoding.is_nps
+    sides = likert.distribution_frame(likert.score_counts(encoding), encoding)["Side"].tolist()
+    assert sides[2] == "neutral"
+
+    assert not likert.encode_likert(pd.Series(range(1, 11), name="Rating")).is_nps
+    assert likert.encode_likert(pd.Series([0, 5, 10], name="Rating")).is_nps
+    assert likert.encode_likert(pd.Series([3, 9, 10], name="How likely are you to recommend us?")).is_nps
+
+def test_multiselect_subset_keeps_column_delimiter():
+    answers = pd.Series(["Email; Phone", "Email", "Phone; SMS", "SMS; Email", "Phone"] * 20)
+    delimiter = column_delimiter(answers)
+    assert delimiter == ";"
+    freq = option_frequencies(answers.iloc[:1], delimiter)
+    assert sorted(freq["Option"]) == ["Email", "Phone"]
+
+def _mixed_frame():
+    df = pd.DataFrame({"Color": ["red", "blue", None, "red", "green", "blue", "red"],
+                       "Score": [1.5, 2, np.nan, 4, 5, 6, 7],
+                       "When": pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-02", None,
+                                               "2024-01-05", "2024-01-05", "2024-01-06"]),
+                       "Note": ["a", None, "b", 3, "d", "e", "f"]},
+                      index=[0, 2, 3, 5, 8, 9, 11])
+    df["Sparse"] = pd.Series([np.nan] * 6 + [2.0], index=df.index).astype(pd.SparseDtype("float64", np.nan))
+    category_df = pd.DataFrame({"Column Name": list(df.columns),
+                                "Inferred Type": ["Categorical", "Numeric", "Datetime", "Free Text", "Numeric"]})
+    return df, category_df
+
+def test_sql_store_loads_in_chunks():
+    df, category_df = _mixed_frame()
+    chunk_rows = sql_store.SQL_LOAD_CHUNK_ROWS
+    sql_store.SQL_LOAD_CHUNK_ROWS = 3
+    try:
+        store = sql_store.SurveyStore().load(df, category_df, "When")
+    finally:
+        sql_store.SQL_LOAD_CHUNK_ROWS = chunk_rows
+    assert store.row_count() == len(df)
+    assert store.value_counts("Color").equals(aggregates.value_counts_frame(df["Color"]))
+    assert store.time_counts("When")["Count"].tolist() == [1, 2, 2, 1]
+
+def test_mapped_frame_reads_columns_back():
+    df, _ = _mixed_frame()
+    mapped = MappedFrame.write(df)
+    assert len(mapped) == len(df) and list(mapped.columns) == list(df.columns)
+    for col in ["Color", "Score", "When", "Sparse"]:
+        assert mapped[col].equals(df[col]), col
+    assert mapped["Note"].fillna("-").tolist() == ["a", "-", "b", "3", "d", "e", "f"]
+    assert [len(chunk) for chunk in mapped.iter_chunks(3)] == [3, 3, 1]
+    assert mapped.head(2).index.tolist() == [0, 2]
+
+def test_shared_store_table_round_trip():
+    df, _ = _mixed_frame()
+    restored, meta = frame_from_table(frame_to_table(df, {"source": "test"}))
+    assert meta["source"] == "test" and meta["sparse_columns"] == ["Sparse"]
+    df = df.reset_index(drop=True)
+    for col in ["Color", "Score", "When", "Sparse"]:
+        assert restored[col].equals(df[col]), col
+    # Mixed numbers and text come back as text
+    assert restored["Note"].fillna("-").tolist() == ["a", "-", "b", "3", "d", "e", "f"]
+    selected, _ = frame_from_table(frame_to_table(df, {}).select(["Color"]))
+    assert list(selected.columns) == ["Color"]
+
+def test_shared_store_evicts_only_unleased_datasets():
+    df, category_df = _mixed_frame()
+    store = SharedDatasetStore(tempfile.mkdtemp(), idle_seconds=0)
+    held = store.publish("held", df, category_df)
+    store.publish("dropped", df, category_df).release()
+    store.evict_idle(now=time.time() + 60)
+    assert store.stats()["Dataset"].tolist() == ["held"]
+    assert os.path.exists(store._path("held")) and not os.path.exists(store._path("dropped"))
+    held.release()
+
+def test_shared_store_lease_released_when_collected():
+    df, category_df = _mixed_frame()
+    store = SharedDatasetStore(tempfile.mkdtemp())
+    lease = store.publish("survey", df, category_df)
+    second = store.attach("survey")
+    assert store.stats()["Leases"].tolist() == [2]
+    del lease
+    gc.collect()
+    assert store.stats()["Leases"].tolist() == [1] and not second.released
+    second.release()
+    assert store.stats()["Leases"].tolist() == [0]
+
+class _SlowGovernor(MemoryGovernor):
+    """Widens the gap between measuring free memory and reserving it."""
+
+    def available(self):
+        room = super().available()
+        time.sleep(0.005)
+        return room
+
+def test_memory_governor_admits_concurrent_uploads_within_budget():
+    governor = _SlowGovernor(budget=100, spill_dir=tempfile.mkdtemp())
+    jobs = [Job(i, f"upload{i}.csv") for i in range(8)]
+    start = threading.Barrier(len(jobs))
+    admitted, rejected = [], []
+
+    def upload(job):
+        start.wait()
+        try:
+            governor.admit(job, 30, timeout=0.2, poll=0.01)
+            admitted.append(job.id)
+        except MemoryBudgetExceeded:
+            rejected.append(job.id)
+
+    threads = [threading.Thread(target=upload, args=(job,)) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(admitted) == 3 and len(rejected) == 5
+    assert governor.used() == 90
+
+def test_memory_governor_spills_a_session_once():
+    governor = MemoryGovernor(budget=2 ** 30, spill_dir=tempfile.mkdtemp())
+    job = Job(1, "survey.csv")
+    df, _ = _mixed_frame()
+    job.result = {"df": df.head(2), "cleaned_df": df, "artifacts": {}}
+    governor.register(job, job.result)
+    freed = []
+    threads = [threading.Thread(target=lambda: freed.append(governor.spill(job))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(f > 0 for f in freed) == 1 and job.result["cleaned_df"] is None
+    assert governor.touch(job)["cleaned_df"]["Score"].equals(df["Score"])
+
+def test_redact_name_headers_are_person_names_only():
+    for header in ["Name", "First name", "last_name", "Full Name", "What is your name?", "Surname"]:
+        assert header_kind(header) == "NAME", header
+    for header in ["Trip name", "Product name", "Company name", "Event name", "Which hotel did you stay at (name)?"]:
+        assert header_kind(header) is None, header
+
+def test_detectors_skip_columns_of_other_kinds():
+    calls = []
+
+    def text_only(series, col, profile):
+        calls.append(col)
+        return False
+
+    registry = DetectorRegistry([
+        Detector("numeric", "Numeric", lambda s, c, p: pd.api.types.is_numeric_dtype(s), priority=80, cost=0.0),
+        Detector("text_only", "Multi-Select", text_only, priority=40, cost=5.0, kinds=("text",)),
+    ], load_plugins=False)
+    assert registry.detect(pd.Series([1, 2, 3]), "Score", None) == "Numeric"
+    assert registry.detect(pd.Series(["a", "b"]), "Plan", None) == "Other"
+    assert calls == ["Plan"]
+
+def test_sentiment_negation_flips_the_score():
+    negated, plain, base_form = score_texts(pd.Series(["not good", "good", "We didn't like it"]))
+    assert negated < 0 < plain
+    assert base_form < 0
+
+def test_sentiment_index_and_text_scores_agree():
+    s = pd.Series(["Great staff, not helpful at the desk.", None, "Awful wait but friendly crew",
+                   "I don't hate it", "Great staff, not helpful at the desk.", "fine"])
+    by_text = score_column(s, cache=None).scores
+    by_index = score_column(s, TextIndex(s), cache=None).scores
+    assert np.isnan(by_text[1]) and np.allclose(by_text, by_index, equal_nan=True)
+
+def test_topics_separate_two_groups_of_comments():
+    shuttle = ["The shuttle bus was late again", "Bus driver late, shuttle slow",
+               "Shuttle bus late at the airport", "late bus, shuttle driver rude",
+               "Shuttle bus never came, so late"]
+    breakfast = ["Breakfast coffee was cold", "Cold coffee at breakfast buffet",
+                 "Breakfast buffet coffee cold and stale", "coffee cold, breakfast eggs cold"]
+    # Topics are numbered by distinct responses: five about the shuttle, four about breakfast
+    s = pd.Series(shuttle * 2 + breakfast * 2 + [None])
+    cache = TopicCache()
+    topics = cluster_column(s, 2, seed=0, cache=cache)
+    assert topics.n_topics == 2
+    assert set(topics.terms[0][:3]) == {"late", "bus", "shuttle"}
+    assert set(topics.terms[1][:3]) == {"cold", "coffee", "breakfast"}
+    assert topics.labels.tolist() == [0] * 10 + [1] * 8 + [-1]
+    # A second call is served from the cache; another seed is fitted again
+    assert cluster_column(s, 2, seed=0, cache=cache) is topics
+    assert cluster_column(s, 2, seed=1, cache=cache) is not topics
+    assert cluster_column(s, 2, seed=0, cache=None).labels.tolist() == topics.labels.tolist()
+
+def test_unique_count_is_exact_for_small_columns():
+    s = pd.Series(["a", "b", "a", None, "c"])
+    assert data_cleaner.unique_count(s) == (3, None)
+    exact_max = data_cleaner.EXACT_DISTINCT_MAX_ROWS
+    data_cleaner.EXACT_DISTINCT_MAX_ROWS = 100
+    try:
+        count, bound = data_cleaner.unique_count(pd.Series(np.arange(5000)))
+    finally:
+        data_cleaner.EXACT_DISTINCT_MAX_ROWS = exact_max
+    assert bound > 0 and abs(count - 5000) <= bound
+
 if __name__ == "__main__":
-    test_process_and_analyze_data()
\ No newline at end of file
+    test_process_and_analyze_data()
+